@@ -0,0 +1,133 @@
+"""
+Запросы бота к каталогу в памяти (`src.catalogue.CatalogueIndex`)
+против прохода по списку `ShowModel`: случайный фильм/сериал и худшие K
+под фильтры по жанру, типу, `rating_count` и рейтингу.
+Плюс время сборки индекса из снимка `common.snapshot` и применения
+пачки изменений.\n
+Запуск из `services/bot_service`:
+`python -m bench.catalogue_bench --count 100000`
+"""
+
+import argparse
+import random
+import tempfile
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from common.show_models import ShowModel, ShowType
+from common.snapshot import Snapshot, write_snapshot
+from common.timer import Timer
+from src.catalogue import CatalogueIndex
+
+
+GENRES = [
+    "драма",
+    "комедия",
+    "ужасы",
+    "боевик",
+    "триллер",
+    "мелодрама",
+    "фэнтези",
+    "документальный",
+    "аниме",
+    "вестерн",
+]
+
+QUERIES: Dict[str, Dict] = {
+    "any": {},
+    "genre": {"genre": "ужасы"},
+    "genre+type+votes>=1000": {
+        "genre": "ужасы",
+        "show_type": ShowType.FILM,
+        "min_rating_count": 1000,
+    },
+    "rating<=4 votes>=5000": {"max_rating": 4.0, "min_rating_count": 5000},
+    "rare: вестерн votes>=100000": {"genre": "вестерн", "min_rating_count": 100000},
+}
+
+
+def make_shows(count: int, rng: random.Random) -> List[ShowModel]:
+    return [
+        ShowModel.model_validate(
+            {
+                "id": i,
+                "type": rng.choice(("film", "series")),
+                "title": f"Фильм {i}",
+                "rating": round(rng.uniform(1, 10), 1),
+                # Как у реальных оценок: много малоизвестных, немного популярных
+                "rating_count": int(rng.paretovariate(0.8) * 100),
+                "description": "Описание фильма",
+                "genres": rng.sample(GENRES, rng.randint(1, 3)),
+            }
+        )
+        for i in range(count)
+    ]
+
+
+def scan_pick(
+    shows: List[ShowModel],
+    rng: random.Random,
+    genre=None,
+    show_type=None,
+    min_rating_count=0,
+    max_rating=None,
+):
+    found = [
+        show
+        for show in shows
+        if (genre is None or genre in show.details.genres)
+        and (show_type is None or show.identifier.type == show_type)
+        and show.details.rating_count >= min_rating_count
+        and (max_rating is None or show.details.rating <= max_rating)
+    ]
+    return rng.choice(found) if found else None
+
+
+def latency_us(func: Callable[[], object], repeat: int) -> tuple[float, float]:
+    times = []
+    for _ in range(repeat):
+        timer = Timer()
+        func()
+        times.append(timer.elapsed * 1e6)
+    times.sort()
+    return times[len(times) // 2], times[min(len(times) - 1, int(len(times) * 0.99))]
+
+
+def main(count: int, repeat: int) -> None:
+    rng = random.Random(0)
+    shows = make_shows(count, rng)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "catalogue.snap"
+        write_snapshot(path, shows)
+        timer = Timer()
+        with Snapshot(path) as snapshot:
+            index = CatalogueIndex.from_snapshot(snapshot)
+        print(f"build from snapshot: {timer.elapsed * 1000:.0f} ms, {len(index)} shows")
+
+    changes = rng.sample(shows, 1000)
+    timer = Timer()
+    index.merged(changes)
+    print(f"merge 1000 changes:  {timer.elapsed * 1000:.0f} ms")
+
+    print(
+        f"{'query':<30} {'matches':>8} {'pick p50/p99 us':>18} "
+        f"{'top10 p50/p99 us':>18} {'scan p50 us':>12}"
+    )
+    for name, query in QUERIES.items():
+        matches = index.count(**query)
+        pick = latency_us(lambda: index.pick(rng, **query), repeat)
+        top = latency_us(lambda: index.top(10, **query), repeat)
+        scan = latency_us(lambda: scan_pick(shows, rng, **query), max(3, repeat // 50))
+        print(
+            f"{name:<30} {matches:>8} {pick[0]:>8.1f}/{pick[1]:<9.1f} "
+            f"{top[0]:>8.1f}/{top[1]:<9.1f} {scan[0]:>12.0f}"
+        )
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--count", type=int, default=100_000)
+    arg_parser.add_argument("--repeat", type=int, default=1000)
+    args = arg_parser.parse_args()
+
+    main(args.count, args.repeat)
@@ -0,0 +1,427 @@
+import random
+from aiohttp import ClientSession, ClientTimeout
+from array import array
+from asyncio import sleep, to_thread
+from bisect import bisect_left, bisect_right
+from pathlib import Path
+from pydantic import BaseModel, TypeAdapter
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from common.logger import Logger
+from common.show_models import ShowIdentifier, ShowModel, ShowType
+from common.snapshot import Snapshot, save_snapshot
+from common.timer import Timer
+
+
+SHOW_TYPES = tuple(ShowType)
+
+# Пороги `rating_count` с готовыми битовыми масками: 0 и степени двойки
+COUNT_THRESHOLDS = (0,) + tuple(1 << power for power in range(31))
+
+# Запас при запросе изменений: загрузка в db_service, начатая раньше
+# прошлой выборки и завершенная позже, иначе была бы пропущена
+CHANGES_OVERLAP = 60.0
+
+# Попытки случайного выбора по маске ближайшего порога `rating_count`
+# до точного подсчета
+PICK_ATTEMPTS = 16
+
+
+class CatalogueEntry(BaseModel):
+    identifier: ShowIdentifier
+    title: str
+    rating: float
+    rating_count: int
+    genres: List[str]
+
+
+class ChangesResponse(BaseModel):
+    until: float
+    shows: List[ShowModel]
+
+
+CHANGES_ADAPTER = TypeAdapter(ChangesResponse)
+
+
+logger = Logger("Catalogue")
+
+
+def show_key(show_id: int, type_code: int) -> int:
+    # int вместо (ShowType, id): хеш Enum считается в Python
+    return show_id * len(SHOW_TYPES) + type_code
+
+
+def bitmap(positions: Iterable[int], size: int) -> int:
+    """
+    Битовая маска (int) с установленными битами `positions`
+    """
+    data = bytearray((size + 7) // 8)
+    for position in positions:
+        data[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(data, "little")
+
+
+def iter_bits(mask: int, reverse: bool = False) -> Iterator[int]:
+    """
+    Позиции установленных бит по возрастанию (или убыванию):
+    пустые 64-битные слова пропускаются без операций над всей маской
+    """
+    size = (mask.bit_length() + 63) // 64
+    words = memoryview(mask.to_bytes(size * 8, "little")).cast("Q")
+    for i in reversed(range(size)) if reverse else range(size):
+        word = words[i]
+        if reverse:
+            while word:
+                top = word.bit_length() - 1
+                yield i * 64 + top
+                word ^= 1 << top
+        else:
+            while word:
+                low = word & -word
+                yield i * 64 + low.bit_length() - 1
+                word ^= low
+
+
+def nth_bit(mask: int, n: int) -> int:
+    """
+    Позиция `n`-го (с нуля) установленного бита: подсчет единиц
+    блоками по 1 КиБ, затем словами по 8 байт
+    """
+    data = memoryview(mask.to_bytes((mask.bit_length() + 7) // 8, "little"))
+    start = 0
+    for size in (1024, 8):
+        while True:
+            ones = int.from_bytes(data[start : start + size], "little").bit_count()
+            if n < ones:
+                break
+            n -= ones
+            start += size
+        data = data[: start + size]
+    word = int.from_bytes(data[start : start + 8], "little")
+    for _ in range(n):
+        word &= word - 1
+    return start * 8 + (word & -word).bit_length() - 1
+
+
+class CatalogueIndex:
+    """
+    Неизменяемый индекс каталога в памяти бота. Фильмы/сериалы
+    упорядочены по рейтингу (от худших, при равном - больше оценок
+    раньше), позиция в этом порядке - номер бита в масках по жанрам,
+    типам и порогам `rating_count` (`COUNT_THRESHOLDS`).\n
+    Фильтр - AND нескольких масок, "рейтинг не выше" - префикс порядка,
+    случайный выбор - `nth_bit` от случайного номера, худшие/лучшие -
+    младшие/старшие биты. Все это операции над int целиком (в C),
+    без обхода записей в Python.\n
+    Колонки передаются в любом порядке: типы - индексы в `SHOW_TYPES`,
+    жанры - индексы в `genre_names`.
+    Изменения применяются сборкой нового индекса (`merged`)
+    """
+
+    def __init__(
+        self,
+        ids: Sequence[int],
+        type_codes: Sequence[int],
+        ratings: Sequence[float],
+        rating_counts: Sequence[int],
+        titles: Sequence[str],
+        genre_codes: Sequence[Sequence[int]],
+        genre_names: List[str],
+    ):
+        timer = Timer()
+        size = len(ids)
+        order = sorted(range(size), key=lambda i: (ratings[i], -rating_counts[i]))
+        self.ids = array("q", [ids[i] for i in order])
+        self.type_codes = bytes([type_codes[i] for i in order])
+        self.ratings = array("d", [ratings[i] for i in order])
+        self.rating_counts = array("q", [rating_counts[i] for i in order])
+        self.titles = [titles[i] for i in order]
+        self.genre_codes = [tuple(genre_codes[i]) for i in order]
+        self.genre_names = genre_names
+        self.positions: Dict[int, int] = {
+            show_key(show_id, type_code): position
+            for position, (show_id, type_code) in enumerate(
+                zip(self.ids, self.type_codes)
+            )
+        }
+
+        self.all = (1 << size) - 1
+        genre_positions: List[List[int]] = [[] for _ in genre_names]
+        for position, codes in enumerate(self.genre_codes):
+            for code in codes:
+                genre_positions[code].append(position)
+        self.genre_bits = {
+            name: bitmap(positions, size)
+            for name, positions in zip(genre_names, genre_positions)
+        }
+        self.type_bits = {
+            show_type: bitmap(
+                (
+                    position
+                    for position, type_code in enumerate(self.type_codes)
+                    if type_code == code
+                ),
+                size,
+            )
+            for code, show_type in enumerate(SHOW_TYPES)
+        }
+        # Порог `COUNT_THRESHOLDS[k]` (k >= 1) проходят числа оценок
+        # с bit_length() >= k
+        last = len(COUNT_THRESHOLDS) - 1
+        bucket_positions: List[List[int]] = [[] for _ in COUNT_THRESHOLDS]
+        for position, rating_count in enumerate(self.rating_counts):
+            bucket_positions[min(max(rating_count, 0).bit_length(), last)].append(
+                position
+            )
+        self.count_bits = [0] * len(COUNT_THRESHOLDS)
+        above = 0
+        for bucket in reversed(range(len(COUNT_THRESHOLDS))):
+            above |= bitmap(bucket_positions[bucket], size)
+            self.count_bits[bucket] = above
+        logger.debug("Catalogue index of %s shows built in %.3fs", size, timer.elapsed)
+
+    @classmethod
+    def empty(cls) -> "CatalogueIndex":
+        return cls([], [], [], [], [], [], [])
+
+    @classmethod
+    def from_snapshot(cls, snapshot: Snapshot) -> "CatalogueIndex":
+        """
+        Из колонок снимка `common.snapshot`, без сборки `ShowModel`
+        """
+        type_codes = [SHOW_TYPES.index(show_type) for show_type in snapshot.types]
+        count = len(snapshot)
+        return cls(
+            snapshot.ids,
+            [type_codes[code] for code in snapshot.type_codes],
+            snapshot.ratings,
+            snapshot.rating_counts,
+            [snapshot.title(i) for i in range(count)],
+            [snapshot.genre_codes(i) for i in range(count)],
+            list(snapshot.genres),
+        )
+
+    def merged(self, shows: Iterable[ShowModel]) -> "CatalogueIndex":
+        """
+        Новый индекс с добавленными или замененными `shows`
+        """
+        ids = list(self.ids)
+        type_codes = list(self.type_codes)
+        ratings = list(self.ratings)
+        rating_counts = list(self.rating_counts)
+        titles = list(self.titles)
+        genre_codes = list(self.genre_codes)
+        genre_names = list(self.genre_names)
+        genre_index = {name: code for code, name in enumerate(genre_names)}
+        positions = dict(self.positions)
+        for show in shows:
+            sid, details = show.identifier, show.details
+            type_code = SHOW_TYPES.index(sid.type)
+            codes = []
+            for genre in details.genres:
+                if genre not in genre_index:
+                    genre_index[genre] = len(genre_names)
+                    genre_names.append(genre)
+                codes.append(genre_index[genre])
+            key = show_key(sid.id, type_code)
+            if key not in positions:
+                positions[key] = len(ids)
+                for column in (ids, type_codes, ratings, rating_counts, titles):
+                    column.append(None)
+                genre_codes.append(())
+            position = positions[key]
+            ids[position] = sid.id
+            type_codes[position] = type_code
+            ratings[position] = details.rating
+            rating_counts[position] = details.rating_count
+            titles[position] = details.title
+            genre_codes[position] = codes
+        return CatalogueIndex(
+            ids, type_codes, ratings, rating_counts, titles, genre_codes, genre_names
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def entry(self, position: int) -> CatalogueEntry:
+        names = self.genre_names
+        return CatalogueEntry(
+            identifier=ShowIdentifier(
+                id=self.ids[position], type=SHOW_TYPES[self.type_codes[position]]
+            ),
+            title=self.titles[position],
+            rating=self.ratings[position],
+            rating_count=self.rating_counts[position],
+            genres=[names[code] for code in self.genre_codes[position]],
+        )
+
+    def find(self, identifier: ShowIdentifier) -> Optional[CatalogueEntry]:
+        position = self.positions.get(
+            show_key(identifier.id, SHOW_TYPES.index(identifier.type))
+        )
+        return None if position is None else self.entry(position)
+
+    def mask(
+        self,
+        genre: Optional[str] = None,
+        show_type: Optional[ShowType] = None,
+        min_rating_count: int = 0,
+        max_rating: Optional[float] = None,
+        min_rating: Optional[float] = None,
+    ) -> Tuple[int, bool]:
+        """
+        Маска подходящих позиций и точна ли она: `min_rating_count`
+        не из `COUNT_THRESHOLDS` проверяется по записям при выборе
+        """
+        mask = self.all
+        if max_rating is not None:
+            mask &= (1 << bisect_right(self.ratings, max_rating)) - 1
+        if min_rating is not None:
+            mask &= ~((1 << bisect_left(self.ratings, min_rating)) - 1)
+        if genre is not None:
+            mask &= self.genre_bits.get(genre, 0)
+        if show_type is not None:
+            mask &= self.type_bits.get(show_type, 0)
+        if min_rating_count > 0:
+            bucket = bisect_right(COUNT_THRESHOLDS, min_rating_count) - 1
+            mask &= self.count_bits[bucket]
+            return mask, COUNT_THRESHOLDS[bucket] == min_rating_count
+        return mask, True
+
+    def _exact(self, mask: int, min_rating_count: int) -> int:
+        # Снимает биты с числом оценок ниже порога в пределах одной
+        # ступени `COUNT_THRESHOLDS` - только их маска не различает
+        bucket = bisect_right(COUNT_THRESHOLDS, min_rating_count) - 1
+        border = mask & ~self.count_bits[min(bucket + 1, len(COUNT_THRESHOLDS) - 1)]
+        counts = self.rating_counts
+        below = [
+            position
+            for position in iter_bits(border)
+            if counts[position] < min_rating_count
+        ]
+        return mask & ~bitmap(below, len(self))
+
+    def count(self, min_rating_count: int = 0, **filters) -> int:
+        mask, exact = self.mask(min_rating_count=min_rating_count, **filters)
+        if not exact:
+            mask = self._exact(mask, min_rating_count)
+        return mask.bit_count()
+
+    def pick(
+        self,
+        rng: Optional[random.Random] = None,
+        min_rating_count: int = 0,
+        **filters,
+    ) -> Optional[CatalogueEntry]:
+        """
+        Случайный фильм/сериал под фильтры (`mask`) или None
+        """
+        rng = rng or random
+        mask, exact = self.mask(min_rating_count=min_rating_count, **filters)
+        total = mask.bit_count()
+        if not total:
+            return None
+        if not exact:
+            # Обычно большинство бит маски порога проходят и точный порог
+            for _ in range(PICK_ATTEMPTS):
+                position = nth_bit(mask, rng.randrange(total))
+                if self.rating_counts[position] >= min_rating_count:
+                    return self.entry(position)
+            mask = self._exact(mask, min_rating_count)
+            total = mask.bit_count()
+            if not total:
+                return None
+        return self.entry(nth_bit(mask, rng.randrange(total)))
+
+    def top(
+        self,
+        k: int,
+        worst: bool = True,
+        min_rating_count: int = 0,
+        **filters,
+    ) -> List[CatalogueEntry]:
+        """
+        До `k` худших (`worst`) или лучших фильмов/сериалов под фильтры
+        """
+        mask, _ = self.mask(min_rating_count=min_rating_count, **filters)
+        counts = self.rating_counts
+        entries = []
+        for position in iter_bits(mask, reverse=not worst):
+            if counts[position] >= min_rating_count:
+                entries.append(self.entry(position))
+                if len(entries) == k:
+                    break
+        return entries
+
+
+class Catalogue:
+    """
+    Каталог бота: индекс из снимка db_service (`/shows/snapshot`,
+    копия хранится в `path` на случай недоступности db_service при
+    запуске), затем изменения (`/shows/changes`) раз в `interval`.
+    Запросы идут к текущему `index`, новый индекс собирается
+    в отдельном потоке и подменяет старый целиком
+    """
+
+    def __init__(self, db_service_url: str, path: str | Path, timeout: float = 300.0):
+        self.url = db_service_url.rstrip("/")
+        self.path = Path(path)
+        self.timeout = ClientTimeout(total=timeout)
+        self.index = CatalogueIndex.empty()
+        self.since: Optional[float] = None
+
+    async def load(self) -> None:
+        """
+        Загружает полный снимок, при ошибке - сохраненную копию
+        """
+        try:
+            async with ClientSession(timeout=self.timeout) as session:
+                async with session.get(f"{self.url}/shows/snapshot") as response:
+                    response.raise_for_status()
+                    data = await response.read()
+                    since = float(response.headers["X-Snapshot-Until"])
+            await to_thread(save_snapshot, self.path, data)
+        except Exception as e:
+            if not self.path.exists():
+                raise
+            logger.warning("Snapshot download failed, using %s: %s", self.path, e)
+            since = None
+        self.index = await to_thread(self._load_file)
+        self.since = since
+        logger.info("Catalogue loaded: %s shows", len(self.index))
+
+    def _load_file(self) -> CatalogueIndex:
+        with Snapshot(self.path) as snapshot:
+            return CatalogueIndex.from_snapshot(snapshot)
+
+    async def refresh(self) -> int:
+        """
+        Применяет изменения с прошлой загрузки, возвращает их число.
+        Без известного времени прошлой загрузки - полный снимок
+        """
+        if self.since is None:
+            await self.load()
+            return len(self.index)
+        async with ClientSession(timeout=self.timeout) as session:
+            async with session.get(
+                f"{self.url}/shows/changes",
+                params={"since": repr(self.since - CHANGES_OVERLAP)},
+            ) as response:
+                response.raise_for_status()
+                changes = CHANGES_ADAPTER.validate_json(await response.read())
+        if changes.shows:
+            self.index = await to_thread(self.index.merged, changes.shows)
+        self.since = changes.until
+        logger.debug("Catalogue refreshed: %s changes", len(changes.shows))
+        return len(changes.shows)
+
+    async def run(self, interval: float) -> None:
+        """
+        Загрузка и обновление раз в `interval` секунд
+        """
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error("Catalogue refresh failed: %s", e)
+            await sleep(interval)
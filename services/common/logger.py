@@ -1,6 +1,14 @@
+import os
 import sys
+import json
+import atexit
 import logging
 from enum import Enum
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+from threading import Lock
+from time import monotonic
+from typing import Dict, Optional, Tuple
 
 
 class LoggerLevel(Enum):
@@ -11,37 +19,222 @@ class LoggerLevel(Enum):
     CRITICAL = logging.CRITICAL
 
 
+def parse_level(value: Optional[str]) -> Optional[LoggerLevel]:
+    if not value:
+        return None
+    try:
+        return LoggerLevel[value.upper()]
+    except KeyError:
+        names = ", ".join(level.name.lower() for level in LoggerLevel)
+        raise ValueError(
+            f"Invalid LOG_LEVEL {value!r}, expected one of: {names}"
+        ) from None
+
+
+# Настройки через окружение:
+# LOG_LEVEL - уровень для всех логгеров (иначе берется из конструктора),
+# LOG_FORMAT - text или json, LOG_QUEUE=0 - писать синхронно,
+# LOG_RATE_LIMIT - "<записей>/<секунд>" для одинаковых предупреждений, 0 - без лимита
+LOG_LEVEL = parse_level(os.getenv("LOG_LEVEL"))
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+LOG_QUEUE = os.getenv("LOG_QUEUE", "1") != "0"
+LOG_RATE_LIMIT = os.getenv("LOG_RATE_LIMIT", "20/60")
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False)
+
+
+class RateLimiter:
+    """
+    Пропускает не больше `burst` сообщений с одним ключом за `window` секунд.
+    Ключ - логгер и шаблон сообщения до подстановки аргументов, поэтому
+    "Failed fetching rating for %s" считается одним сообщением
+    """
+
+    def __init__(self, burst: int, window: float):
+        self.burst = burst
+        self.window = window
+        self._lock = Lock()
+        # ключ -> [начало окна, пропущено, отброшено]
+        self._state: Dict[Tuple[str, str], list] = {}
+
+    def check(self, key: Tuple[str, str]) -> Optional[int]:
+        """
+        None - сообщение отбрасывается, иначе число отброшенных
+        в прошлом окне (его стоит дописать к сообщению)
+        """
+        now = monotonic()
+        with self._lock:
+            state = self._state.get(key)
+            if state is None or now - state[0] >= self.window:
+                self._state[key] = [now, 1, 0]
+                return state[2] if state is not None else 0
+            if state[1] < self.burst:
+                state[1] += 1
+                return 0
+            state[2] += 1
+            return None
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Кладет запись в очередь без форматирования: подстановка аргументов
+    и запись в stdout выполняются в потоке `QueueListener`
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def parse_rate_limit(value: str) -> Optional[RateLimiter]:
+    try:
+        burst, window = value.split("/")
+        if int(burst) > 0:
+            return RateLimiter(int(burst), float(window))
+    except ValueError:
+        pass
+    return None
+
+
+# Ограничение для повторяющихся предупреждений, общее для всех `Logger`
+WARNING_RATE_LIMIT = parse_rate_limit(LOG_RATE_LIMIT)
+
+
+_output: Optional[logging.Handler] = None
+_listener: Optional[QueueListener] = None
+
+
+def _make_stream_handler() -> logging.Handler:
+    handler = logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT == "json":
+        handler.setFormatter(JSONFormatter())
+    else:
+        handler.setFormatter(
+            logging.Formatter(
+                # fmt="%(asctime)s %(levelname)-8s %(name)s: %(message)s",
+                fmt="%(levelname)-8s %(name)s: %(message)s",
+                datefmt="%Y-%m-%d %H:%M:%S",
+            )
+        )
+    return handler
+
+
+def _start_listener(handler: DeferredQueueHandler, stream: logging.Handler) -> None:
+    global _listener
+    handler.queue = SimpleQueue()
+    _listener = QueueListener(handler.queue, stream, respect_handler_level=False)
+    _listener.start()
+
+
+class DirectQueue:
+    """
+    "Очередь", сразу передающая запись обработчику в текущем потоке
+    """
+
+    def __init__(self, handler: logging.Handler):
+        self.handler = handler
+
+    def put_nowait(self, record: logging.LogRecord) -> None:
+        self.handler.handle(record)
+
+
+def _after_fork_in_child() -> None:
+    # Поток записи не переживает fork, а рабочие процессы пула парсеров
+    # завершаются без atexit: в них запись идет синхронно
+    global _listener
+    if isinstance(_output, DeferredQueueHandler) and _listener is not None:
+        _output.queue = DirectQueue(_listener.handlers[0])
+        _listener = None
+    if WARNING_RATE_LIMIT is not None:
+        WARNING_RATE_LIMIT._lock = Lock()
+
+
+def shutdown() -> None:
+    """
+    Дописывает накопленные в очереди записи
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def output_handler() -> logging.Handler:
+    """
+    Общий для всех `Logger` обработчик вывода
+    """
+    global _output
+    if _output is not None:
+        return _output
+
+    stream = _make_stream_handler()
+    if LOG_QUEUE:
+        _output = DeferredQueueHandler(SimpleQueue())
+        _start_listener(_output, stream)
+        atexit.register(shutdown)
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=_after_fork_in_child)
+    else:
+        _output = stream
+    return _output
+
+
 class Logger:
+    """
+    Обертка над `logging.Logger`. Аргументы подставляются лениво
+    (`logger.debug("Requesting %s", url)`), только если уровень включен.
+    По умолчанию запись идет через очередь в отдельном потоке,
+    одинаковые предупреждения ограничиваются `WARNING_RATE_LIMIT`.
+    `stacklevel=2`: место вызова в записи - код, вызвавший обертку
+    """
+
     def __init__(self, name: str, level=LoggerLevel.DEBUG):
         self._logger = logging.getLogger(name)
 
         if not self._logger.handlers:
-            self._logger.setLevel(level.value)
-
-            sh_stdout = logging.StreamHandler(sys.stdout)
-            sh_stdout.setLevel(level.value)
-            sh_stdout.setFormatter(
-                logging.Formatter(
-                    # fmt="%(asctime)s %(levelname)-8s %(name)s: %(message)s",
-                    fmt="%(levelname)-8s %(name)s: %(message)s",
-                    datefmt="%Y-%m-%d %H:%M:%S",
-                )
-            )
-            self._logger.addHandler(sh_stdout)
-
+            self._logger.setLevel((LOG_LEVEL or level).value)
+            self._logger.addHandler(output_handler())
             self._logger.propagate = False
 
+    def enabled(self, level: LoggerLevel) -> bool:
+        """
+        Проверка уровня для дорогих аргументов
+        """
+        return self._logger.isEnabledFor(level.value)
+
     def debug(self, msg, *args, **kwargs) -> None:
-        self._logger.debug(msg, *args, **kwargs)
+        if self._logger.isEnabledFor(logging.DEBUG):
+            self._logger.log(logging.DEBUG, msg, *args, stacklevel=2, **kwargs)
 
     def info(self, msg, *args, **kwargs) -> None:
-        self._logger.info(msg, *args, **kwargs)
+        if self._logger.isEnabledFor(logging.INFO):
+            self._logger.log(logging.INFO, msg, *args, stacklevel=2, **kwargs)
 
     def warning(self, msg, *args, **kwargs) -> None:
-        self._logger.warning(msg, *args, **kwargs)
+        if self._logger.isEnabledFor(logging.WARNING):
+            # Проверка до создания записи: отброшенный повтор почти бесплатен
+            if WARNING_RATE_LIMIT is not None:
+                suppressed = WARNING_RATE_LIMIT.check((self._logger.name, msg))
+                if suppressed is None:
+                    return
+                if suppressed:
+                    msg = f"{msg} (suppressed {suppressed} similar)"
+            self._logger.log(logging.WARNING, msg, *args, stacklevel=2, **kwargs)
 
     def error(self, msg, *args, **kwargs) -> None:
-        self._logger.error(msg, *args, **kwargs)
+        if self._logger.isEnabledFor(logging.ERROR):
+            self._logger.log(logging.ERROR, msg, *args, stacklevel=2, **kwargs)
 
     def critical(self, msg, *args, **kwargs):
-        self._logger.critical(msg, *args, **kwargs)
+        if self._logger.isEnabledFor(logging.CRITICAL):
+            self._logger.log(logging.CRITICAL, msg, *args, stacklevel=2, **kwargs)
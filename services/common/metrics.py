@@ -0,0 +1,242 @@
+from abc import ABC, abstractmethod
+from asyncio import sleep
+from bisect import bisect_left
+from functools import wraps
+from inspect import iscoroutinefunction
+from math import isinf, isnan
+from time import perf_counter
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from common.timer import Timer
+
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+
+def label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (
+        (k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in pairs
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+def format_value(value: float) -> str:
+    """
+    Значение в текстовом формате Prometheus: `NaN`, `+Inf`, `-Inf`,
+    целые - без дробной части
+    """
+    if isnan(value):
+        return "NaN"
+    if isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Registry:
+    """
+    Набор метрик процесса, выводится в текстовом формате Prometheus
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, "Metric"] = {}
+
+    def register(self, metric: "Metric") -> None:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+
+    def get(self, name: str) -> Optional["Metric"]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class Metric(ABC):
+    kind: str
+
+    def __init__(self, name: str, help: str, registry: Optional[Registry] = REGISTRY):
+        self.name = name
+        self.help = help
+        if registry is not None:
+            registry.register(self)
+
+    @abstractmethod
+    def render(self) -> List[str]:
+        """
+        Строки значений метрики, без `# HELP` и `# TYPE`
+        """
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, registry: Optional[Registry] = REGISTRY):
+        super().__init__(name, help, registry)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, value: float = 1.0, **labels) -> None:
+        key = label_key(labels)
+        self._values[key] = self._values.get(key, 0.0) + value
+
+    def value(self, **labels) -> float:
+        return self._values.get(label_key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        return [
+            f"{self.name}{format_labels(key)} {format_value(value)}"
+            for key, value in self._values.items()
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        self._values[label_key(labels)] = value
+
+    def dec(self, value: float = 1.0, **labels) -> None:
+        self.inc(-value, **labels)
+
+
+class HistogramSeries:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, size: int):
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram(Metric):
+    """
+    Гистограмма с фиксированными границами `buckets`.
+    Наблюдение - один бинарный поиск и три сложения
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+        registry: Optional[Registry] = REGISTRY,
+    ):
+        super().__init__(name, help, registry)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series: Dict[LabelKey, HistogramSeries] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = label_key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = HistogramSeries(len(self.buckets))
+        series.counts[bisect_left(self.buckets, value)] += 1
+        series.sum += value
+        series.count += 1
+
+    def time(self, **labels) -> "timed":
+        return timed(self, **labels)
+
+    def render(self) -> List[str]:
+        lines = []
+        for key, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series.counts):
+                cumulative += count
+                le = format_labels(key, ("le", format_value(bound)))
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            labels = format_labels(key)
+            lines.append(f"{self.name}_sum{labels} {format_value(series.sum)}")
+            lines.append(f"{self.name}_count{labels} {series.count}")
+        return lines
+
+
+class timed:
+    """
+    Замер времени в `Histogram` на основе `Timer`:
+    как контекстный менеджер (`with timed(h, kind="page"):`)
+    и как декоратор обычных и асинхронных функций
+    """
+
+    def __init__(self, histogram: Histogram, **labels):
+        self.histogram = histogram
+        self.labels = labels
+        self._timer: Optional[Timer] = None
+
+    def __enter__(self) -> "timed":
+        self._timer = Timer()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.histogram.observe(self._timer.elapsed, **self.labels)
+
+    def __call__(self, func: Callable) -> Callable:
+        histogram, labels = self.histogram, self.labels
+
+        if iscoroutinefunction(func):
+
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                timer = Timer()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    histogram.observe(timer.elapsed, **labels)
+
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            timer = Timer()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(timer.elapsed, **labels)
+
+        return wrapper
+
+
+async def monitor_loop_lag(histogram: Histogram, interval: float = 0.5) -> None:
+    """
+    Меряет задержку event loop: насколько позже заказанного
+    просыпается `sleep(interval)`. Запускается отдельной задачей
+    """
+    while True:
+        start = perf_counter()
+        await sleep(interval)
+        histogram.observe(max(0.0, perf_counter() - start - interval))
@@ -19,6 +19,9 @@ class ShowIdentifier(BaseModel):
     id: int
     type: ShowType
 
+    # Неизменяемый и хешируемый: используется как ключ при дедупликации
+    model_config = ConfigDict(frozen=True)
+
     @field_validator("type", mode="before")
     def validate_type(cls, v: str | ShowType):
         if isinstance(v, str):
@@ -52,16 +55,17 @@ class ShowModel(BaseModel):
     @model_validator(mode="before")
     @classmethod
     def validate_model(cls, data: Dict[str, Any]):
-        if "identifier" in data and "details" in data:
+        if not isinstance(data, dict) or ("identifier" in data and "details" in data):
             return data
 
-        identifier = {"id": data["id"], "type": data["type"]}
+        # Отсутствующие поля превращаются в ошибки валидации, а не KeyError
+        identifier = {"id": data.get("id"), "type": data.get("type")}
         details = {
-            "title": data["title"],
-            "rating": data["rating"],
-            "rating_count": data["rating_count"],
-            "description": data["description"],
-            "genres": data["genres"],
+            "title": data.get("title"),
+            "rating": data.get("rating"),
+            "rating_count": data.get("rating_count"),
+            "description": data.get("description"),
+            "genres": data.get("genres"),
         }
         return {"identifier": identifier, "details": details}
 
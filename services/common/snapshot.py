@@ -0,0 +1,250 @@
+import sys
+import json
+import mmap
+import struct
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from common.show_models import ShowDetails, ShowIdentifier, ShowModel, ShowType
+
+
+# Формат снимка каталога (little-endian):
+# заголовок MAGIC, версия, число записей, таблица секций (смещение, длина);
+# секции выровнены по 8 байт и идут в порядке SECTIONS.
+# Записи отсортированы по (id, type), поэтому поиск по id - бинарный
+MAGIC = b"KPSNAP\0\0"
+VERSION = 1
+HEADER = struct.Struct("<8sHHI")
+SECTION = struct.Struct("<QQ")
+
+# Секция -> код типа `array` (None - байты как есть)
+SECTIONS: Dict[str, Optional[str]] = {
+    "dictionary": None,  # JSON: {"types": [...], "genres": [...]}
+    "ids": "I",
+    "types": "B",  # индекс в dictionary["types"]
+    "ratings": "d",
+    "rating_counts": "I",
+    "text_offsets": "I",  # 2N+1 смещений в text: название, описание, ...
+    "genre_offsets": "I",  # N+1 смещений в genre_codes
+    "genre_codes": "H",  # индексы в dictionary["genres"]
+    "text": None,  # UTF-8 названия и описания подряд
+}
+
+
+def _align(size: int) -> int:
+    return (size + 7) & ~7
+
+
+def _check_byteorder() -> None:
+    # Числовые секции читаются через memoryview.cast в порядке байт платформы
+    if sys.byteorder != "little":
+        raise RuntimeError("Snapshots are supported on little-endian platforms only")
+
+
+def dump_snapshot(shows: Iterable[ShowModel]) -> Tuple[bytes, int]:
+    """
+    Колоночный снимок в памяти: байты и число записей.
+    Повторы одного `ShowIdentifier` схлопываются в последний
+    """
+    _check_byteorder()
+    by_key: Dict[Tuple[int, str], ShowModel] = {}
+    for show in shows:
+        by_key[(show.identifier.id, show.identifier.type.value)] = show
+    records = [by_key[key] for key in sorted(by_key)]
+
+    type_codes = {show_type: i for i, show_type in enumerate(ShowType)}
+    genre_codes: Dict[str, int] = {}
+    columns = {name: array(code) for name, code in SECTIONS.items() if code}
+    text = bytearray()
+    columns["text_offsets"].append(0)
+    columns["genre_offsets"].append(0)
+    for show in records:
+        columns["ids"].append(show.identifier.id)
+        columns["types"].append(type_codes[show.identifier.type])
+        columns["ratings"].append(show.details.rating)
+        columns["rating_counts"].append(show.details.rating_count)
+        text += show.details.title.encode()
+        columns["text_offsets"].append(len(text))
+        text += show.details.description.encode()
+        columns["text_offsets"].append(len(text))
+        for genre in show.details.genres:
+            columns["genre_codes"].append(
+                genre_codes.setdefault(genre, len(genre_codes))
+            )
+        columns["genre_offsets"].append(len(columns["genre_codes"]))
+
+    dictionary = {
+        "types": [show_type.value for show_type in ShowType],
+        "genres": list(genre_codes),
+    }
+    blobs = {name: column.tobytes() for name, column in columns.items()}
+    blobs["dictionary"] = json.dumps(dictionary, ensure_ascii=False).encode()
+    blobs["text"] = bytes(text)
+
+    offset = _align(HEADER.size + SECTION.size * len(SECTIONS))
+    data = bytearray(HEADER.pack(MAGIC, VERSION, 0, len(records)))
+    for name in SECTIONS:
+        data += SECTION.pack(offset, len(blobs[name]))
+        offset = _align(offset + len(blobs[name]))
+    for name in SECTIONS:
+        data += b"\0" * (_align(len(data)) - len(data))
+        data += blobs[name]
+    return bytes(data), len(records)
+
+
+def write_snapshot(path: str | Path, shows: Iterable[ShowModel]) -> int:
+    """
+    Записывает фильмы/сериалы в колоночный снимок, возвращает число записей
+    """
+    data, count = dump_snapshot(shows)
+    save_snapshot(path, data)
+    return count
+
+
+def save_snapshot(path: str | Path, data: bytes) -> None:
+    """
+    Сохраняет готовые байты снимка (например, `dump_snapshot` или ответ
+    db_service): запись во временный файл и замена
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_bytes(data)
+    tmp.replace(path)
+
+
+class Snapshot:
+    """
+    Снимок каталога, отображенный в память: колонки доступны
+    как `memoryview` без разбора записей, `ShowModel` собирается
+    только для запрошенных индексов.\n
+    `with Snapshot(path) as snapshot: snapshot.select(min_rating=8)`
+    """
+
+    def __init__(self, path: str | Path):
+        _check_byteorder()
+        self.path = Path(path)
+        with open(self.path, "rb") as src:
+            self._mmap = mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+
+        magic, version, _, self.count = HEADER.unpack_from(self._view)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{self.path} is not a version {VERSION} snapshot")
+
+        sections: Dict[str, memoryview] = {}
+        for i, (name, code) in enumerate(SECTIONS.items()):
+            offset, length = SECTION.unpack_from(
+                self._view, HEADER.size + i * SECTION.size
+            )
+            section = self._view[offset : offset + length]
+            sections[name] = section.cast(code) if code else section
+        self._sections = sections
+
+        dictionary = json.loads(bytes(sections["dictionary"]))
+        self.types: List[ShowType] = [ShowType(value) for value in dictionary["types"]]
+        self.genres: List[str] = dictionary["genres"]
+        self.ids: memoryview = sections["ids"]
+        self.type_codes: memoryview = sections["types"]
+        self.ratings: memoryview = sections["ratings"]
+        self.rating_counts: memoryview = sections["rating_counts"]
+
+    def close(self) -> None:
+        # Срезы держат буфер mmap: освобождаются до его закрытия
+        for section in getattr(self, "_sections", {}).values():
+            section.release()
+        self._view.release()
+        self._mmap.close()
+
+    def __enter__(self) -> "Snapshot":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _text(self, n: int) -> str:
+        offsets = self._sections["text_offsets"]
+        return str(self._sections["text"][offsets[n] : offsets[n + 1]], "utf-8")
+
+    def identifier(self, i: int) -> ShowIdentifier:
+        return ShowIdentifier(id=self.ids[i], type=self.types[self.type_codes[i]])
+
+    def title(self, i: int) -> str:
+        return self._text(2 * i)
+
+    def description(self, i: int) -> str:
+        return self._text(2 * i + 1)
+
+    def genre_codes(self, i: int) -> memoryview:
+        offsets = self._sections["genre_offsets"]
+        return self._sections["genre_codes"][offsets[i] : offsets[i + 1]]
+
+    def show_genres(self, i: int) -> List[str]:
+        return [self.genres[code] for code in self.genre_codes(i)]
+
+    def show(self, i: int) -> ShowModel:
+        return ShowModel(
+            identifier=self.identifier(i),
+            details=ShowDetails(
+                title=self.title(i),
+                rating=self.ratings[i],
+                rating_count=self.rating_counts[i],
+                description=self.description(i),
+                genres=self.show_genres(i),
+            ),
+        )
+
+    def __iter__(self) -> Iterator[ShowModel]:
+        return (self.show(i) for i in range(self.count))
+
+    def find(self, identifier: ShowIdentifier) -> Optional[int]:
+        """
+        Индекс записи или None: бинарный поиск по отсортированным id
+        """
+        type_code = self.types.index(identifier.type)
+        i = bisect_left(self.ids, identifier.id)
+        while i < self.count and self.ids[i] == identifier.id:
+            if self.type_codes[i] == type_code:
+                return i
+            i += 1
+        return None
+
+    def select(
+        self,
+        min_rating: Optional[float] = None,
+        min_rating_count: Optional[int] = None,
+        show_type: Optional[ShowType] = None,
+        genre: Optional[str] = None,
+    ) -> List[int]:
+        """
+        Индексы записей, подходящих под все заданные условия:
+        просматриваются только нужные колонки
+        """
+        indices: Iterable[int] = range(self.count)
+        if show_type is not None:
+            type_code = self.types.index(show_type)
+            codes = self.type_codes
+            indices = [i for i in indices if codes[i] == type_code]
+        if min_rating is not None:
+            ratings = self.ratings
+            indices = [i for i in indices if ratings[i] >= min_rating]
+        if min_rating_count is not None:
+            counts = self.rating_counts
+            indices = [i for i in indices if counts[i] >= min_rating_count]
+        if genre is not None:
+            if genre not in self.genres:
+                return []
+            genre_code = self.genres.index(genre)
+            indices = [i for i in indices if genre_code in self.genre_codes(i)]
+        return list(indices)
+
+
+def read_snapshot(path: str | Path) -> List[ShowModel]:
+    with Snapshot(path) as snapshot:
+        return list(snapshot)
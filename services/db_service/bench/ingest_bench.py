@@ -0,0 +1,104 @@
+"""
+Скорость загрузки `ShowModel` в Postgres: COPY + upsert (`bulk_upsert_shows`)
+против построчного ORM `merge`.\n
+Нужен доступный Postgres по `DB_URL` (по умолчанию - локальный из docker-compose).
+Таблицы создаются при необходимости, записи имеют id от 10^9 и удаляются после замера.\n
+Запуск из `services/db_service`:
+`python -m bench.ingest_bench --count 100000 --batch 10000 --orm-count 2000`
+"""
+
+import argparse
+import asyncio
+from random import choice, randint, sample, uniform
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List
+
+from common.show_models import ShowModel
+from common.timer import Timer
+from src.db import bulk_upsert_shows, create_engine, create_pool, init_db
+from src.models import Show
+
+
+ID_BASE = 10**9
+GENRES = ["драма", "комедия", "ужасы", "боевик", "триллер", "мелодрама", "фэнтези"]
+
+
+def make_shows(count: int) -> List[ShowModel]:
+    return [
+        ShowModel.model_validate(
+            {
+                "id": ID_BASE + i,
+                "type": choice(("film", "series")),
+                "title": f"Фильм {i}",
+                "rating": round(uniform(1, 10), 1),
+                "rating_count": randint(0, 10**6),
+                "description": "Описание фильма " * randint(5, 30),
+                "genres": sample(GENRES, randint(1, 3)),
+            }
+        )
+        for i in range(count)
+    ]
+
+
+async def bench_copy(shows: List[ShowModel], batch: int) -> float:
+    pool = await create_pool()
+    try:
+        timer = Timer()
+        for i in range(0, len(shows), batch):
+            await bulk_upsert_shows(pool, shows[i : i + batch])
+        return len(shows) / timer.elapsed
+    finally:
+        await pool.close()
+
+
+async def bench_orm(shows: List[ShowModel]) -> float:
+    engine = create_engine()
+    try:
+        timer = Timer()
+        async with AsyncSession(engine) as session:
+            for show in shows:
+                data = show.model_dump()
+                data.pop("genres")
+                await session.merge(Show(**data))
+                await session.commit()
+        return len(shows) / timer.elapsed
+    finally:
+        await engine.dispose()
+
+
+async def cleanup() -> None:
+    engine = create_engine()
+    async with engine.begin() as conn:
+        await conn.execute(delete(Show).where(Show.id >= ID_BASE))
+    await engine.dispose()
+
+
+async def main(count: int, batch: int, orm_count: int) -> None:
+    engine = create_engine()
+    await init_db(engine)
+    await engine.dispose()
+
+    shows = make_shows(count)
+    try:
+        rate = await bench_copy(shows, batch)
+        print(f"copy insert: {count} shows, batch {batch}: {rate:.0f} shows/s")
+        rate = await bench_copy(shows, batch)
+        print(f"copy update: {count} shows, batch {batch}: {rate:.0f} shows/s")
+
+        await cleanup()
+        if orm_count:
+            rate = await bench_orm(shows[:orm_count])
+            print(f"orm merge:   {orm_count} shows, row by row: {rate:.0f} shows/s")
+    finally:
+        await cleanup()
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--count", type=int, default=100_000)
+    arg_parser.add_argument("--batch", type=int, default=10_000)
+    arg_parser.add_argument("--orm-count", type=int, default=2_000)
+    args = arg_parser.parse_args()
+
+    asyncio.run(main(args.count, args.batch, args.orm_count))
@@ -0,0 +1,151 @@
+"""
+Поиск по названию/описанию: `ILIKE '%...%'` (последовательный проход)
+против `search_postgres` (GIN по `search_vector`/`title_vector`,
+pg_trgm для fuzzy) и `TrigramIndex` в памяти, p50/p99 в мс.\n
+Нужен доступный Postgres по `DB_URL`. Записи имеют id от 2 * 10^9
+и удаляются после замера; fuzzy в Postgres - только при наличии pg_trgm.\n
+Запуск из `services/db_service`:
+`python -m bench.search_bench --count 100000 --queries 200`
+"""
+
+import argparse
+import asyncio
+import random
+from typing import Awaitable, Callable, List, Tuple
+
+from common.show_models import ShowModel
+from common.timer import Timer
+from src.db import bulk_upsert_shows, create_engine, create_pool, init_db
+from src.search import SearchMode, TrigramIndex, init_search, search_postgres
+
+
+ID_BASE = 2 * 10**9
+SYLLABLES = "ка ро ми на то ле ва ст пр ду зо ри ко мо ше ль ны го ва ре бе да".split()
+GENRES = ["драма", "комедия", "ужасы", "боевик", "триллер"]
+
+ILIKE_SEARCH = """
+SELECT type, id FROM shows
+WHERE title ILIKE $1 OR description ILIKE $1
+ORDER BY rating_count DESC LIMIT 21
+"""
+
+
+def make_vocabulary(rng: random.Random, size: int) -> List[str]:
+    vocabulary = set()
+    while len(vocabulary) < size:
+        vocabulary.add("".join(rng.choices(SYLLABLES, k=rng.randint(2, 5))))
+    return sorted(vocabulary)
+
+
+def make_shows(count: int, vocabulary: List[str], rng: random.Random):
+    # Частота слов - по Ципфу, как в обычном тексте
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    return [
+        ShowModel.model_validate(
+            {
+                "id": ID_BASE + i,
+                "type": rng.choice(("film", "series")),
+                "title": " ".join(
+                    rng.choices(vocabulary, weights, k=rng.randint(1, 4))
+                ).capitalize(),
+                "rating": round(rng.uniform(1, 10), 1),
+                "rating_count": int(rng.paretovariate(0.8) * 100),
+                "description": " ".join(
+                    rng.choices(vocabulary, weights, k=rng.randint(10, 40))
+                ),
+                "genres": rng.sample(GENRES, rng.randint(1, 2)),
+            }
+        )
+        for i in range(count)
+    ]
+
+
+def make_queries(
+    shows: List[ShowModel], rng: random.Random, count: int
+) -> List[Tuple[str, str]]:
+    """
+    (начало слова названия, слово названия с опечаткой)
+    """
+    queries = []
+    for show in rng.sample(shows, count):
+        word = rng.choice(show.details.title.lower().split())
+        prefix = word[: max(3, len(word) - 2)]
+        i = rng.randrange(len(word))
+        typo = word[:i] + rng.choice("аеоиу") + word[i + 1 :]
+        queries.append((prefix, typo))
+    return queries
+
+
+async def latency_ms(func: Callable[[str], Awaitable], queries: List[str]):
+    times = []
+    for query in queries:
+        timer = Timer()
+        await func(query)
+        times.append(timer.elapsed * 1000)
+    times.sort()
+    return times[len(times) // 2], times[min(len(times) - 1, int(len(times) * 0.99))]
+
+
+async def main(count: int, query_count: int) -> None:
+    rng = random.Random(0)
+    shows = make_shows(count, make_vocabulary(rng, 20000), rng)
+    queries = make_queries(shows, rng, query_count)
+    prefixes = [prefix for prefix, _ in queries]
+    typos = [typo for _, typo in queries]
+
+    engine = create_engine()
+    await init_db(engine)
+    await engine.dispose()
+    pool = await create_pool()
+    try:
+        trigram = await init_search(pool)
+        timer = Timer()
+        for i in range(0, len(shows), 10000):
+            await bulk_upsert_shows(pool, shows[i : i + 10000])
+        print(f"ingest with search_vector: {count / timer.elapsed:.0f} shows/s")
+        async with pool.acquire() as conn:
+            await conn.execute("ANALYZE shows")
+
+        async def ilike(query: str):
+            async with pool.acquire() as conn:
+                return await conn.fetch(ILIKE_SEARCH, f"%{query}%")
+
+        def postgres(mode: SearchMode):
+            return lambda query: search_postgres(pool, query, mode, 20, 0)
+
+        timer = Timer()
+        index = TrigramIndex(shows)
+        print(f"TrigramIndex build: {timer.elapsed:.1f}s")
+
+        def memory(mode: SearchMode):
+            async def search(query: str):
+                return index.search(query, mode, 20, 0)
+
+            return search
+
+        scenarios = [
+            ("ILIKE '%prefix%'", ilike, prefixes),
+            ("postgres prefix", postgres(SearchMode.PREFIX), prefixes),
+            ("memory prefix", memory(SearchMode.PREFIX), prefixes),
+            ("memory fuzzy (typo)", memory(SearchMode.FUZZY), typos),
+        ]
+        if trigram:
+            scenarios.insert(
+                2, ("postgres fuzzy (typo)", postgres(SearchMode.FUZZY), typos)
+            )
+        for name, func, scenario_queries in scenarios:
+            p50, p99 = await latency_ms(func, scenario_queries)
+            print(f"{name:<24} p50 {p50:>7.2f} ms  p99 {p99:>7.2f} ms")
+    finally:
+        async with pool.acquire() as conn:
+            await conn.execute("DELETE FROM shows WHERE id >= $1", ID_BASE)
+        await pool.close()
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--count", type=int, default=100_000)
+    arg_parser.add_argument("--queries", type=int, default=200)
+    args = arg_parser.parse_args()
+
+    asyncio.run(main(args.count, args.queries))
@@ -0,0 +1,87 @@
+"""
+Снимок каталога: JSON (`ShowModel.serialize_model`, как сейчас) против
+колоночного `common.snapshot` - размер, запись, полная загрузка
+в `ShowModel`, открытие и выборка без разбора записей.\n
+Запуск из `services/db_service`:
+`python -m bench.snapshot_bench --count 100000`
+"""
+
+import argparse
+import tempfile
+from pathlib import Path
+from pydantic import TypeAdapter
+from typing import List
+
+from bench.ingest_bench import make_shows
+from common.show_models import ShowIdentifier, ShowModel, ShowType
+from common.snapshot import Snapshot, read_snapshot, write_snapshot
+from common.timer import Timer
+
+
+SHOWS_ADAPTER = TypeAdapter(List[ShowModel])
+
+
+def timed(name: str, func):
+    timer = Timer()
+    result = func()
+    print(f"{name:<36} {timer.elapsed * 1000:>9.1f} ms")
+    return result
+
+
+def main(count: int) -> None:
+    shows = make_shows(count)
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = Path(tmp) / "shows.json"
+        snap_path = Path(tmp) / "shows.snap"
+
+        timed(
+            "json: write", lambda: json_path.write_bytes(SHOWS_ADAPTER.dump_json(shows))
+        )
+        timed("snapshot: write", lambda: write_snapshot(snap_path, shows))
+        json_size = json_path.stat().st_size
+        snap_size = snap_path.stat().st_size
+        print(
+            f"size: json {json_size / 2**20:.1f} MiB, snapshot {snap_size / 2**20:.1f} MiB"
+        )
+
+        from_json = timed(
+            "json: load all",
+            lambda: SHOWS_ADAPTER.validate_json(json_path.read_bytes()),
+        )
+        from_snap = timed("snapshot: load all", lambda: read_snapshot(snap_path))
+        key = lambda show: (show.identifier.id, show.identifier.type.value)
+        print(f"round trip equal: {sorted(from_json, key=key) == from_snap}")
+
+        snapshot = timed("snapshot: open", lambda: Snapshot(snap_path))
+        selected = timed(
+            "snapshot: select rating>=9 драма",
+            lambda: snapshot.select(min_rating=9, genre="драма"),
+        )
+        timed(
+            "json: same selection (loaded)",
+            lambda: [
+                show
+                for show in from_json
+                if show.details.rating >= 9 and "драма" in show.details.genres
+            ],
+        )
+        timed(
+            "snapshot: 1000 finds",
+            lambda: [
+                snapshot.find(
+                    ShowIdentifier(id=show.identifier.id, type=show.identifier.type)
+                )
+                for show in shows[:1000]
+            ],
+        )
+        print(f"selected {len(selected)} of {len(snapshot)}")
+        del from_snap
+        snapshot.close()
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--count", type=int, default=100_000)
+    args = arg_parser.parse_args()
+
+    main(args.count)
@@ -1,9 +1,129 @@
-from fastapi import FastAPI
+import os
+from asyncio import to_thread
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from pydantic import ValidationError
+from typing import Any, Dict, Optional
 
+from common.snapshot import dump_snapshot
+from common.timer import Timer
+from src.db import (
+    SHOW_LIST_ADAPTER,
+    bulk_upsert_shows,
+    create_engine,
+    create_pool,
+    fetch_shows,
+    init_db,
+)
+from src.search import SearchMode, TrigramIndex, init_search, search_postgres
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global pool, search_index, memory_modes, trigram
+
+    engine = create_engine()
+    await init_db(engine)
+    await engine.dispose()
+
+    pool = await create_pool()
+    # SEARCH_BACKEND: postgres, memory (весь поиск через `TrigramIndex`)
+    # или auto - в памяти только нечеткий поиск и только без pg_trgm
+    backend = os.getenv("SEARCH_BACKEND", "auto")
+    trigram = await init_search(pool)
+    memory_modes = set()
+    if backend == "memory":
+        memory_modes = set(SearchMode)
+    elif backend == "auto" and not trigram:
+        memory_modes = {SearchMode.FUZZY}
+    search_index = None
+    if memory_modes:
+        shows, _ = await fetch_shows(pool)
+        search_index = await to_thread(TrigramIndex, shows)
+    yield
+    await pool.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 @app.get("/")
 async def root():
     return {"status": "db_service up"}
+
+
+@app.post("/shows/bulk")
+async def bulk_ingest_shows(request: Request) -> Dict[str, Any]:
+    """
+    Принимает JSON-массив записей в формате `ShowModel.serialize_model`
+    и загружает их пачкой через COPY + upsert
+    """
+    timer = Timer()
+    try:
+        shows = SHOW_LIST_ADAPTER.validate_json(await request.body())
+    except ValidationError as e:
+        raise HTTPException(
+            status_code=422, detail=e.errors(include_url=False, include_context=False)
+        )
+
+    upserted = await bulk_upsert_shows(pool, shows)
+    if search_index is not None:
+        # Индекс в памяти обновляется в потоке, не блокируя цикл событий
+        await to_thread(search_index.add, shows)
+    return {
+        "status": "ok",
+        "received": len(shows),
+        "upserted": upserted,
+        "time": timer.elapsed,
+    }
+
+
+@app.get("/shows/snapshot")
+async def shows_snapshot() -> Response:
+    """
+    Все фильмы/сериалы колоночным снимком `common.snapshot`.
+    В заголовке `X-Snapshot-Until` - время выборки для `/shows/changes`
+    """
+    shows, until = await fetch_shows(pool)
+    data, count = await to_thread(dump_snapshot, shows)
+    return Response(
+        content=data,
+        media_type="application/octet-stream",
+        headers={"X-Snapshot-Until": repr(until), "X-Snapshot-Count": str(count)},
+    )
+
+
+@app.get("/shows/changes")
+async def shows_changes(since: float) -> Response:
+    """
+    Фильмы/сериалы, измененные после `since` (unix time по часам БД),
+    и `until` для следующего запроса
+    """
+    shows, until = await fetch_shows(pool, since)
+    return Response(
+        content=b'{"until":%s,"shows":%s}'
+        % (repr(until).encode(), SHOW_LIST_ADAPTER.dump_json(shows)),
+        media_type="application/json",
+    )
+
+
+@app.get("/shows/search")
+async def shows_search(
+    q: str = Query(min_length=1, max_length=200),
+    mode: SearchMode = SearchMode.PREFIX,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+) -> Response:
+    """
+    Поиск по названию и описанию, по убыванию релевантности:
+    `prefix` - по началам слов (GIN по `search_vector`),
+    `fuzzy` - по похожим частям названия с опечатками (pg_trgm).
+    Следующая страница - с `offset=next_offset`
+    """
+    if mode in memory_modes:
+        page = await to_thread(search_index.search, q, mode, limit, offset)
+    elif mode == SearchMode.FUZZY and not trigram:
+        raise HTTPException(status_code=400, detail="fuzzy search requires pg_trgm")
+    else:
+        page = await search_postgres(pool, q, mode, limit, offset)
+    return Response(content=page.model_dump_json(), media_type="application/json")
@@ -0,0 +1,59 @@
+from datetime import datetime
+from sqlalchemy import (
+    BigInteger,
+    Float,
+    ForeignKey,
+    ForeignKeyConstraint,
+    Integer,
+    String,
+    Text,
+    func,
+)
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
+
+
+class Base(DeclarativeBase):
+    pass
+
+
+class Show(Base):
+    """
+    Фильм/сериал, ключ `(type, id)` совпадает с `ShowIdentifier`
+    """
+
+    __tablename__ = "shows"
+
+    type: Mapped[str] = mapped_column(String(16), primary_key=True)
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    title: Mapped[str] = mapped_column(Text)
+    rating: Mapped[float] = mapped_column(Float)
+    rating_count: Mapped[int] = mapped_column(Integer)
+    description: Mapped[str] = mapped_column(Text)
+    # По нему отдаются изменения (`/shows/changes`)
+    updated_at: Mapped[datetime] = mapped_column(server_default=func.now(), index=True)
+
+
+class Genre(Base):
+    __tablename__ = "genres"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    name: Mapped[str] = mapped_column(Text, unique=True)
+
+
+class ShowGenre(Base):
+    __tablename__ = "show_genres"
+    __table_args__ = (
+        ForeignKeyConstraint(
+            ["show_type", "show_id"],
+            ["shows.type", "shows.id"],
+            ondelete="CASCADE",
+        ),
+    )
+
+    show_type: Mapped[str] = mapped_column(String(16), primary_key=True)
+    show_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    genre_id: Mapped[int] = mapped_column(
+        ForeignKey("genres.id", ondelete="CASCADE"), primary_key=True
+    )
+    # Место жанра в `ShowDetails.genres`
+    position: Mapped[int] = mapped_column(Integer, server_default="0")
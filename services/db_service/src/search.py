@@ -0,0 +1,499 @@
+import re
+import heapq
+import asyncpg
+from bisect import bisect_left
+from collections import Counter
+from enum import Enum
+from pydantic import BaseModel
+from threading import Lock
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from common.logger import Logger
+from common.show_models import ShowModel
+from src.db import SHOW_LIST_ADAPTER
+
+
+class SearchMode(Enum):
+    # Слова запроса как начала слов названия/описания (название важнее)
+    PREFIX = "prefix"
+    # Похожие на запрос части названия, с опечатками (триграммы)
+    FUZZY = "fuzzy"
+
+
+class SearchHit(BaseModel):
+    show: ShowModel
+    score: float
+
+
+class SearchPage(BaseModel):
+    results: List[SearchHit]
+    # None - дальше результатов нет
+    next_offset: Optional[int] = None
+
+
+# Минимальная доля триграмм запроса в названии (`word_similarity` в pg_trgm)
+FUZZY_THRESHOLD = 0.4
+
+# Вес слова запроса, найденного в названии и только в описании;
+# оценка PREFIX - среднее по словам запроса, 0..1
+TITLE_WEIGHT = 1.0
+DESCRIPTION_WEIGHT = 0.4
+
+# Поисковый вектор вычисляется Postgres при каждой вставке/обновлении,
+# код загрузки (`bulk_upsert_shows`) не меняется.
+# Конфигурация 'simple': без стемминга и стоп-слов, иначе начала слов
+# вроде "тем" (стоп-слово) или "рыцари" (основа "рыцар") не находятся;
+# слова нормализуются как в `normalize`
+SEARCH_SCHEMA = """
+ALTER TABLE shows ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', replace(lower(title), 'ё', 'е')), 'A')
+        || setweight(
+            to_tsvector('simple', replace(lower(description), 'ё', 'е')), 'B'
+        )
+    ) STORED;
+CREATE INDEX IF NOT EXISTS shows_search_vector ON shows USING gin (search_vector);
+ALTER TABLE shows ADD COLUMN IF NOT EXISTS title_vector tsvector
+    GENERATED ALWAYS AS (
+        to_tsvector('simple', replace(lower(title), 'ё', 'е'))
+    ) STORED;
+CREATE INDEX IF NOT EXISTS shows_title_vector ON shows USING gin (title_vector);
+CREATE INDEX IF NOT EXISTS shows_rank ON shows (rating_count DESC, type, id);
+"""
+
+TRIGRAM_SCHEMA = """
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS shows_title_trgm ON shows USING gin (title gin_trgm_ops);
+"""
+
+# Жанры - только для найденной страницы, в порядке ключей
+SEARCH_SHOWS = """
+SELECT s.type, s.id, s.title, s.rating, s.rating_count, s.description,
+    ARRAY(
+        SELECT g.name FROM show_genres sg JOIN genres g ON g.id = sg.genre_id
+        WHERE sg.show_type = s.type AND sg.show_id = s.id ORDER BY sg.position
+    ) AS genres
+FROM unnest($1::varchar[], $2::bigint[]) WITH ORDINALITY AS k(type, id, n)
+JOIN shows s ON s.type = k.type AND s.id = k.id
+ORDER BY k.n
+"""
+
+# Все слова в названии - наибольшая оценка, порядок только по числу
+# оценок: при частых началах слов Postgres идет по `shows_rank`
+# и останавливается на `LIMIT`, не оценивая все совпадения.
+# Отдельный `title_vector`, а не вес 'A' в `search_vector`: по его
+# статистике Postgres отличает частые начала слов в названиях от редких
+PREFIX_TITLE_HITS = f"""
+SELECT type, id, {TITLE_WEIGHT}::double precision AS score
+FROM shows
+WHERE title_vector @@ to_tsquery('simple', $1)
+ORDER BY rating_count DESC, type, id
+LIMIT $2
+"""
+
+# Остальные совпадения, только если первых не хватило на страницу
+PREFIX_REST_HITS = f"""
+SELECT type, id, (
+    SELECT avg(
+        CASE WHEN title_vector @@ to_tsquery('simple', term)
+        THEN {TITLE_WEIGHT} ELSE {DESCRIPTION_WEIGHT} END
+    ) FROM unnest($2::text[]) AS term
+)::double precision AS score
+FROM shows
+WHERE search_vector @@ to_tsquery('simple', $1)
+    AND NOT title_vector @@ to_tsquery('simple', $1)
+ORDER BY score DESC, rating_count DESC, type, id
+LIMIT $3
+"""
+
+# Сначала страница ключей по индексу, затем жанры только для нее
+SEARCH_PAGE = """
+WITH hits AS (
+    SELECT type, id, {score} AS score
+    FROM shows
+    WHERE {condition}
+    ORDER BY score DESC, rating_count DESC, type, id
+    LIMIT $2 OFFSET $3
+)
+SELECT s.type, s.id, s.title, s.rating, s.rating_count, s.description,
+    ARRAY(
+        SELECT g.name FROM show_genres sg JOIN genres g ON g.id = sg.genre_id
+        WHERE sg.show_type = s.type AND sg.show_id = s.id ORDER BY sg.position
+    ) AS genres,
+    h.score
+FROM hits h JOIN shows s ON s.type = h.type AND s.id = h.id
+ORDER BY h.score DESC, s.rating_count DESC, s.type, s.id
+"""
+
+FUZZY_SEARCH = SEARCH_PAGE.format(
+    score="word_similarity($1, title)",
+    condition="$1 <% title",
+)
+
+WORD_RE = re.compile(r"\w+")
+
+
+logger = Logger("Search")
+
+
+def normalize(text: str) -> str:
+    return text.lower().replace("ё", "е")
+
+
+def words(text: str) -> List[str]:
+    return WORD_RE.findall(normalize(text))
+
+
+def trigrams(text: str) -> Set[str]:
+    """
+    Триграммы слов как в pg_trgm: слово дополняется двумя пробелами
+    в начале и одним в конце
+    """
+    result = set()
+    for word in words(text):
+        padded = f"  {word} "
+        result.update(padded[i : i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+def prefix_tsquery(terms: List[str]) -> str:
+    """
+    `to_tsquery` из слов запроса: каждое - как начало слова.
+    Слова состоят только из `\\w`, экранирование не нужно
+    """
+    return " & ".join(f"'{term}':*" for term in terms)
+
+
+async def init_search(pool: asyncpg.Pool) -> bool:
+    """
+    Создает поисковый вектор и индексы. Возвращает, доступен ли pg_trgm
+    (без него нечеткий поиск идет через `TrigramIndex`)
+    """
+    async with pool.acquire() as conn:
+        await conn.execute(SEARCH_SCHEMA)
+        try:
+            await conn.execute(TRIGRAM_SCHEMA)
+        except asyncpg.PostgresError as e:
+            logger.warning("pg_trgm is not available, fuzzy search in memory: %s", e)
+            return False
+    logger.debug("Search indexes ready")
+    return True
+
+
+def search_page(
+    rows: List[Tuple[ShowModel, float]], limit: int, offset: int
+) -> SearchPage:
+    """
+    Страница из `limit + 1` найденных: лишний - признак продолжения
+    """
+    return SearchPage(
+        results=[SearchHit(show=show, score=score) for show, score in rows[:limit]],
+        next_offset=offset + limit if len(rows) > limit else None,
+    )
+
+
+async def search_postgres(
+    pool: asyncpg.Pool, query: str, mode: SearchMode, limit: int, offset: int
+) -> SearchPage:
+    """
+    Поиск по индексам Postgres: `search_vector` (GIN) и `shows_rank`
+    для PREFIX, `title gin_trgm_ops` для FUZZY. Оценки PREFIX те же,
+    что у `TrigramIndex`; на 100 тыс. записей `bench.search_bench`
+    p50 2-7 мс, p99 9-15 мс.\n
+    FUZZY проверяется `tests/test_search.py` и замеряется
+    `bench.search_bench` только при установленном pg_trgm
+    """
+    async with pool.acquire() as conn:
+        async with conn.transaction(readonly=True):
+            if mode == SearchMode.PREFIX:
+                rows = await prefix_rows(conn, words(query), limit, offset)
+            else:
+                await conn.execute(
+                    "SELECT set_config('pg_trgm.word_similarity_threshold', $1, true)",
+                    str(FUZZY_THRESHOLD),
+                )
+                rows = await conn.fetch(FUZZY_SEARCH, query, limit + 1, offset)
+    shows = SHOW_LIST_ADAPTER.validate_python(
+        [{key: row[key] for key in row.keys() if key != "score"} for row in rows]
+    )
+    return search_page(
+        [(show, row["score"]) for show, row in zip(shows, rows)], limit, offset
+    )
+
+
+async def prefix_rows(
+    conn: asyncpg.Connection, terms: List[str], limit: int, offset: int
+) -> List[dict]:
+    """
+    Страница из `limit + 1` совпадений PREFIX: сначала со всеми словами
+    в названии, затем остальные по оценке
+    """
+    if not terms:
+        return []
+    count = offset + limit + 1
+    query = prefix_tsquery(terms)
+    hits = await conn.fetch(PREFIX_TITLE_HITS, query, count)
+    if len(hits) < count:
+        hits += await conn.fetch(
+            PREFIX_REST_HITS,
+            query,
+            [prefix_tsquery([term]) for term in terms],
+            count - len(hits),
+        )
+    hits = hits[offset:]
+    rows = await conn.fetch(
+        SEARCH_SHOWS, [hit["type"] for hit in hits], [hit["id"] for hit in hits]
+    )
+    return [dict(row, score=hit["score"]) for row, hit in zip(rows, hits)]
+
+
+# Ключ фильма/сериала (type, id)
+Key = Tuple[str, int]
+# (-rating_count, type, id): порядок выдачи при равной оценке
+Rank = Tuple[int, str, int]
+
+
+class TrigramIndex:
+    """
+    Поиск в памяти без Postgres: слова названий и описаний (словарь
+    отсортирован для поиска по началу слова) и триграммы названий.
+    Для тестов и для Postgres без pg_trgm; обновляется вместе
+    с загрузкой (`add`).\n
+    Списки фильмов/сериалов по словам хранятся в порядке выдачи (`Rank`),
+    поэтому запрос из одного слова - слияние списков до нужной страницы,
+    а не оценка всех совпадений. Несколько слов - кандидаты по самому
+    редкому, нечеткий поиск - кандидаты по самым редким триграммам
+    в порядке выдачи. Методы можно вызывать из разных потоков (`to_thread`).\n
+    На 100 тыс. записей `bench.search_bench`: PREFIX p50 0.07 мс,
+    p99 0.2 мс; FUZZY p50 0.7 мс, p99 30 мс - у длинных слов с опечаткой,
+    где проверяются все названия с редкими триграммами
+    """
+
+    # Вес совпадения в названии и в описании, как 'A' и 'B' у `search_vector`
+    TITLE_WEIGHT = TITLE_WEIGHT
+    DESCRIPTION_WEIGHT = DESCRIPTION_WEIGHT
+
+    def __init__(self, shows: Iterable[ShowModel] = ()):
+        self.shows: Dict[Key, ShowModel] = {}
+        # слово -> `Rank` фильмов/сериалов с ним в названии (описании), по возрастанию
+        self.title_postings: Dict[str, List[Rank]] = {}
+        self.description_postings: Dict[str, List[Rank]] = {}
+        # триграмма -> ключи с ней в названии и их `Rank` по возрастанию
+        self.trigram_postings: Dict[str, Set[Key]] = {}
+        self.trigram_ranks: Dict[str, List[Rank]] = {}
+        # ключ -> (слова названия, слова описания, триграммы названия)
+        self._terms: Dict[Key, Tuple[Set[str], Set[str], Set[str]]] = {}
+        self._vocabulary: Optional[List[str]] = None
+        self._lock = Lock()
+        self.add(shows)
+
+    def __len__(self) -> int:
+        return len(self.shows)
+
+    @staticmethod
+    def rank(show: ShowModel) -> Rank:
+        return (
+            -show.details.rating_count,
+            show.identifier.type.value,
+            show.identifier.id,
+        )
+
+    def _postings(self) -> Tuple[Tuple[Dict[str, List[Rank]], float], ...]:
+        return (
+            (self.title_postings, self.TITLE_WEIGHT),
+            (self.description_postings, self.DESCRIPTION_WEIGHT),
+        )
+
+    def _remove(self, key: Key) -> None:
+        show = self.shows.pop(key, None)
+        if show is None:
+            return
+        rank = self.rank(show)
+        title_words, description_words, title_trigrams = self._terms.pop(key)
+        for (postings, _), show_words in zip(
+            self._postings(), (title_words, description_words)
+        ):
+            for word in show_words:
+                ranks = postings[word]
+                del ranks[bisect_left(ranks, rank)]
+        for trigram in title_trigrams:
+            self.trigram_postings[trigram].discard(key)
+            ranks = self.trigram_ranks[trigram]
+            del ranks[bisect_left(ranks, rank)]
+
+    def remove(self, key: Key) -> None:
+        with self._lock:
+            self._remove(key)
+
+    def add(self, shows: Iterable[ShowModel]) -> None:
+        """
+        Добавляет или заменяет фильмы/сериалы
+        """
+        batch = {
+            (show.identifier.type.value, show.identifier.id): show for show in shows
+        }
+        with self._lock:
+            for key in batch:
+                self._remove(key)
+            # В порядке `Rank`: дописанный хвост каждого списка уже
+            # отсортирован, и `sort` только сливает его с началом
+            unsorted: Dict[int, List[Rank]] = {}
+            for rank, key, show in sorted(
+                (self.rank(show), key, show) for key, show in batch.items()
+            ):
+                terms = (
+                    set(words(show.details.title)),
+                    set(words(show.details.description)),
+                    trigrams(show.details.title),
+                )
+                self.shows[key] = show
+                self._terms[key] = terms
+                for (postings, _), show_words in zip(self._postings(), terms):
+                    for word in show_words:
+                        ranks = postings.get(word)
+                        if ranks is None:
+                            ranks = postings[word] = []
+                            self._vocabulary = None
+                        ranks.append(rank)
+                        unsorted[id(ranks)] = ranks
+                for trigram in terms[2]:
+                    self.trigram_postings.setdefault(trigram, set()).add(key)
+                    ranks = self.trigram_ranks.setdefault(trigram, [])
+                    ranks.append(rank)
+                    unsorted[id(ranks)] = ranks
+            for ranks in unsorted.values():
+                ranks.sort()
+
+    @property
+    def vocabulary(self) -> List[str]:
+        if self._vocabulary is None:
+            self._vocabulary = sorted(
+                self.title_postings.keys() | self.description_postings.keys()
+            )
+        return self._vocabulary
+
+    def _prefixed(self, term: str) -> List[str]:
+        # Все слова, начинающиеся с `term`, идут в словаре подряд
+        vocabulary = self.vocabulary
+        return vocabulary[
+            bisect_left(vocabulary, term) : bisect_left(vocabulary, term + "\U0010ffff")
+        ]
+
+    def _prefix_ranked(self, query: str, count: int) -> List[Tuple[Key, float]]:
+        terms = words(query)
+        if not terms:
+            return []
+        if len(terms) == 1:
+            # Сначала совпадения в названии, затем в описании, каждые
+            # в порядке `Rank`: слияние отсортированных списков слов
+            found: Dict[Key, float] = {}
+            prefixed = self._prefixed(terms[0])
+            for postings, weight in self._postings():
+                lists = [postings[word] for word in prefixed if word in postings]
+                for rank in heapq.merge(*lists):
+                    if len(found) == count:
+                        return list(found.items())
+                    found.setdefault(rank[1:], weight)
+            return list(found.items())
+
+        def size(prefixed: List[str]) -> int:
+            return sum(
+                len(postings.get(word, ()))
+                for word in prefixed
+                for postings, _ in self._postings()
+            )
+
+        # Кандидаты - по самому редкому слову запроса,
+        # остальные слова проверяются по словам кандидата
+        rarest = min((self._prefixed(term) for term in terms), key=size)
+        best = sum(self.TITLE_WEIGHT for _ in terms) / len(terms)
+        scores: Dict[Rank, Optional[float]] = {}
+        full = 0
+        # Сначала с редким словом в названии, в порядке `Rank`: набрав
+        # `count` с наибольшей оценкой (все слова в названии), можно
+        # не проверять остальных
+        title_lists = [self.title_postings.get(word, []) for word in rarest]
+        for rank in heapq.merge(*title_lists):
+            if rank not in scores:
+                scores[rank] = score = self._prefix_score(rank[1:], terms)
+                full += score == best
+                if full == count:
+                    break
+        else:
+            for word in rarest:
+                for rank in self.description_postings.get(word, ()):
+                    if rank not in scores:
+                        scores[rank] = self._prefix_score(rank[1:], terms)
+        ranked = heapq.nsmallest(
+            count,
+            ((-score, rank) for rank, score in scores.items() if score is not None),
+        )
+        return [(rank[1:], -score) for score, rank in ranked]
+
+    def _prefix_score(self, key: Key, terms: List[str]) -> Optional[float]:
+        title_words, description_words, _ = self._terms[key]
+        score = 0.0
+        for term in terms:
+            if any(word.startswith(term) for word in title_words):
+                score += self.TITLE_WEIGHT
+            elif any(word.startswith(term) for word in description_words):
+                score += self.DESCRIPTION_WEIGHT
+            else:
+                return None
+        # Среднее по словам запроса, как в `PREFIX_REST_HITS`
+        return score / len(terms)
+
+    def _fuzzy_ranked(self, query: str, count: int) -> List[Tuple[Key, float]]:
+        query_trigrams = trigrams(query)
+        if not query_trigrams:
+            return []
+        total = len(query_trigrams)
+        # Наименьшее число общих триграмм, проходящее порог
+        need = next(n for n in range(1, total + 1) if n / total >= FUZZY_THRESHOLD)
+        postings = sorted(
+            (self.trigram_ranks.get(trigram, []) for trigram in query_trigrams),
+            key=len,
+        )
+        keys = [self.trigram_postings.get(trigram, set()) for trigram in query_trigrams]
+        # Название с `n` общими триграммами есть хотя бы в одном из
+        # `total - n + 1` самых коротких списков. Порог `n` снижается,
+        # пока с ним не наберется `count` названий: остальные хуже
+        found: List[Tuple[int, Rank]] = []
+        seen: Set[Key] = set()
+        for n in range(total, need - 1, -1):
+            # Названия с большим числом общих триграмм уже найдены
+            # на прошлых шагах. Новые идут в порядке `Rank`: набрав из списка
+            # `count` с `n` общими, остальные в нем можно не проверять
+            new_hits = 0
+            for rank in postings[total - n]:
+                key = rank[1:]
+                if key in seen:
+                    continue
+                seen.add(key)
+                shared = sum(key in title_keys for title_keys in keys)
+                found.append((-shared, rank))
+                if shared >= n:
+                    new_hits += 1
+                    if new_hits == count:
+                        break
+            hits = sum(-shared >= n for shared, _ in found)
+            if hits >= count:
+                break
+        # Доля триграмм запроса в названии: приближение `word_similarity`
+        best = heapq.nsmallest(
+            count, ((shared, rank) for shared, rank in found if -shared >= n)
+        )
+        return [(rank[1:], -shared / total) for shared, rank in best]
+
+    def search(
+        self, query: str, mode: SearchMode, limit: int, offset: int
+    ) -> SearchPage:
+        # Порядок как у Postgres: оценка, затем число оценок, затем ключ
+        count = offset + limit + 1
+        with self._lock:
+            if mode == SearchMode.PREFIX:
+                ranked = self._prefix_ranked(query, count)
+            else:
+                ranked = self._fuzzy_ranked(query, count)
+            rows = [(self.shows[key], score) for key, score in ranked[offset:]]
+        return search_page(rows, limit, offset)
@@ -0,0 +1,60 @@
+"""
+Синтетические фильмы/сериалы и запросы для тестов поиска
+"""
+
+import random
+from typing import List, Tuple
+
+from common.show_models import ShowModel
+
+
+SYLLABLES = "ка ро ми на то ле ва ст пр ду зо ри ко мо ше ль ны го ва ре бе да".split()
+GENRES = ["драма", "комедия", "ужасы", "боевик", "триллер"]
+
+
+def make_vocabulary(rng: random.Random, size: int) -> List[str]:
+    vocabulary = set()
+    while len(vocabulary) < size:
+        vocabulary.add("".join(rng.choices(SYLLABLES, k=rng.randint(2, 5))))
+    return sorted(vocabulary)
+
+
+def make_shows(
+    count: int, vocabulary: List[str], rng: random.Random
+) -> List[ShowModel]:
+    # Частота слов - по Ципфу, как в обычном тексте
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    return [
+        ShowModel.model_validate(
+            {
+                "id": i + 1,
+                "type": rng.choice(("film", "series")),
+                "title": " ".join(
+                    rng.choices(vocabulary, weights, k=rng.randint(1, 4))
+                ).capitalize(),
+                "rating": round(rng.uniform(1, 10), 1),
+                "rating_count": int(rng.paretovariate(0.8) * 100),
+                "description": " ".join(
+                    rng.choices(vocabulary, weights, k=rng.randint(10, 40))
+                ),
+                "genres": rng.sample(GENRES, rng.randint(1, 2)),
+            }
+        )
+        for i in range(count)
+    ]
+
+
+def make_queries(
+    shows: List[ShowModel], rng: random.Random, count: int
+) -> List[Tuple[str, str]]:
+    """
+    (начало слова названия, слово названия с опечаткой)
+    """
+    queries = []
+    for show in rng.sample(shows, count):
+        word = rng.choice(show.details.title.lower().split())
+        prefix = word[: max(3, len(word) - 2)]
+        i = rng.randrange(len(word))
+        typo = word[:i] + rng.choice("аеоиу") + word[i + 1 :]
+        queries.append((prefix, typo))
+    return queries
@@ -0,0 +1,87 @@
+"""
+Загрузка в Postgres (`bulk_upsert_shows`): порядок жанров сохраняется,
+параллельные загрузки пересекающихся пачек не взаимоблокируются.
+Нужен доступный Postgres по `DB_URL`.\n
+Запуск из `services/db_service`:
+`PYTHONPATH=..:. python -m pytest tests`
+"""
+
+import asyncio
+import os
+from typing import List
+
+import pytest
+
+from common.show_models import ShowModel
+
+pytestmark = pytest.mark.skipif(not os.getenv("DB_URL"), reason="DB_URL is not set")
+
+ID_BASE = 5 * 10**9
+
+
+def make_show(id: int, genres: List[str]) -> ShowModel:
+    return ShowModel.model_validate(
+        {
+            "id": ID_BASE + id,
+            "type": "film",
+            "title": f"Фильм {id}",
+            "rating": 7.0,
+            "rating_count": 100,
+            "description": "Описание",
+            "genres": genres,
+        }
+    )
+
+
+def run_with_pool(func):
+    from src.db import create_engine, create_pool, init_db
+
+    async def run():
+        engine = create_engine()
+        await init_db(engine)
+        await engine.dispose()
+        pool = await create_pool()
+        try:
+            return await func(pool)
+        finally:
+            async with pool.acquire() as conn:
+                await conn.execute("DELETE FROM shows WHERE id >= $1", ID_BASE)
+                await conn.execute("DELETE FROM genres WHERE name LIKE 'тест-%'")
+            await pool.close()
+
+    return asyncio.run(run())
+
+
+def test_genre_order_round_trip():
+    from src.db import bulk_upsert_shows, fetch_shows
+
+    async def run(pool):
+        # "тест-а" добавляется в `genres` раньше, но у второго фильма идет вторым
+        await bulk_upsert_shows(pool, [make_show(1, ["тест-а"])])
+        await bulk_upsert_shows(pool, [make_show(2, ["тест-б", "тест-а", "тест-б"])])
+        shows, _ = await fetch_shows(pool)
+        return {show.identifier.id - ID_BASE: show.details.genres for show in shows}
+
+    genres = run_with_pool(run)
+    assert genres[1] == ["тест-а"]
+    assert genres[2] == ["тест-б", "тест-а"]
+
+
+def test_concurrent_overlapping_ingests():
+    from src.db import bulk_upsert_shows
+
+    names = [f"тест-{i}" for i in range(20)]
+    first = [make_show(i, names) for i in range(200)]
+    second = [make_show(i, names[::-1]) for i in reversed(range(200))]
+
+    async def run(pool):
+        for _ in range(5):
+            results = await asyncio.wait_for(
+                asyncio.gather(
+                    bulk_upsert_shows(pool, first), bulk_upsert_shows(pool, second)
+                ),
+                timeout=30,
+            )
+            assert results == [200, 200]
+
+    run_with_pool(run)
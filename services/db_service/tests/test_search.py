@@ -0,0 +1,229 @@
+"""
+Поиск `TrigramIndex` в памяти: порядок выдачи, страницы, обновление
+и совпадение с прямым перебором на синтетических данных (`conftest`).
+Поиск в Postgres проверяется, только если задан `DB_URL`; нечеткий -
+только при доступном pg_trgm.\n
+Запуск из `services/db_service`:
+`PYTHONPATH=..:. python -m pytest tests`
+"""
+
+import asyncio
+import os
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from common.show_models import ShowModel
+from conftest import make_queries, make_shows, make_vocabulary
+from src.search import (
+    FUZZY_THRESHOLD,
+    SearchMode,
+    TrigramIndex,
+    trigrams,
+    words,
+)
+
+
+def make_show(id: int, title: str, description: str, rating_count: int) -> ShowModel:
+    return ShowModel.model_validate(
+        {
+            "id": id,
+            "type": "film",
+            "title": title,
+            "rating": 7.0,
+            "rating_count": rating_count,
+            "description": description,
+            "genres": ["драма"],
+        }
+    )
+
+
+SHOWS = [
+    make_show(1, "Тёмный рыцарь", "Бэтмен и Джокер", 500),
+    make_show(2, "Тёмная башня", "Стрелок идёт к башне", 100),
+    make_show(3, "Рыцари неба", "Лётчики", 50),
+    make_show(4, "Ночь", "Тёмный город", 900),
+]
+
+
+def titles(page) -> list:
+    return [(hit.show.details.title, round(hit.score, 2)) for hit in page.results]
+
+
+def test_prefix_title_before_description():
+    page = TrigramIndex(SHOWS).search("тем", SearchMode.PREFIX, 20, 0)
+    assert titles(page) == [
+        ("Тёмный рыцарь", 1.0),
+        ("Тёмная башня", 1.0),
+        ("Ночь", 0.4),
+    ]
+    assert page.next_offset is None
+
+
+def test_prefix_all_words():
+    index = TrigramIndex(SHOWS)
+    page = index.search("тём рыц", SearchMode.PREFIX, 20, 0)
+    assert titles(page) == [("Тёмный рыцарь", 1.0)]
+    assert index.search("!!!", SearchMode.PREFIX, 20, 0).results == []
+
+
+def test_prefix_pages():
+    index = TrigramIndex(SHOWS)
+    first = index.search("тем", SearchMode.PREFIX, 2, 0)
+    second = index.search("тем", SearchMode.PREFIX, 2, first.next_offset)
+    assert titles(first) == [("Тёмный рыцарь", 1.0), ("Тёмная башня", 1.0)]
+    assert titles(second) == [("Ночь", 0.4)]
+    assert second.next_offset is None
+
+
+def test_fuzzy_typo():
+    page = TrigramIndex(SHOWS).search("рыцрь", SearchMode.FUZZY, 20, 0)
+    assert [title for title, _ in titles(page)] == ["Тёмный рыцарь", "Рыцари неба"]
+
+
+def test_add_replaces_show():
+    index = TrigramIndex(SHOWS)
+    index.add([make_show(1, "Светлый рыцарь", "Бэтмен", 500)])
+    assert len(index) == len(SHOWS)
+    assert titles(index.search("тем", SearchMode.PREFIX, 20, 0)) == [
+        ("Тёмная башня", 1.0),
+        ("Ночь", 0.4),
+    ]
+    index.remove(("film", 1))
+    assert titles(index.search("рыц", SearchMode.PREFIX, 20, 0)) == [
+        ("Рыцари неба", 1.0)
+    ]
+
+
+def brute_force(shows, query: str, mode: SearchMode, count: int) -> list:
+    """
+    Оценки по определению, без индексов
+    """
+    scored = []
+    for show in shows:
+        if mode == SearchMode.PREFIX:
+            terms = words(query)
+            title = words(show.details.title)
+            description = words(show.details.description)
+            score = 0.0
+            for term in terms:
+                if any(word.startswith(term) for word in title):
+                    score += TrigramIndex.TITLE_WEIGHT
+                elif any(word.startswith(term) for word in description):
+                    score += TrigramIndex.DESCRIPTION_WEIGHT
+                else:
+                    break
+            else:
+                if terms:
+                    scored.append((-score / len(terms), TrigramIndex.rank(show)))
+        else:
+            query_trigrams = trigrams(query)
+            shared = len(query_trigrams & trigrams(show.details.title))
+            if query_trigrams and shared / len(query_trigrams) >= FUZZY_THRESHOLD:
+                scored.append((-shared / len(query_trigrams), TrigramIndex.rank(show)))
+    return [(rank[2], -score) for score, rank in sorted(scored)[:count]]
+
+
+def test_matches_brute_force():
+    rng = random.Random(0)
+    shows = make_shows(3000, make_vocabulary(rng, 500), rng)
+    index = TrigramIndex(shows[:2000])
+    # Обновление части записей (другое число оценок) и новые записи
+    updated = [
+        show.model_copy(
+            update={"details": show.details.model_copy(update={"rating_count": 7})}
+        )
+        for show in shows[:300]
+    ]
+    index.add(updated + shows[2000:])
+    current = updated + shows[300:]
+    queries = make_queries(shows, rng, 100)
+    cases = [(prefix, SearchMode.PREFIX) for prefix, _ in queries]
+    cases += [(typo, SearchMode.FUZZY) for _, typo in queries]
+    cases += [(f"{a[:2]} {b[:2]}", SearchMode.PREFIX) for a, b in queries[:30]]
+    for query, mode in cases:
+        page = index.search(query, mode, 20, 0)
+        got = [(hit.show.identifier.id, hit.score) for hit in page.results]
+        assert got == brute_force(current, query, mode, 20), (query, mode)
+
+
+def test_concurrent_add_and_search():
+    rng = random.Random(1)
+    shows = make_shows(2000, make_vocabulary(rng, 300), rng)
+    index = TrigramIndex(shows[:1000])
+
+    def add(i: int) -> None:
+        index.add(shows[1000 + i * 100 : 1100 + i * 100])
+
+    def search(i: int) -> None:
+        for show in shows[i * 50 : i * 50 + 50]:
+            index.search(show.details.title[:3], SearchMode.PREFIX, 20, 0)
+            index.search(show.details.title, SearchMode.FUZZY, 20, 0)
+
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(add, range(10)))
+        list(executor.map(search, range(10)))
+    assert len(index) == len(shows)
+
+
+PREFIX_QUERIES = ["тем", "рыц", "тём рыц", "тем город", "бэт"]
+
+
+@pytest.mark.skipif(not os.getenv("DB_URL"), reason="DB_URL is not set")
+@pytest.mark.parametrize("mode", list(SearchMode))
+def test_postgres_search(mode):
+    from src.db import bulk_upsert_shows, create_engine, create_pool, init_db
+    from src.search import init_search, search_postgres
+
+    id_base = 4 * 10**9
+    shows = [
+        show.model_copy(
+            update={
+                "identifier": show.identifier.model_copy(
+                    update={"id": id_base + show.identifier.id}
+                )
+            }
+        )
+        for show in SHOWS
+    ]
+
+    async def run():
+        engine = create_engine()
+        await init_db(engine)
+        await engine.dispose()
+        pool = await create_pool()
+        try:
+            trigram = await init_search(pool)
+            if mode == SearchMode.FUZZY and not trigram:
+                return None
+            await bulk_upsert_shows(pool, shows)
+            if mode == SearchMode.FUZZY:
+                return [await search_postgres(pool, "рыцрь", mode, 20, 0)]
+            return [
+                await search_postgres(pool, query, mode, 2, offset)
+                for query in PREFIX_QUERIES
+                for offset in (0, 2)
+            ]
+        finally:
+            async with pool.acquire() as conn:
+                await conn.execute("DELETE FROM shows WHERE id >= $1", id_base)
+            await pool.close()
+
+    pages = asyncio.run(run())
+    if pages is None:
+        pytest.skip("pg_trgm is not available")
+    if mode == SearchMode.FUZZY:
+        found = [hit.show.details.title for hit in pages[0].results]
+        assert found[:2] == ["Тёмный рыцарь", "Рыцари неба"]
+        return
+    # Оценки и порядок те же, что у `TrigramIndex`
+    index = TrigramIndex(SHOWS)
+    expected = [
+        index.search(query, mode, 2, offset)
+        for query in PREFIX_QUERIES
+        for offset in (0, 2)
+    ]
+    assert [(titles(page), page.next_offset) for page in pages] == [
+        (titles(page), page.next_offset) for page in expected
+    ]
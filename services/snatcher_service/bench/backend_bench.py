@@ -0,0 +1,73 @@
+"""
+Сверка и сравнение бэкендов разбора (BeautifulSoup и lxml)
+на сохраненных HTML-фикстурах (формат как в `bench.parse_bench`).\n
+Для каждой фикстуры результаты всех бэкендов должны совпадать,
+иначе скрипт завершается с ошибкой (та же сверка на фикстурах
+`bench/fixtures` - в `tests/test_parser_backends.py`).\n
+Запуск из `services/snatcher_service`:
+`python -m bench.backend_bench --fixtures bench/fixtures --rounds 10`,
+страницы реального размера - `--fixtures bench/fixtures_full`
+(см. `bench.full_pages`)
+"""
+
+import argparse
+import tracemalloc
+from pathlib import Path
+
+from common.timer import Timer
+from src.parser import ParserBackend
+from bench.parse_bench import load_fixtures
+
+
+def check_equivalence(jobs: list) -> int:
+    mismatches = 0
+    for func, args in jobs:
+        results = {backend: func(*args, backend=backend) for backend in ParserBackend}
+        if len({repr(result) for result in results.values()}) > 1:
+            mismatches += 1
+            print(f"MISMATCH {func.__name__}{args[1:]}:")
+            for backend, result in results.items():
+                print(f"  {backend.value:<5} {result!r}")
+    return mismatches
+
+
+def measure(jobs: list, backend: ParserBackend, rounds: int) -> tuple[float, int]:
+    tracemalloc.start()
+    for func, args in jobs:
+        func(*args, backend=backend)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timer = Timer()
+    for _ in range(rounds):
+        for func, args in jobs:
+            func(*args, backend=backend)
+    return timer.elapsed / (len(jobs) * rounds), peak
+
+
+def main(fixtures: Path, rounds: int) -> None:
+    jobs = load_fixtures(fixtures)
+    if not jobs:
+        raise SystemExit(f"No fixtures found in {fixtures}")
+
+    mismatches = check_equivalence(jobs)
+    print(f"equivalence: {len(jobs) - mismatches}/{len(jobs)} fixtures match")
+
+    for backend in ParserBackend:
+        per_page, peak = measure(jobs, backend, rounds)
+        print(
+            f"{backend.value:<5} {per_page * 1000:.2f} ms/page, "
+            f"python heap peak {peak / 2**20:.1f} MiB"
+        )
+
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--fixtures", type=Path, default=Path("bench/fixtures"))
+    arg_parser.add_argument("--rounds", type=int, default=5)
+    args = arg_parser.parse_args()
+
+    main(args.fixtures, args.rounds)
@@ -0,0 +1,331 @@
+"""
+Сквозной замер snatcher на локальном стенде (`bench.standin`, запускается
+отдельным процессом): `batch_snatch_identifiers`, `batch_snatch_shows`,
+`pipeline_snatch_pages` и эндпоинт `/batch_snatch_pages` запущенного
+через uvicorn `main:app`.\n
+Для каждого сценария: загрузок/с, p50/p99 времени ответа
+(`RequestResult.time`), ошибки, CPU и пиковый RSS основного процесса
+и пула разбора (для `api` - процессов сервера, по /proc).\n
+Запуск из `services/snatcher_service`:
+`python -m bench.e2e_bench --fixtures bench/fixtures --pages 20 --latency 0.05`
+"""
+
+import os
+import sys
+import json
+import argparse
+import asyncio
+import resource
+import signal
+import subprocess
+import tempfile
+from aiohttp import ClientSession, ClientTimeout
+from pathlib import Path
+from pydantic import BaseModel
+from typing import List, Tuple
+
+from common.timer import Timer
+from src import snatcher
+from src.executor import ParseExecutor
+from src.session import SessionConfig, SessionManager
+from src.snatcher import Snatcher, SnatchShowResult
+
+
+SERVICE_DIR = Path(__file__).resolve().parent.parent
+SERVICES_DIR = SERVICE_DIR.parent
+SCENARIOS = ("identifiers", "shows", "pipeline", "api")
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, round(q * (len(values) - 1)))]
+
+
+class RunStats(BaseModel):
+    """
+    Итог сценария: CPU и пиковый RSS - для основного процесса
+    и для дочерних (пул разбора)
+    """
+
+    count: int
+    failed: int
+    elapsed: float
+    latencies: List[float]
+    cpu: Tuple[float, float] = (0.0, 0.0)
+    rss_mib: Tuple[float, float] = (0.0, 0.0)
+
+    def report(self, name: str) -> str:
+        return (
+            f"{name:<12} {self.count:>6} loads {self.failed:>4} failed "
+            f"{self.elapsed:>7.2f}s {self.count / self.elapsed:>8.1f}/s  "
+            f"p50 {percentile(self.latencies, 0.5) * 1000:>6.1f}ms "
+            f"p99 {percentile(self.latencies, 0.99) * 1000:>6.1f}ms  "
+            f"cpu {self.cpu[0]:.2f}s+{self.cpu[1]:.2f}s  "
+            f"rss {self.rss_mib[0]:.0f}/{self.rss_mib[1]:.0f} MiB"
+        )
+
+
+def rusage_cpu() -> Tuple[float, float]:
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return (
+        own.ru_utime + own.ru_stime,
+        children.ru_utime + children.ru_stime,
+    )
+
+
+def rusage_rss_mib() -> Tuple[float, float]:
+    # ru_maxrss в Linux - в КиБ
+    return (
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+    )
+
+
+def proc_children(pid: int) -> List[int]:
+    try:
+        text = Path(f"/proc/{pid}/task/{pid}/children").read_text()
+    except OSError:
+        return []
+    return [int(child) for child in text.split()]
+
+
+def proc_cpu(pid: int) -> float:
+    # utime и stime - 14 и 15 поля /proc/<pid>/stat, после имени в скобках
+    fields = Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def proc_peak_rss_mib(pid: int) -> float:
+    for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+        if line.startswith("VmHWM:"):
+            return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def server_usage(pid: int) -> Tuple[Tuple[float, float], Tuple[float, float]]:
+    """
+    CPU и пиковый RSS сервера и его живых дочерних процессов (Linux /proc)
+    """
+    children = proc_children(pid)
+    return (
+        (proc_cpu(pid), sum(proc_cpu(child) for child in children)),
+        (
+            proc_peak_rss_mib(pid),
+            max((proc_peak_rss_mib(child) for child in children), default=0.0),
+        ),
+    )
+
+
+async def wait_port(url: str, timeout: float = 30.0) -> None:
+    timer = Timer()
+    async with ClientSession() as session:
+        while True:
+            try:
+                async with session.get(url) as response:
+                    if response.status < 500:
+                        return
+            except OSError:
+                pass
+            if timer.elapsed > timeout:
+                raise TimeoutError(f"{url} is not responding")
+            await asyncio.sleep(0.1)
+
+
+def start_standin(args: argparse.Namespace) -> subprocess.Popen:
+    return subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "bench.standin",
+            f"--fixtures={args.fixtures}",
+            f"--port={args.standin_port}",
+            f"--latency={args.latency}",
+            f"--error-rate={args.error_rate}",
+            f"--throttle-rate={args.throttle_rate}",
+        ],
+        cwd=SERVICE_DIR,
+        stdout=subprocess.DEVNULL,
+    )
+
+
+def stop(process: subprocess.Popen) -> None:
+    process.send_signal(signal.SIGINT)
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+async def run_library(
+    args: argparse.Namespace, scenario: str, pages: List[int]
+) -> RunStats:
+    cpu_before = rusage_cpu()
+    timer = Timer()
+    # Пул процессов создается и закрывается внутри сценария,
+    # чтобы его CPU попал в RUSAGE_CHILDREN
+    with ParseExecutor.create(args.executor, args.workers) as executor:
+        async with SessionManager(SessionConfig()) as sm:
+            if scenario == "identifiers":
+                results = await Snatcher.batch_snatch_identifiers(
+                    sm, pages, args.concurrent, executor
+                )
+                failed = sum(1 for res in results if res.identifier_list is None)
+            elif scenario == "shows":
+                page_results = await Snatcher.batch_snatch_identifiers(
+                    sm, pages, args.concurrent, executor
+                )
+                identifiers = [
+                    sid for res in page_results for sid in res.identifier_list or []
+                ]
+                results = await Snatcher.batch_snatch_shows(
+                    sm, identifiers, args.concurrent, executor
+                )
+                failed = sum(1 for res in results if res.show is None)
+            else:
+                results = [
+                    res
+                    async for res in Snatcher.pipeline_snatch_pages(
+                        sm, pages, args.concurrent, args.concurrent, executor
+                    )
+                ]
+                failed = sum(
+                    1
+                    for res in results
+                    if (
+                        res.show
+                        if isinstance(res, SnatchShowResult)
+                        else res.identifier_list
+                    )
+                    is None
+                )
+    elapsed = timer.elapsed
+
+    return RunStats(
+        count=len(results),
+        failed=failed,
+        elapsed=elapsed,
+        latencies=[res.request_result.time for res in results],
+        cpu=tuple(after - before for after, before in zip(rusage_cpu(), cpu_before)),
+        rss_mib=rusage_rss_mib(),
+    )
+
+
+async def run_api(
+    args: argparse.Namespace, base_url: str, pages: List[int]
+) -> RunStats:
+    """
+    Время, CPU и RSS считаются по серверу и только на время запроса,
+    без запуска uvicorn
+    """
+    with tempfile.TemporaryDirectory() as workdir:
+        (Path(workdir) / "config").mkdir()
+        (Path(workdir) / "config" / "session_config.json").write_text("{}")
+        env = {
+            **os.environ,
+            "PYTHONPATH": f"{SERVICES_DIR}{os.pathsep}{SERVICE_DIR}",
+            "KP_URL_BASE": base_url,
+            "JOBS_DIR": f"{workdir}/jobs",
+            "SINK_DIR": f"{workdir}/sinks",
+            "PARSE_EXECUTOR": args.executor,
+            "LOG_LEVEL": "warning",
+            "KP_STREAM_SHOW_PAGES": "1" if args.stream_shows else "0",
+        }
+        if args.workers:
+            env["PARSE_WORKERS"] = str(args.workers)
+        server = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "uvicorn",
+                "main:app",
+                f"--port={args.api_port}",
+                "--log-level=warning",
+            ],
+            cwd=workdir,
+            env=env,
+        )
+        api_url = f"http://127.0.0.1:{args.api_port}"
+        try:
+            await wait_port(f"{api_url}/pool_stats")
+            (cpu_before, _) = server_usage(server.pid)
+            timer = Timer()
+            async with ClientSession(timeout=ClientTimeout(total=None)) as session:
+                async with session.get(
+                    f"{api_url}/batch_snatch_pages",
+                    params={
+                        "page_from": pages[0],
+                        "page_to": pages[-1],
+                        "as_shows": "true",
+                        "include_none": "true",
+                        "concurrent": args.concurrent,
+                    },
+                ) as response:
+                    data = json.loads(await response.read())
+            elapsed = timer.elapsed
+            cpu_after, rss_mib = server_usage(server.pid)
+        finally:
+            stop(server)
+
+    results = data["result"]
+    return RunStats(
+        count=len(results),
+        failed=sum(1 for res in results if res["show"] is None),
+        elapsed=elapsed,
+        latencies=[res["request_result"]["time"] for res in results],
+        cpu=tuple(after - before for after, before in zip(cpu_after, cpu_before)),
+        rss_mib=rss_mib,
+    )
+
+
+async def main(args: argparse.Namespace) -> None:
+    base_url = f"http://127.0.0.1:{args.standin_port}"
+    snatcher.SHOW_URL_BASE = base_url
+    snatcher.PAGE_URL_BASE = f"{base_url}/lists/movies"
+    snatcher.STREAM_SHOW_PAGES = args.stream_shows
+    pages = list(range(1, args.pages + 1))
+
+    standin = start_standin(args)
+    try:
+        await wait_port(f"{base_url}/_stats")
+        print(
+            f"stand-in latency {args.latency}s, errors {args.error_rate}, "
+            f"429 {args.throttle_rate}; {args.pages} pages, "
+            f"concurrent {args.concurrent}, executor {args.executor}, "
+            f"stream shows {args.stream_shows}"
+        )
+        for scenario in args.scenarios:
+            if scenario == "api":
+                stats = await run_api(args, base_url, pages)
+            else:
+                stats = await run_library(args, scenario, pages)
+            print(stats.report(scenario), flush=True)
+    finally:
+        stop(standin)
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--fixtures", type=Path, default=Path("bench/fixtures"))
+    arg_parser.add_argument("--pages", type=int, default=10)
+    arg_parser.add_argument("--concurrent", type=int, default=10)
+    arg_parser.add_argument("--executor", default="process")
+    arg_parser.add_argument("--workers", type=int, default=None)
+    arg_parser.add_argument("--latency", type=float, default=0.05)
+    arg_parser.add_argument("--error-rate", type=float, default=0.0)
+    arg_parser.add_argument("--throttle-rate", type=float, default=0.0)
+    arg_parser.add_argument("--standin-port", type=int, default=8765)
+    arg_parser.add_argument("--api-port", type=int, default=8766)
+    arg_parser.add_argument(
+        "--stream-shows", action="store_true", help="KP_STREAM_SHOW_PAGES=1"
+    )
+    arg_parser.add_argument(
+        "--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS)
+    )
+    args = arg_parser.parse_args()
+    args.fixtures = args.fixtures.resolve()
+
+    asyncio.run(main(args))
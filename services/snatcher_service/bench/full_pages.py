@@ -0,0 +1,315 @@
+"""
+Страницы Кинопоиска реального размера (сотни КБ) из маленьких фикстур
+`bench/fixtures`: содержимое `<body>` фикстуры вставляется в типичное
+окружение страницы сайта - встроенные стили и скрипты, шапка с иконками,
+актеры, рецензии, награды, похожие фильмы, подвал и JSON состояния приложения
+в конце страницы. На странице списка к карточкам фикстуры добавляются
+карточки до 50 на странице.\n
+Сохраненных страниц сайта в репозитории нет (в рецензиях и профилях -
+данные пользователей), поэтому окружение генерируется детерминированно
+из `--seed`; поля и результат разбора страницы фильма/сериала - как
+у исходной фикстуры, у страницы списка - ее карточки первыми.\n
+Запуск из `services/snatcher_service`:
+`python -m bench.full_pages --src bench/fixtures --dst bench/fixtures_full`
+"""
+
+import argparse
+import json
+import random
+import re
+import string
+import zlib
+from pathlib import Path
+from typing import List
+
+from bench.parse_bench import FIXTURE_RE
+
+
+SYLLABLES = (
+    "ра ло ми не то ка ва ст пр ду зо ри ко мо ше ль ны го ве ре бе да"
+    " сна при тор вел жи ку"
+).split()
+NAMES = (
+    "root wrapper item link icon button container row column text image"
+    " badge label value section list poster info meta action"
+).split()
+BODY_RE = re.compile(r"<body>\n(?P<body>.*)</body>", re.S)
+# Карточек на странице списка, как на сайте
+PAGE_SIZE = 50
+
+
+def word(rng: random.Random) -> str:
+    return "".join(rng.choices(SYLLABLES, k=rng.randint(1, 4)))
+
+
+def ident(rng: random.Random) -> str:
+    return "".join(rng.choices(string.ascii_lowercase, k=rng.randint(1, 3)))
+
+
+def sentence(rng: random.Random, words: int) -> str:
+    return " ".join(word(rng) for _ in range(words)).capitalize() + "."
+
+
+def text(rng: random.Random, sentences: int) -> str:
+    return " ".join(sentence(rng, rng.randint(5, 16)) for _ in range(sentences))
+
+
+def css_class(rng: random.Random, name: str) -> str:
+    # Имена CSS-модулей, как в сборке сайта: styles_<имя>__<хеш>
+    suffix = "".join(rng.choices(string.ascii_letters + string.digits, k=5))
+    return f"styles_{name}__{suffix}"
+
+
+def styles(rng: random.Random, rules: int) -> str:
+    properties = [
+        "display:flex",
+        "align-items:center",
+        "margin:0 auto",
+        "padding:8px 16px",
+        "font-size:13px",
+        "line-height:18px",
+        "color:rgba(0,0,0,.6)",
+        "position:relative",
+        "overflow:hidden",
+        "transition:opacity .2s ease",
+    ]
+    return "".join(
+        f".{css_class(rng, rng.choice(NAMES))}"
+        f"{{{';'.join(rng.sample(properties, 4))}}}"
+        for _ in range(rules)
+    )
+
+
+def script(rng: random.Random, statements: int) -> str:
+    # Похоже на минифицированный бандл: короткие имена, много вызовов
+    return ";".join(
+        f"var {ident(rng)}{i}=function(e,t)"
+        f"{{return e.{ident(rng)}(t,{rng.randint(0, 999)})}}"
+        for i in range(statements)
+    )
+
+
+def icon(rng: random.Random) -> str:
+    path = " ".join(
+        f"{rng.choice('MLC')}{rng.uniform(0, 24):.3f} {rng.uniform(0, 24):.3f}"
+        for _ in range(rng.randint(20, 60))
+    )
+    return f'<svg width="24" height="24" viewBox="0 0 24 24"><path d="{path}Z"/></svg>'
+
+
+def wrap(rng: random.Random, inner: str, name: str, depth: int) -> str:
+    # Вложенные обертки компонентов, как в разметке сайта
+    for _ in range(depth):
+        inner = f'<div class="{css_class(rng, name)}">{inner}</div>'
+    return inner
+
+
+def header(rng: random.Random) -> str:
+    links = "".join(
+        f'<li class="{css_class(rng, "menuItem")}"><a href="/lists/{ident(rng)}/">'
+        f"{icon(rng)}<span>{word(rng).capitalize()}</span></a></li>"
+        for _ in range(30)
+    )
+    return (
+        f'<header class="{css_class(rng, "header")}">'
+        f"<nav><ul>{links}</ul></nav></header>"
+    )
+
+
+def cast(rng: random.Random) -> str:
+    people = "".join(
+        f'<li class="{css_class(rng, "person")}">'
+        + wrap(
+            rng,
+            f'<a href="/name/{rng.randint(1, 10**7)}/">'
+            + wrap(
+                rng,
+                f'<img src="/avatar/{rng.randint(1, 10**7)}.jpg" alt="">',
+                "photo",
+                2,
+            )
+            + f"<span>{word(rng).capitalize()} {word(rng).capitalize()}</span></a>"
+            f"<span>{word(rng)}</span>",
+            "personInfo",
+            3,
+        )
+        + "</li>"
+        for _ in range(80)
+    )
+    return (
+        f'<section class="{css_class(rng, "cast")}">'
+        f"<h2>В главных ролях</h2><ul>{people}</ul></section>"
+    )
+
+
+def actions(rng: random.Random) -> str:
+    return "".join(
+        f'<button class="{css_class(rng, "button")}" type="button">'
+        f"{icon(rng)}<span>{rng.randint(0, 999)}</span></button>"
+        for _ in range(3)
+    )
+
+
+def reviews(rng: random.Random) -> str:
+    items = "".join(
+        f'<article class="{css_class(rng, "review")}">'
+        + wrap(
+            rng,
+            f'<a href="/user/{rng.randint(1, 10**7)}/">'
+            f"{word(rng)}_{rng.randint(1, 9999)}</a>"
+            f"<time>{rng.randint(1, 28)}.{rng.randint(1, 12)}."
+            f"{rng.randint(2005, 2024)}</time>",
+            "author",
+            2,
+        )
+        + f'<p class="{css_class(rng, "reviewText")}">'
+        f"{text(rng, rng.randint(10, 30))}</p>"
+        + wrap(rng, actions(rng), "reviewActions", 2)
+        + "</article>"
+        for _ in range(25)
+    )
+    return (
+        f'<section class="{css_class(rng, "reviews")}">'
+        f"<h2>Рецензии зрителей</h2>{items}</section>"
+    )
+
+
+def similar(rng: random.Random) -> str:
+    cards = "".join(
+        wrap(
+            rng,
+            f'<a class="{css_class(rng, "cardLink")}"'
+            f' href="/film/{rng.randint(1, 10**7)}/">'
+            + wrap(
+                rng,
+                f'<img src="/poster/{rng.randint(1, 10**7)}.jpg" alt="">',
+                "poster",
+                2,
+            )
+            + f"<span>{sentence(rng, rng.randint(1, 4))}</span></a>"
+            f"<span>{rng.randint(1950, 2024)}, {word(rng)}</span>"
+            + wrap(rng, f"<span>{rng.uniform(1, 10):.1f}</span>", "rating", 1),
+            "card",
+            3,
+        )
+        for _ in range(60)
+    )
+    return (
+        f'<section class="{css_class(rng, "similar")}">'
+        f"<h2>Похожие</h2>{cards}</section>"
+    )
+
+
+def awards(rng: random.Random) -> str:
+    rows = "".join(
+        f'<tr class="{css_class(rng, "row")}">'
+        f"<td>{rng.randint(1950, 2024)}</td>"
+        f'<td><a href="/awards/{ident(rng)}/">{sentence(rng, 2)}</a></td>'
+        f"<td>{sentence(rng, rng.randint(2, 5))}</td>"
+        f'<td><a href="/name/{rng.randint(1, 10**7)}/">'
+        f"{word(rng).capitalize()}</a></td>"
+        f"</tr>"
+        for _ in range(120)
+    )
+    return (
+        f'<section class="{css_class(rng, "awards")}">'
+        f"<h2>Награды</h2><table><tbody>{rows}</tbody></table></section>"
+    )
+
+
+def list_cards(rng: random.Random, count: int) -> str:
+    # Та же разметка, что у карточек фикстуры `page_<N>.html`
+    cards = []
+    for _ in range(count):
+        show_type = rng.choice(("film", "series"))
+        show_id = rng.randint(1, 10**7)
+        cards.append(
+            f'  <div class="styles_content__2fRe6">\n'
+            f'    <div class="styles_poster__gJgwz">'
+            f'<img src="/poster/{show_id}.jpg" alt=""></div>\n'
+            f'    <a class="base-movie-main-info_link__K161e"'
+            f' href="/{show_type}/{show_id}/">\n'
+            f'      <span class="styles_mainTitle__IFQyZ">'
+            f"{sentence(rng, rng.randint(1, 4))}</span>\n"
+            f"    </a>\n"
+            f'    <span class="styles_secondaryText__PguYF">'
+            f"{rng.randint(1950, 2024)}, {rng.randint(80, 200)} мин.</span>\n"
+            f'    <div class="{css_class(rng, "rating")}">'
+            f"{icon(rng)}{icon(rng)}</div>\n"
+            f"  </div>\n"
+        )
+    return "".join(cards)
+
+
+def app_state(rng: random.Random, entities: int) -> str:
+    state = {
+        f"Film:{rng.randint(1, 10**7)}": {
+            "__typename": "Film",
+            "title": {"russian": sentence(rng, 3), "original": word(rng)},
+            "synopsis": text(rng, 3),
+            "rating": {"kp": {"value": round(rng.uniform(1, 10), 3)}},
+            "genres": [word(rng) for _ in range(3)],
+            "persons": [rng.randint(1, 10**7) for _ in range(10)],
+        }
+        for _ in range(entities)
+    }
+    data = json.dumps({"props": {"apolloState": state}}, ensure_ascii=False)
+    # `</` внутри строки JSON закрыл бы `<script>`
+    return data.replace("</", "<\\/")
+
+
+def render(name: str, content: str, seed: int) -> str:
+    """
+    Страница реального размера с `<body>` фикстуры `name`
+    """
+    match = FIXTURE_RE.match(Path(name).stem)
+    if match is None:
+        raise ValueError(f"Not a fixture name: {name}")
+    rng = random.Random(seed ^ zlib.crc32(name.encode()))
+    head, body = content.split("<body>\n", 1)[0], BODY_RE.search(content)["body"]
+    if match["page"]:
+        # Карточки фикстуры первыми, затем до `PAGE_SIZE` сгенерированных
+        boxes = body.count('class="styles_content__2fRe6')
+        closing = body.rindex("</div>")
+        body = body[:closing] + list_cards(rng, PAGE_SIZE - boxes) + body[closing:]
+        parts: List[str] = [header(rng), body, similar(rng)]
+    else:
+        parts = [
+            header(rng),
+            body,
+            cast(rng),
+            reviews(rng),
+            awards(rng),
+            similar(rng),
+        ]
+    head = head.replace(
+        "</head>",
+        f"<style>{styles(rng, 1200)}</style>"
+        f"<script>{script(rng, 600)}</script></head>",
+    )
+    footer = f'<footer class="{css_class(rng, "footer")}">{text(rng, 10)}</footer>'
+    state = (
+        f'<script id="__NEXT_DATA__" type="application/json">'
+        f"{app_state(rng, 300)}</script>"
+    )
+    return f"{head}<body>\n{''.join(parts)}{footer}{state}\n</body>\n</html>\n"
+
+
+def main(src: Path, dst: Path, seed: int) -> None:
+    dst.mkdir(parents=True, exist_ok=True)
+    for file in sorted(src.glob("*.html")):
+        if FIXTURE_RE.match(file.stem) is None:
+            continue
+        page = render(file.name, file.read_text(encoding="UTF-8"), seed)
+        (dst / file.name).write_text(page, encoding="UTF-8")
+        print(f"{file.name}: {len(page.encode()) / 1024:.0f} KiB")
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--src", type=Path, default=Path("bench/fixtures"))
+    arg_parser.add_argument("--dst", type=Path, default=Path("bench/fixtures_full"))
+    arg_parser.add_argument("--seed", type=int, default=0)
+    args = arg_parser.parse_args()
+
+    main(args.src, args.dst, args.seed)
@@ -0,0 +1,83 @@
+"""
+Стоимость вызова логгера в горячем пути (в потоке вызова), мкс/вызов:
+отфильтрованный по уровню debug с f-строкой и с ленивыми аргументами,
+синхронная запись и запись через очередь, повторяющееся предупреждение
+под ограничением частоты. Вывод идет в /dev/null.\n
+Запуск из `services/snatcher_service`:
+`python -m bench.log_bench --calls 100000`
+"""
+
+import os
+import argparse
+import logging
+from logging.handlers import QueueListener
+from queue import SimpleQueue
+from typing import Callable
+
+from common.logger import DeferredQueueHandler, Logger, LoggerLevel
+from common.timer import Timer
+
+
+URL = "https://www.kinopoisk.ru/lists/movies?sort=rating&page=17"
+
+
+def per_call(func: Callable[[int], None], calls: int) -> float:
+    timer = Timer()
+    for i in range(calls):
+        func(i)
+    return timer.elapsed / calls * 1e6
+
+
+def make_logger(name: str, handler: logging.Handler) -> logging.Logger:
+    logger = logging.getLogger(name)
+    logger.handlers = [handler]
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    return logger
+
+
+def main(calls: int) -> None:
+    filtered = Logger("BenchFiltered", LoggerLevel.INFO)
+
+    devnull = open(os.devnull, "w")
+    stream = logging.StreamHandler(devnull)
+    stream.setFormatter(logging.Formatter("%(levelname)-8s %(name)s: %(message)s"))
+    sync_logger = make_logger("BenchSync", stream)
+
+    queue_handler = DeferredQueueHandler(SimpleQueue())
+    listener = QueueListener(queue_handler.queue, stream)
+    listener.start()
+    queue_logger = make_logger("BenchQueue", queue_handler)
+
+    # Ограничение частоты встроено в `Logger.warning`, вывод - в очередь выше
+    limited_logger = Logger("BenchLimited")
+    make_logger("BenchLimited", queue_handler)
+
+    cases = {
+        "filtered debug, f-string": lambda i: filtered.debug(
+            f"Requesting GET {URL}, attempt {i}..."
+        ),
+        "filtered debug, lazy": lambda i: filtered.debug(
+            "Requesting %s %s, attempt %s...", "GET", URL, i
+        ),
+        "enabled, sync write": lambda i: sync_logger.warning(
+            "Status %s on GET %s", i, URL
+        ),
+        "enabled, queue": lambda i: queue_logger.warning("Status %s on GET %s", i, URL),
+        "repeated, rate-limited": lambda i: limited_logger.warning(
+            "Failed fetching rating for %s", i
+        ),
+    }
+    for name, func in cases.items():
+        print(f"{name:<26} {per_call(func, calls):.3f} us/call")
+
+    listener.stop()
+    devnull.close()
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--calls", type=int, default=100000)
+    args = arg_parser.parse_args()
+
+    main(args.calls)
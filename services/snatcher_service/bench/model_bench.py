@@ -0,0 +1,116 @@
+"""
+Стоимость сборки и сериализации результатов `/batch_snatch_pages`
+(as_shows) без сети, мс на `--shows` фильмов/сериалов:
+сборка `ShowDetails` -> `ShowModel` -> `SnatchShowResult` и ответ
+в JSON так, как его строит FastAPI для `-> Dict[str, Any]` (проверка
+и `dump_python(mode="json")` по аннотации, затем `json.dumps`
+в `JSONResponse`), против готовых байтов `main.batch_response()`.\n
+Запуск из `services/snatcher_service`:
+`python -m bench.model_bench --shows 10000`
+"""
+
+import json
+import argparse
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+from typing import Any, Callable, Dict, List, TypeVar
+
+from common.show_models import ShowDetails, ShowIdentifier, ShowModel, ShowType
+from common.timer import Timer
+from src.session import RequestResult
+from src.snatcher import SnatchShowResult
+
+
+T = TypeVar("T")
+
+DESCRIPTION = "Описание фильма, " * 20
+
+
+def best_ms(func: Callable[[], T], repeat: int) -> tuple[float, T]:
+    best = float("inf")
+    for _ in range(repeat):
+        timer = Timer()
+        result = func()
+        best = min(best, timer.elapsed)
+    return best * 1000, result
+
+
+def raw_fields(i: int) -> dict:
+    return {
+        "title": f"Фильм {i}",
+        "rating": 7.5 + i % 20 / 10,
+        "rating_count": 1000 + i,
+        "description": DESCRIPTION,
+        "genres": ["драма", "комедия"],
+    }
+
+
+def build_validated(shows: int) -> List[SnatchShowResult]:
+    results = []
+    for i in range(shows):
+        identifier = ShowIdentifier(id=i, type=ShowType.FILM)
+        details = ShowDetails(**raw_fields(i))
+        results.append(
+            SnatchShowResult(
+                identifier=identifier,
+                show=ShowModel(identifier=identifier, details=details),
+                request_result=RequestResult(
+                    content="<html></html>", url=f"film/{i}", status=200, time=0.1
+                ),
+            )
+        )
+    return results
+
+
+def build_trusted(shows: int) -> List[SnatchShowResult]:
+    results = []
+    for i in range(shows):
+        identifier = ShowIdentifier(id=i, type=ShowType.FILM)
+        details = ShowDetails.model_construct(**raw_fields(i))
+        results.append(
+            SnatchShowResult.model_construct(
+                identifier=identifier,
+                show=ShowModel.model_construct(identifier=identifier, details=details),
+                request_result=RequestResult(
+                    content="<html></html>", url=f"film/{i}", status=200, time=0.1
+                ),
+            )
+        )
+    return results
+
+
+def main(shows: int, repeat: int) -> None:
+    # Импорт здесь: main.py читает окружение при импорте
+    from main import SHOWS_ADAPTER, batch_response
+
+    build_ms, validated = best_ms(lambda: build_validated(shows), repeat)
+    print(f"{'build, validated':<30} {build_ms:>8.1f} ms")
+    build_ms, trusted = best_ms(lambda: build_trusted(shows), repeat)
+    print(f"{'build, model_construct':<30} {build_ms:>8.1f} ms")
+
+    fastapi_adapter = TypeAdapter(Dict[str, Any])
+
+    def fastapi_body() -> bytes:
+        payload = {"status": "ok", "mode": "shows", "result": validated}
+        content = fastapi_adapter.dump_python(
+            fastapi_adapter.validate_python(payload), mode="json"
+        )
+        return JSONResponse(content).body
+
+    old_ms, old_body = best_ms(fastapi_body, repeat)
+    print(f"{'serialize, FastAPI Dict[str, Any]':<30} {old_ms:>8.1f} ms")
+    new_ms, new_body = best_ms(
+        lambda: batch_response("ok", "shows", trusted, SHOWS_ADAPTER).body, repeat
+    )
+    print(f"{'serialize, TypeAdapter bytes':<30} {new_ms:>8.1f} ms")
+    same = json.loads(old_body) == json.loads(new_body)
+    print(f"response {len(new_body) / 1024:.0f} KiB, same content: {same}")
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--shows", type=int, default=10000)
+    arg_parser.add_argument("--repeat", type=int, default=5)
+    args = arg_parser.parse_args()
+
+    main(args.shows, args.repeat)
@@ -0,0 +1,69 @@
+"""
+Сравнение скорости разбора (страниц/с) inline и в пуле процессов
+на сохраненных HTML-фикстурах.\n
+Фикстуры: `page_<N>.html` для страниц списка и `<type>_<id>.html`
+для страниц фильмов/сериалов, например `film_435.html`.\n
+Запуск из `services/snatcher_service`:
+`python -m bench.parse_bench --fixtures bench/fixtures --rounds 20`
+"""
+
+import argparse
+import asyncio
+import re
+from asyncio import gather
+from pathlib import Path
+from typing import Any, Callable, List, Tuple
+
+from common.show_models import ShowIdentifier
+from common.timer import Timer
+from src.executor import ParseExecutor
+from src.parser import Parser
+
+
+FIXTURE_RE = re.compile(r"^(?:page_(?P<page>\d+)|(?P<type>film|series)_(?P<id>\d+))$")
+
+
+def load_fixtures(path: Path) -> List[Tuple[Callable[..., Any], tuple]]:
+    jobs: List[Tuple[Callable[..., Any], tuple]] = []
+    for file in sorted(path.glob("*.html")):
+        match = FIXTURE_RE.match(file.stem)
+        if match is None:
+            continue
+        content = file.read_text(encoding="UTF-8")
+        if match["page"]:
+            jobs.append((Parser.parse_page, (content, int(match["page"]))))
+        else:
+            identifier = ShowIdentifier(id=match["id"], type=match["type"])
+            jobs.append((Parser.parse_show, (content, identifier)))
+    return jobs
+
+
+async def run(executor: ParseExecutor, jobs: list, rounds: int) -> float:
+    # Прогрев: старт процессов пула и импорт модулей в них
+    await gather(*(executor.run(func, *args) for func, args in jobs))
+
+    timer = Timer()
+    for _ in range(rounds):
+        await gather(*(executor.run(func, *args) for func, args in jobs))
+    return len(jobs) * rounds / timer.elapsed
+
+
+async def main(fixtures: Path, rounds: int, workers: int | None) -> None:
+    jobs = load_fixtures(fixtures)
+    if not jobs:
+        raise SystemExit(f"No fixtures found in {fixtures}")
+
+    for kind in ("inline", "process"):
+        with ParseExecutor.create(kind, workers) as executor:
+            rate = await run(executor, jobs, rounds)
+        print(f"{kind:<8} {len(jobs)} fixtures x {rounds}: {rate:.1f} pages/s")
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--fixtures", type=Path, default=Path("bench/fixtures"))
+    arg_parser.add_argument("--rounds", type=int, default=10)
+    arg_parser.add_argument("--workers", type=int, default=None)
+    args = arg_parser.parse_args()
+
+    asyncio.run(main(args.fixtures, args.rounds, args.workers))
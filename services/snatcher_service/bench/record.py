@@ -0,0 +1,83 @@
+"""
+Однократная запись фикстур с настоящего сайта для `bench.standin`
+и `bench.parse_bench`: страницы списка `page_<N>.html` и первые
+`--shows` фильмов/сериалов с них (`<type>_<id>.html`).
+Запросы идут последовательно с паузой `--delay` секунд.\n
+Запуск из `services/snatcher_service`:
+`python -m bench.record --page-from 1 --page-to 3 --shows 30 --out bench/fixtures`
+"""
+
+import argparse
+import asyncio
+from pathlib import Path
+from typing import List
+
+from common.show_models import ShowIdentifier
+from src import snatcher
+from src.parser import Parser
+from src.session import SessionConfig, SessionManager
+
+
+def load_session_config(path: Path) -> SessionConfig:
+    if path.exists():
+        return SessionConfig.model_validate_json(path.read_text(encoding="UTF-8"))
+    return SessionConfig()
+
+
+async def main(
+    page_from: int, page_to: int, shows: int, out: Path, delay: float, config: Path
+) -> None:
+    out.mkdir(parents=True, exist_ok=True)
+    identifiers: List[ShowIdentifier] = []
+
+    async with SessionManager(load_session_config(config)) as sm:
+        for page in range(page_from, page_to + 1):
+            res = await sm.request(
+                snatcher.PAGE_URL_BASE,
+                method="GET",
+                params={"sort": "rating", "page": page},
+            )
+            sid_list = res.content and Parser.parse_page(res.content, page)
+            if not sid_list:
+                print(f"page {page}: failed (status {res.status}), skipped")
+            else:
+                (out / f"page_{page}.html").write_text(res.content, encoding="UTF-8")
+                identifiers.extend(sid_list)
+                print(f"page {page}: {len(sid_list)} identifiers")
+            await asyncio.sleep(delay)
+
+        for sid in identifiers[:shows]:
+            res = await sm.request(
+                f"{snatcher.SHOW_URL_BASE}/{sid.type.value}/{sid.id}", method="GET"
+            )
+            if res.content is None or Parser.parse_show(res.content, sid) is None:
+                print(f"{sid}: failed (status {res.status}), skipped")
+            else:
+                file = out / f"{sid.type.value}_{sid.id}.html"
+                file.write_text(res.content, encoding="UTF-8")
+                print(f"{sid}: saved")
+            await asyncio.sleep(delay)
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--page-from", type=int, default=1)
+    arg_parser.add_argument("--page-to", type=int, default=3)
+    arg_parser.add_argument("--shows", type=int, default=30)
+    arg_parser.add_argument("--out", type=Path, default=Path("bench/fixtures"))
+    arg_parser.add_argument("--delay", type=float, default=2.0)
+    arg_parser.add_argument(
+        "--config", type=Path, default=Path("config/session_config.json")
+    )
+    args = arg_parser.parse_args()
+
+    asyncio.run(
+        main(
+            args.page_from,
+            args.page_to,
+            args.shows,
+            args.out,
+            args.delay,
+            args.config,
+        )
+    )
@@ -0,0 +1,115 @@
+"""
+Обновление по устареванию (`src.refresh.plan_refresh`) против полного
+обхода по кругу при одном бюджете запросов, без сети: модель каталога,
+где у фильмов/сериалов разная и со временем меняющаяся скорость
+изменения (логнормальная, немного "трендовых").\n
+На каждом цикле оба способа тратят `--budget` запросов; после первого
+полного круга считается, сколько реального изменения (`index.drift`)
+находит один запрос и сколько его в среднем не снято по каталогу.\n
+Запуск из `services/snatcher_service`:
+`python -m bench.refresh_bench --shows 20000 --budget 500 --cycles 200`
+"""
+
+import argparse
+import random
+from typing import List, Optional, Tuple
+
+from common.show_models import ShowIdentifier, ShowType
+from common.timer import Timer
+from src.index import update_velocity
+from src.refresh import RefreshConfig, plan_refresh
+
+
+CYCLE_SECONDS = 3600.0
+
+
+class Catalogue:
+    """
+    Истинная скорость изменения каждого фильма/сериала и накопленное
+    с последней загрузки изменение
+    """
+
+    def __init__(self, shows: int, trending_share: float, seed: int):
+        self.random = random.Random(seed)
+        self.trending_share = trending_share
+        self.velocity = [self.draw_velocity() for _ in range(shows)]
+        self.pending = [0.0] * shows
+
+    def draw_velocity(self) -> float:
+        # Изменение в сутки: обычно доли процента, у "трендовых" - десятки
+        per_day = self.random.lognormvariate(-6, 1.5)
+        if self.random.random() < self.trending_share:
+            per_day *= 200
+        return per_day / 86400
+
+    def advance(self, seconds: float, churn: float) -> None:
+        for i, velocity in enumerate(self.velocity):
+            self.pending[i] += velocity * seconds * self.random.uniform(0.5, 1.5)
+            if self.random.random() < churn:
+                self.velocity[i] = self.draw_velocity()
+
+    def fetch(self, i: int) -> float:
+        observed, self.pending[i] = self.pending[i], 0.0
+        return observed
+
+
+def simulate(
+    args: argparse.Namespace, prioritized: bool
+) -> Tuple[List[float], List[float]]:
+    catalogue = Catalogue(args.shows, args.trending_share, args.seed)
+    identifiers = [ShowIdentifier(id=i, type=ShowType.FILM) for i in range(args.shows)]
+    fetched_at = [0.0] * args.shows
+    velocity: List[Optional[float]] = [None] * args.shows
+    config = RefreshConfig(budget=args.budget, min_interval=0)
+    sweep_position = 0
+    captured: List[float] = []
+    unrefreshed: List[float] = []
+    now = 0.0
+    for _ in range(args.cycles):
+        now += CYCLE_SECONDS
+        catalogue.advance(CYCLE_SECONDS, args.churn)
+        if prioritized:
+            planned, _ = plan_refresh(
+                zip(identifiers, fetched_at, velocity), now, config
+            )
+            chosen = [identifier.id for _, identifier in planned]
+        else:
+            chosen = [(sweep_position + n) % args.shows for n in range(args.budget)]
+            sweep_position = (sweep_position + args.budget) % args.shows
+        observed_total = 0.0
+        for i in chosen:
+            observed = catalogue.fetch(i)
+            observed_total += observed
+            velocity[i] = update_velocity(velocity[i], observed, now - fetched_at[i])
+            fetched_at[i] = now
+        captured.append(observed_total / len(chosen))
+        unrefreshed.append(sum(catalogue.pending))
+    return captured, unrefreshed
+
+
+def main(args: argparse.Namespace) -> None:
+    # Первые циклы приоритетный способ только узнает скорости
+    warmup = args.shows // args.budget
+    for name, prioritized in (("sweep", False), ("priority", True)):
+        timer = Timer()
+        captured, unrefreshed = simulate(args, prioritized)
+        captured, unrefreshed = captured[warmup:], unrefreshed[warmup:]
+        print(
+            f"{name:<10} drift per request {sum(captured) / len(captured):.5f}  "
+            f"unrefreshed drift mean {sum(unrefreshed) / len(unrefreshed):.1f} "
+            f"max {max(unrefreshed):.1f}  "
+            f"({timer.elapsed / args.cycles * 1000:.1f} ms/cycle)"
+        )
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--shows", type=int, default=20000)
+    arg_parser.add_argument("--budget", type=int, default=500)
+    arg_parser.add_argument("--cycles", type=int, default=200)
+    arg_parser.add_argument("--trending-share", type=float, default=0.02)
+    arg_parser.add_argument("--churn", type=float, default=0.001)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    args = arg_parser.parse_args()
+
+    main(args)
@@ -0,0 +1,104 @@
+"""
+`SessionPool` против одного `SessionManager` при ограничении частоты
+запросов на профиль (`rate_limit`): загрузка `--shows` фильмов/сериалов
+через `batch_snatch_shows` с локального стенда (`bench.standin`,
+в том же процессе). Профиль с cookie `profile=blocked` стенд встречает
+антибот-страницей: пул выводит его из работы и повторяет запрос
+через другой профиль.\n
+Запуск из `services/snatcher_service`:
+`python -m bench.session_pool_bench --fixtures bench/fixtures --shows 60 --rate 20`
+"""
+
+import argparse
+import asyncio
+from aiohttp import web
+from pathlib import Path
+from typing import List
+
+from common.show_models import ShowIdentifier
+from common.timer import Timer
+from bench.standin import Fixtures, StandinConfig, make_app
+from src import snatcher
+from src.session import SessionConfig, SessionManager
+from src.session_pool import Identity, SessionPool
+from src.snatcher import Snatcher
+
+
+SCENARIOS = {
+    "1 profile": ["a"],
+    "2 profiles + 1 blocked": ["a", "b", "blocked"],
+}
+
+CAPTCHA_PAGE = (
+    b"<html><body><form action='/checkcaptcha'>showcaptcha</form></body></html>"
+)
+
+
+@web.middleware
+async def block_profile(request: web.Request, handler) -> web.StreamResponse:
+    if request.cookies.get("profile") == "blocked":
+        return web.Response(body=CAPTCHA_PAGE, content_type="text/html")
+    return await handler(request)
+
+
+def make_pool(names: List[str], rate: float) -> SessionPool:
+    return SessionPool(
+        [
+            Identity(
+                name,
+                SessionManager(
+                    SessionConfig.model_validate(
+                        {
+                            "cookies": {"profile": name},
+                            "rate_limit": {"rate": rate, "burst": 1},
+                            "retry": {"attempts": 1},
+                        }
+                    )
+                ),
+            )
+            for name in names
+        ]
+    )
+
+
+async def main(args: argparse.Namespace) -> None:
+    app = make_app(Fixtures(args.fixtures), StandinConfig(latency=args.latency))
+    app.middlewares.append(block_profile)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", args.port).start()
+    snatcher.SHOW_URL_BASE = f"http://127.0.0.1:{args.port}"
+
+    identifiers = [ShowIdentifier(id=i, type="film") for i in range(args.shows)]
+    try:
+        for name, profiles in SCENARIOS.items():
+            async with make_pool(profiles, args.rate) as pool:
+                timer = Timer()
+                results = await Snatcher.batch_snatch_shows(
+                    pool, identifiers, args.concurrent
+                )
+                elapsed = timer.elapsed
+                requests = ", ".join(
+                    f"{state.name}={state.requests}" for state in pool.identity_states()
+                )
+            # Часть фикстур - неполные страницы, поэтому считаются ответы 200
+            ok = sum(res.request_result.status == 200 for res in results)
+            print(
+                f"{name:<24} {ok}/{len(results)} pages in {elapsed:.2f}s  "
+                f"requests: {requests}"
+            )
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--fixtures", type=Path, default=Path("bench/fixtures"))
+    arg_parser.add_argument("--shows", type=int, default=60)
+    arg_parser.add_argument("--rate", type=float, default=20.0)
+    arg_parser.add_argument("--concurrent", type=int, default=10)
+    arg_parser.add_argument("--latency", type=float, default=0.02)
+    arg_parser.add_argument("--port", type=int, default=8766)
+    args = arg_parser.parse_args()
+
+    asyncio.run(main(args))
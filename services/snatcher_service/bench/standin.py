@@ -0,0 +1,151 @@
+"""
+Локальный стенд Кинопоиска: отдает HTML-фикстуры (формат как в
+`bench.parse_bench`) по тем же путям, что и сайт, с настраиваемой
+задержкой, долей ошибок 500 и ответов 429 с `Retry-After`.\n
+Страница списка N берется из `page_N.html` (по кругу, если такой нет),
+страница фильма/сериала - из `<type>_<id>.html` или из любой другой
+фикстуры фильма/сериала по кругу.\n
+Запуск из `services/snatcher_service`:
+`python -m bench.standin --fixtures bench/fixtures --port 8765 --latency 0.05`,
+затем `KP_URL_BASE=http://127.0.0.1:8765` для snatcher_service
+"""
+
+import argparse
+import asyncio
+import random
+from aiohttp import web
+from pathlib import Path
+from pydantic import BaseModel
+from typing import Dict, List
+
+from bench.parse_bench import FIXTURE_RE
+
+
+class StandinConfig(BaseModel):
+    latency: float = 0.05
+    jitter: float = 0.5
+    error_rate: float = 0.0
+    throttle_rate: float = 0.0
+    retry_after: int = 1
+    seed: int = 0
+
+
+class Fixtures:
+    def __init__(self, path: Path):
+        self.pages: Dict[int, bytes] = {}
+        self.shows: Dict[str, bytes] = {}
+        for file in sorted(path.glob("*.html")):
+            match = FIXTURE_RE.match(file.stem)
+            if match is None:
+                continue
+            if match["page"]:
+                self.pages[int(match["page"])] = file.read_bytes()
+            else:
+                self.shows[f"{match['type']}/{match['id']}"] = file.read_bytes()
+        if not self.pages or not self.shows:
+            raise ValueError(f"Need both page and show fixtures in {path}")
+        self._page_list: List[bytes] = [self.pages[n] for n in sorted(self.pages)]
+        self._show_list: List[bytes] = list(self.shows.values())
+
+    def page(self, page: int) -> bytes:
+        return self.pages.get(page) or self._page_list[page % len(self._page_list)]
+
+    def show(self, show_type: str, show_id: int) -> bytes:
+        return (
+            self.shows.get(f"{show_type}/{show_id}")
+            or self._show_list[show_id % len(self._show_list)]
+        )
+
+
+class StandinStats(BaseModel):
+    requests: int = 0
+    errors: int = 0
+    throttled: int = 0
+    bytes_sent: int = 0
+
+
+def make_app(fixtures: Fixtures, config: StandinConfig) -> web.Application:
+    rng = random.Random(config.seed)
+    stats = StandinStats()
+
+    async def respond(body: bytes) -> web.Response:
+        stats.requests += 1
+        delay = config.latency * rng.uniform(1 - config.jitter, 1 + config.jitter)
+        await asyncio.sleep(max(0.0, delay))
+
+        roll = rng.random()
+        if roll < config.throttle_rate:
+            stats.throttled += 1
+            return web.Response(
+                status=429, headers={"Retry-After": str(config.retry_after)}
+            )
+        if roll < config.throttle_rate + config.error_rate:
+            stats.errors += 1
+            return web.Response(status=500)
+
+        stats.bytes_sent += len(body)
+        return web.Response(body=body, content_type="text/html", charset="utf-8")
+
+    async def list_page(request: web.Request) -> web.Response:
+        return await respond(fixtures.page(int(request.query.get("page", 1))))
+
+    async def show_page(request: web.Request) -> web.Response:
+        return await respond(
+            fixtures.show(request.match_info["type"], int(request.match_info["id"]))
+        )
+
+    async def get_stats(request: web.Request) -> web.Response:
+        return web.json_response(stats.model_dump())
+
+    app = web.Application()
+    app["stats"] = stats
+    app.router.add_get("/lists/movies", list_page)
+    app.router.add_get("/_stats", get_stats)
+    app.router.add_get(r"/{type:film|series}/{id:\d+}", show_page)
+    app.router.add_get(r"/{type:film|series}/{id:\d+}/", show_page)
+    return app
+
+
+async def start(
+    fixtures: Path, config: StandinConfig, host: str = "127.0.0.1", port: int = 8765
+) -> web.AppRunner:
+    runner = web.AppRunner(make_app(Fixtures(fixtures), config), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+async def serve(fixtures: Path, config: StandinConfig, host: str, port: int) -> None:
+    runner = await start(fixtures, config, host, port)
+    print(f"Stand-in serving {fixtures} on http://{host}:{port}", flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--fixtures", type=Path, default=Path("bench/fixtures"))
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=8765)
+    arg_parser.add_argument("--latency", type=float, default=0.05)
+    arg_parser.add_argument("--jitter", type=float, default=0.5)
+    arg_parser.add_argument("--error-rate", type=float, default=0.0)
+    arg_parser.add_argument("--throttle-rate", type=float, default=0.0)
+    arg_parser.add_argument("--retry-after", type=int, default=1)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    args = arg_parser.parse_args()
+
+    config = StandinConfig(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+    try:
+        asyncio.run(serve(args.fixtures, config, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
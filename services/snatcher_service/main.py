@@ -1,60 +1,283 @@
+import os
+import json
 import asyncio
 import aiofiles
 
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
-from typing import Any, Dict, List
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from pydantic import TypeAdapter
+from typing import Any, AsyncIterator, Dict, List, Literal, Optional
 
+from common.metrics import REGISTRY, monitor_loop_lag
 from common.show_models import *
 from src.session import SessionManager, SessionConfig
-from src.snatcher import Snatcher, SnatchResult
+from src.session_pool import SessionPool
+from src.snatcher import Snatcher, SnatchResult, SnatchShowResult, SnatchSIDsResult
+from src.executor import ParseExecutor
+from src.index import ShowChange, SnatchIndex
+from src.jobs import CrawlJob, CrawlJobSpec, JobManager
+from src.coordinator import (
+    Coordinator,
+    CoordinatorConfig,
+    CoordinatedWorker,
+    SharedRateLimiter,
+)
+from src.refresh import RefreshConfig, RefreshReport, RefreshScheduler
+from src.sink import SinkKind
+from src.limiter import AdaptiveLimiter, AdaptiveLimiterConfig, Limiter
+from src.metrics import CONCURRENCY_LIMIT, LOOP_LAG_SECONDS
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global sm
+    global sm, pe, index, jm, limiters, coordinator, refresher
 
-    async with aiofiles.open(
-        "config/session_config.json", mode="r", encoding="UTF-8"
-    ) as src:
-        session_config = SessionConfig.model_validate_json(await src.read())
+    # Очередь работ и ограничение частоты запросов, общие для всех процессов
+    # (`uvicorn --workers N`), иначе у каждого процесса свои
+    coordinator = (
+        Coordinator(
+            os.getenv("COORDINATOR_DB"),
+            CoordinatorConfig(
+                lease_seconds=float(os.getenv("COORDINATOR_LEASE_SECONDS", 120)),
+                batch=int(os.getenv("COORDINATOR_BATCH", 10)),
+                rate=float(os.getenv("COORDINATOR_RATE", 0)),
+                burst=int(os.getenv("COORDINATOR_BURST", 5)),
+            ),
+        )
+        if os.getenv("COORDINATOR_DB")
+        else None
+    )
+    # Без общего `rate` остается ограничение из настроек каждой сессии
+    shared_limiter = (
+        SharedRateLimiter(coordinator)
+        if coordinator and coordinator.config.rate > 0
+        else None
+    )
 
-    sm = SessionManager(session_config)
+    if os.getenv("SESSION_PROFILES"):
+        sm = SessionPool.load(os.getenv("SESSION_PROFILES"), limiter=shared_limiter)
+    else:
+        async with aiofiles.open(
+            "config/session_config.json", mode="r", encoding="UTF-8"
+        ) as src:
+            session_config = SessionConfig.model_validate_json(await src.read())
+        sm = SessionManager(session_config, limiter=shared_limiter)
+    pe = ParseExecutor.create(
+        kind=os.getenv("PARSE_EXECUTOR", "process"),
+        workers=int(os.getenv("PARSE_WORKERS", 0)) or None,
+    )
+    index = (
+        SnatchIndex(
+            os.getenv("SNATCH_INDEX"),
+            skip_unchanged=os.getenv("SNATCH_INDEX_SKIP_UNCHANGED", "0") != "0",
+        )
+        if os.getenv("SNATCH_INDEX")
+        else None
+    )
+    # Общие для всех запросов: состояние сервера одно на всех
+    limiter_config = AdaptiveLimiterConfig(
+        max=int(os.getenv("ADAPTIVE_MAX_CONCURRENT", 50))
+    )
+    limiters = {
+        "pages": AdaptiveLimiter(limiter_config),
+        "shows": AdaptiveLimiter(limiter_config),
+    }
+    jm = JobManager(
+        sm,
+        pe,
+        index,
+        limiters=limiters,
+        db_service_url=os.getenv("DB_SERVICE_URL", "http://db_service:8000"),
+        sink_dir=os.getenv("SINK_DIR", "data/sinks"),
+        jobs_dir=os.getenv("JOBS_DIR", "data/jobs"),
+        global_concurrent=int(os.getenv("CRAWL_GLOBAL_CONCURRENT", 20)),
+        max_finished=int(os.getenv("CRAWL_MAX_FINISHED_JOBS", 100)),
+    )
+    for job in jm.load_checkpoints():
+        jm.resume(job.id)
+    worker = (
+        CoordinatedWorker(coordinator, sm, pe, jm.make_sink, index)
+        if coordinator
+        else None
+    )
+    worker_task = asyncio.create_task(worker.run()) if worker else None
+    # Обновление уже загруженных по устареванию (нужен SNATCH_INDEX)
+    refresher = (
+        RefreshScheduler(
+            sm,
+            index,
+            pe,
+            jm.make_sink("refresh", SinkKind(os.getenv("REFRESH_SINK", "db"))),
+            RefreshConfig(
+                budget=int(os.getenv("REFRESH_BUDGET", 100)),
+                min_interval=float(os.getenv("REFRESH_MIN_INTERVAL", 3600)),
+                batch_size=int(os.getenv("REFRESH_BATCH_SIZE", 500)),
+            ),
+        )
+        if index is not None
+        else None
+    )
+    refresh_task = (
+        asyncio.create_task(refresher.run(float(os.getenv("REFRESH_INTERVAL"))))
+        if refresher and os.getenv("REFRESH_INTERVAL")
+        else None
+    )
+    lag_monitor = asyncio.create_task(monitor_loop_lag(LOOP_LAG_SECONDS))
     yield
-    sm.close_session()
+    lag_monitor.cancel()
+    if refresh_task is not None:
+        refresh_task.cancel()
+        await asyncio.gather(refresh_task, return_exceptions=True)
+    if refresher is not None:
+        await refresher.close()
+    if worker is not None:
+        worker_task.cancel()
+        await asyncio.gather(worker_task, return_exceptions=True)
+        await worker.close()
+        coordinator.close()
+    await jm.close()
+    await sm.close_session()
+    pe.close()
+    if index is not None:
+        index.close()
 
 
 app = FastAPI(lifespan=lifespan)
 
 
+def page_range(page_from: int, page_to: int) -> range:
+    return (
+        range(page_from, page_to + 1, 1)
+        if page_to > page_from
+        else range(page_from, page_to - 1, -1)
+    )
+
+
+def pick_limits(
+    concurrent: int, show_concurrent: Optional[int], adaptive: bool
+) -> tuple[int | Limiter, int | Limiter]:
+    if adaptive:
+        return limiters["pages"], limiters["shows"]
+    return concurrent, show_concurrent or concurrent
+
+
+@app.get("/limiters")
+async def limiter_state() -> Dict[str, Any]:
+    """
+    Текущие лимиты адаптивных ограничителей и история их изменений
+    """
+    return {name: limiter.state().model_dump() for name, limiter in limiters.items()}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics() -> PlainTextResponse:
+    for name, limiter in limiters.items():
+        CONCURRENCY_LIMIT.set(limiter.limit, limiter=name)
+    return PlainTextResponse(
+        REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@app.get("/pool_stats")
+async def pool_stats() -> Dict[str, Any]:
+    return sm.pool_stats().model_dump()
+
+
+@app.get("/sessions")
+async def sessions() -> List[Dict[str, Any]]:
+    """
+    Состояние профилей `SessionPool` (пусто для одной сессии)
+    """
+    if not isinstance(sm, SessionPool):
+        return []
+    return [state.model_dump() for state in sm.identity_states()]
+
+
+@app.get("/breaker_stats")
+async def breaker_stats() -> Dict[str, Any]:
+    return {host: stats.model_dump() for host, stats in sm.breaker_stats().items()}
+
+
+@app.get("/cache_stats")
+async def cache_stats() -> Dict[str, Any]:
+    if sm.cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **sm.cache.get_stats().model_dump()}
+
+
+# Ответы на тысячи результатов сериализуются сразу в байты заранее
+# собранными адаптерами, без проверки по аннотации и `json.dumps` в FastAPI
+SHOWS_ADAPTER = TypeAdapter(List[SnatchShowResult])
+PAGES_ADAPTER = TypeAdapter(List[SnatchSIDsResult])
+PAGE_ADAPTER = TypeAdapter(SnatchSIDsResult)
+CHANGES_ADAPTER = TypeAdapter(List[ShowChange])
+
+# full - все результаты, changed - только новые и изменившиеся,
+# delta - только `ShowChange` с изменившимися полями (нужен SNATCH_INDEX)
+ShowOutput = Literal["full", "changed", "delta"]
+
+
+def batch_response(
+    status: str, mode: str, result: Any, adapter: TypeAdapter
+) -> Response:
+    body = b'{"status":"%s","mode":"%s","result":%s}' % (
+        status.encode(),
+        mode.encode(),
+        adapter.dump_json(result),
+    )
+    return Response(body, media_type="application/json")
+
+
+def check_output(output: ShowOutput) -> None:
+    if output != "full" and index is None:
+        raise HTTPException(
+            status_code=400, detail=f"output={output} requires SNATCH_INDEX"
+        )
+
+
+def shows_response(
+    show_results: List[SnatchShowResult], output: ShowOutput
+) -> Response:
+    status = "ok" if show_results else "fail"
+    if output == "delta":
+        changes = [res.change for res in show_results if res.change and res.changed]
+        return batch_response(status, "delta", changes, CHANGES_ADAPTER)
+    if output == "changed":
+        show_results = [res for res in show_results if res.changed]
+    return batch_response(status, "shows", show_results, SHOWS_ADAPTER)
+
+
 @app.get("/snatch_page")
 async def snatch_page(
     page: int = 1,
     as_shows: bool = False,
     include_none: bool = False,
     concurrent: int = 5,
-) -> Dict[str, Any]:
-    page_result = await Snatcher.snatch_identifiers(sm, page)
+    freshness: float = 0.0,
+    adaptive: bool = False,
+    output: ShowOutput = "full",
+) -> Response:
+    check_output(output)
+    page_result = await Snatcher.snatch_identifiers(sm, page, pe)
 
     if as_shows and page_result.identifier_list:
+        _, show_limit = pick_limits(concurrent, None, adaptive)
         show_results = [
             show_res
             for show_res in await Snatcher.batch_snatch_shows(
-                sm, page_result.identifier_list, concurrent
+                sm, page_result.identifier_list, show_limit, pe, index, freshness
             )
             if include_none or show_res.show
         ]
-        return {
-            "status": "ok" if show_results else "fail",
-            "mode": "shows",
-            "result": show_results,
-        }
+        return shows_response(show_results, output)
 
-    return {
-        "status": "ok" if page_result.identifier_list else "fail",
-        "mode": "identifiers",
-        "result": page_result,
-    }
+    return batch_response(
+        "ok" if page_result.identifier_list else "fail",
+        "identifiers",
+        page_result,
+        PAGE_ADAPTER,
+    )
 
 
 @app.get("/batch_snatch_pages")
@@ -64,44 +287,261 @@ async def batch_snatch_pages(
     as_shows: bool = False,
     include_none: bool = False,
     concurrent: int = 5,
-) -> Dict[str, Any]:
-    page_list = list(
-        range(page_from, page_to + 1, 1)
-        if page_to > page_from
-        else range(page_from, page_to - 1, -1)
-    )
-    page_results = await Snatcher.batch_snatch_identifiers(sm, page_list, concurrent)
-
+    show_concurrent: Optional[int] = None,
+    freshness: float = 0.0,
+    adaptive: bool = False,
+    output: ShowOutput = "full",
+) -> Response:
+    check_output(output)
+    page_limit, show_limit = pick_limits(concurrent, show_concurrent, adaptive)
     if as_shows:
-        sid_list: List[ShowIdentifier] = []
-        for page_res in page_results:
-            if page_res.identifier_list:
-                sid_list += page_res.identifier_list
-
         show_results = [
-            show_res
-            for show_res in await Snatcher.batch_snatch_shows(sm, sid_list, concurrent)
-            if include_none or show_res.show
+            res
+            async for res in Snatcher.pipeline_snatch_pages(
+                sm,
+                page_range(page_from, page_to),
+                page_limit,
+                show_limit,
+                pe,
+                index=index,
+                freshness=freshness,
+            )
+            if isinstance(res, SnatchShowResult) and (include_none or res.show)
         ]
-        return {
-            "status": "ok" if show_results else "fail",
-            "mode": "shows",
-            "result": show_results,
-        }
+        return shows_response(show_results, output)
 
-    return {
-        "status": (
+    page_list = list(page_range(page_from, page_to))
+    page_results = await Snatcher.batch_snatch_identifiers(
+        sm, page_list, page_limit, pe
+    )
+    return batch_response(
+        (
             "ok"
             if any(page_res.identifier_list for page_res in page_results)
             else "fail"
         ),
-        "mode": "identifiers",
-        "result": [
+        "identifiers",
+        [
             page_res
             for page_res in page_results
             if include_none or page_res.identifier_list
         ],
-    }
+        PAGES_ADAPTER,
+    )
+
+
+def stream_event(kind: str, payload: str, fmt: Literal["ndjson", "sse"]) -> str:
+    line = f'{{"type":"{kind}","result":{payload}}}'
+    return f"event: {kind}\ndata: {line}\n\n" if fmt == "sse" else line + "\n"
+
+
+@app.get("/stream_snatch_pages")
+async def stream_snatch_pages(
+    page_from: int,
+    page_to: int,
+    as_shows: bool = False,
+    include_none: bool = False,
+    concurrent: int = 5,
+    show_concurrent: Optional[int] = None,
+    freshness: float = 0.0,
+    adaptive: bool = False,
+    format: Literal["ndjson", "sse"] = "ndjson",
+    output: ShowOutput = "full",
+) -> StreamingResponse:
+    """
+    Потоковый вариант `/batch_snatch_pages`: каждая страница и каждый
+    фильм/сериал отправляются отдельной строкой NDJSON (или событием SSE)
+    сразу после разбора, последняя строка - `{"type":"done",...}`.
+    С `output=delta` вместо фильмов/сериалов идут события `change`
+    """
+    check_output(output)
+
+    page_limit, show_limit = pick_limits(concurrent, show_concurrent, adaptive)
+
+    async def events() -> AsyncIterator[str]:
+        pages_ok = pages_failed = shows_ok = shows_failed = 0
+
+        if as_shows:
+            results = Snatcher.pipeline_snatch_pages(
+                sm,
+                page_range(page_from, page_to),
+                page_limit,
+                show_limit,
+                pe,
+                index=index,
+                freshness=freshness,
+            )
+        else:
+            results = Snatcher.iter_snatch_identifiers(
+                sm, page_range(page_from, page_to), page_limit, pe
+            )
+
+        async for res in results:
+            if isinstance(res, SnatchShowResult):
+                if res.show:
+                    shows_ok += 1
+                else:
+                    shows_failed += 1
+                if output == "delta":
+                    if res.change and res.changed:
+                        yield stream_event(
+                            "change", res.change.model_dump_json(), format
+                        )
+                elif (include_none or res.show) and (output == "full" or res.changed):
+                    yield stream_event("show", res.model_dump_json(), format)
+            else:
+                if res.identifier_list:
+                    pages_ok += 1
+                else:
+                    pages_failed += 1
+                if include_none or res.identifier_list:
+                    yield stream_event("page", res.model_dump_json(), format)
+
+        summary = {
+            "pages_ok": pages_ok,
+            "pages_failed": pages_failed,
+            "shows_ok": shows_ok,
+            "shows_failed": shows_failed,
+        }
+        yield stream_event("done", json.dumps(summary), format)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream" if format == "sse" else "application/x-ndjson",
+    )
+
+
+@app.post("/crawl")
+async def crawl(
+    page_from: int,
+    page_to: int,
+    concurrent: int = 5,
+    show_concurrent: Optional[int] = None,
+    freshness: float = 0.0,
+    sink: SinkKind = SinkKind.DB,
+    batch_size: int = 500,
+    flush_interval: float = 5.0,
+    adaptive: bool = False,
+    changed_only: bool = False,
+    coordinated: bool = False,
+) -> Dict[str, Any]:
+    """
+    Запускает обход в фоне, результаты пачками уходят в `sink`.
+    С `changed_only` в `sink` пишутся только новые и изменившиеся
+    с прошлой загрузки (нужен SNATCH_INDEX).
+    С `coordinated` обход делится между всеми процессами через
+    очередь COORDINATOR_DB (состояние - `/coordinator/jobs/{job_id}`)
+    """
+    if changed_only:
+        check_output("changed")
+    spec = CrawlJobSpec(
+        page_from=page_from,
+        page_to=page_to,
+        concurrent=concurrent,
+        show_concurrent=show_concurrent,
+        freshness=freshness,
+        sink=sink,
+        batch_size=batch_size,
+        flush_interval=flush_interval,
+        adaptive=adaptive,
+        changed_only=changed_only,
+    )
+    if coordinated:
+        if coordinator is None:
+            raise HTTPException(
+                status_code=400, detail="coordinated crawl requires COORDINATOR_DB"
+            )
+        return {"status": "ok", "job_id": await coordinator.add_job(spec)}
+    job = jm.submit(spec)
+    return {"status": "ok", "job_id": job.id}
+
+
+def get_job(job_id: str) -> CrawlJob:
+    job = jm.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+    return job
+
+
+@app.get("/crawl")
+async def crawl_list() -> List[Dict[str, Any]]:
+    return [job.summary() for job in jm.jobs.values()]
+
+
+@app.get("/crawl/{job_id}")
+async def crawl_status(job_id: str) -> Dict[str, Any]:
+    return get_job(job_id).summary()
+
+
+@app.delete("/crawl/{job_id}")
+async def crawl_cancel(job_id: str) -> Dict[str, Any]:
+    get_job(job_id)
+    return (await jm.cancel(job_id)).summary()
+
+
+@app.post("/crawl/{job_id}/resume")
+async def crawl_resume(job_id: str) -> Dict[str, Any]:
+    get_job(job_id)
+    try:
+        return jm.resume(job_id).summary()
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+def get_refresher() -> RefreshScheduler:
+    if refresher is None:
+        raise HTTPException(status_code=400, detail="refresh requires SNATCH_INDEX")
+    return refresher
+
+
+@app.post("/refresh")
+async def refresh(
+    budget: Optional[int] = None,
+    concurrent: Optional[int] = None,
+    min_interval: Optional[float] = None,
+) -> RefreshReport:
+    """
+    Один цикл обновления: `budget` запросов на самые устаревшие
+    из загруженных фильмов/сериалов. В отчете - снятое устаревание
+    на запрос в сравнении с полным обходом
+    """
+    scheduler = get_refresher()
+    config = scheduler.config.model_copy(
+        update={
+            name: value
+            for name, value in (
+                ("budget", budget),
+                ("concurrent", concurrent),
+                ("min_interval", min_interval),
+            )
+            if value is not None
+        }
+    )
+    return await scheduler.cycle(config)
+
+
+@app.get("/refresh")
+async def refresh_last() -> Optional[RefreshReport]:
+    return get_refresher().last_report
+
+
+def get_coordinator() -> Coordinator:
+    if coordinator is None:
+        raise HTTPException(status_code=404, detail="COORDINATOR_DB is not set")
+    return coordinator
+
+
+@app.get("/coordinator/jobs")
+async def coordinator_jobs() -> List[Dict[str, Any]]:
+    return [job.model_dump(mode="json") for job in await get_coordinator().jobs()]
+
+
+@app.get("/coordinator/jobs/{job_id}")
+async def coordinator_job(job_id: str) -> Dict[str, Any]:
+    job = await get_coordinator().job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+    return job.model_dump(mode="json")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,169 @@
+from asyncio import Event, Task, create_task, sleep, wait_for
+from asyncio import TimeoutError as AsyncTimeoutError
+from enum import Enum
+from pydantic import BaseModel
+from time import monotonic
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from common.logger import Logger
+
+
+class AntibotConfig(BaseModel):
+    """
+    Распознавание страниц капчи и circuit breaker на каждый хост.\n
+    Маркеры ищутся в первых `scan_bytes` байтах тела и в итоговом URL.
+    После `threshold` заблокированных ответов подряд хост закрывается:
+    запросы ждут (не дольше `wait_timeout`), пока пробный запрос
+    (`probe_url`, по умолчанию корень хоста) не вернет обычную страницу.
+    Пауза между пробами растет от `open_base` до `open_max`
+    """
+
+    enabled: bool = True
+    markers: List[str] = [
+        "showcaptcha",
+        "smartcaptcha",
+        "checkcaptcha",
+        "captcha-page",
+        "Вы не робот",
+    ]
+    scan_bytes: int = 65536
+    threshold: int = 3
+    open_base: float = 30.0
+    open_max: float = 600.0
+    wait_timeout: float = 900.0
+    probe_url: Optional[str] = None
+
+
+def detect_block(body: bytes, url: str, config: AntibotConfig) -> Optional[str]:
+    """
+    Возвращает найденный маркер антибот-страницы или None.
+    Поиск идет по байтам, без декодирования и разбора HTML
+    """
+    for marker in config.markers:
+        if marker in url:
+            return marker
+        if body.find(marker.encode(), 0, config.scan_bytes) != -1:
+            return marker
+    return None
+
+
+class BreakerState(Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+
+
+class BreakerStats(BaseModel):
+    state: BreakerState
+    consecutive_blocks: int
+    blocks: int
+    opened: int
+    probes: int
+    open_for: float
+
+
+logger = Logger("CircuitBreaker")
+
+
+class HostBreaker:
+    def __init__(self):
+        self.closed = Event()
+        self.closed.set()
+        self.consecutive_blocks = 0
+        self.blocks = 0
+        self.opened = 0
+        self.probes = 0
+        self.opened_at = 0.0
+        self.recovery: Optional[Task] = None
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker по хостам: при серии антибот-страниц приостанавливает
+    запросы к хосту и в фоне пробует восстановиться через `probe(host)`
+    (обновление cookies и пробный запрос)
+    """
+
+    def __init__(self, config: AntibotConfig, probe: Callable[[str], Awaitable[bool]]):
+        self.config = config
+        self.probe = probe
+        self._hosts: Dict[str, HostBreaker] = {}
+
+    def _get(self, host: str) -> HostBreaker:
+        if host not in self._hosts:
+            self._hosts[host] = HostBreaker()
+        return self._hosts[host]
+
+    async def wait(self, host: str) -> bool:
+        """
+        Ждет закрытия цепи для хоста, False - если не дождались
+        """
+        breaker = self._get(host)
+        if breaker.closed.is_set():
+            return True
+        try:
+            await wait_for(breaker.closed.wait(), self.config.wait_timeout)
+            return True
+        except AsyncTimeoutError:
+            return False
+
+    def record_success(self, host: str) -> None:
+        self._get(host).consecutive_blocks = 0
+
+    def record_block(self, host: str) -> None:
+        breaker = self._get(host)
+        breaker.blocks += 1
+        breaker.consecutive_blocks += 1
+        if (
+            breaker.closed.is_set()
+            and breaker.consecutive_blocks >= self.config.threshold
+        ):
+            breaker.closed.clear()
+            breaker.opened += 1
+            breaker.opened_at = monotonic()
+            logger.warning(
+                "Circuit for %s opened after %s blocked responses",
+                host,
+                breaker.consecutive_blocks,
+            )
+            breaker.recovery = create_task(self._recover(host, breaker))
+
+    async def _recover(self, host: str, breaker: HostBreaker) -> None:
+        delay = self.config.open_base
+        while True:
+            await sleep(delay)
+            breaker.probes += 1
+            logger.info("Probing %s, attempt %s", host, breaker.probes)
+            if await self.probe(host):
+                break
+            delay = min(delay * 2, self.config.open_max)
+            logger.warning("Probe of %s blocked, next in %.0fs", host, delay)
+
+        breaker.consecutive_blocks = 0
+        breaker.recovery = None
+        breaker.closed.set()
+        logger.info(
+            "Circuit for %s closed after %.0fs", host, monotonic() - breaker.opened_at
+        )
+
+    def stats(self) -> Dict[str, BreakerStats]:
+        now = monotonic()
+        return {
+            host: BreakerStats(
+                state=(
+                    BreakerState.CLOSED
+                    if breaker.closed.is_set()
+                    else BreakerState.OPEN
+                ),
+                consecutive_blocks=breaker.consecutive_blocks,
+                blocks=breaker.blocks,
+                opened=breaker.opened,
+                probes=breaker.probes,
+                open_for=0.0 if breaker.closed.is_set() else now - breaker.opened_at,
+            )
+            for host, breaker in self._hosts.items()
+        }
+
+    def close(self) -> None:
+        for breaker in self._hosts.values():
+            if breaker.recovery is not None:
+                breaker.recovery.cancel()
@@ -0,0 +1,208 @@
+import json
+import zlib
+from asyncio import to_thread
+from collections import OrderedDict
+from hashlib import sha1
+from pathlib import Path
+from pydantic import BaseModel
+from time import time
+from typing import Dict, Literal, Optional
+
+from common.logger import Logger
+
+
+CacheStatus = Literal["hit", "miss", "revalidated"]
+
+
+class CacheConfig(BaseModel):
+    """
+    Кэш ответов GET: LRU в памяти с ограничением по размеру
+    и (опционально) сжатое хранилище на диске.\n
+    В течение `ttl` секунд ответ отдается из кэша без запроса,
+    после - перепроверяется через `If-None-Match`/`If-Modified-Since`.
+    Записи старше `max_age` секунд удаляются
+    """
+
+    enabled: bool = False
+    ttl: float = 3600.0
+    max_age: float = 7 * 24 * 3600.0
+    memory_max_bytes: int = 64 * 2**20
+    disk_path: Optional[str] = None
+    disk_max_bytes: int = 1024 * 2**20
+    compress_level: int = 6
+
+
+class CachedResponse(BaseModel):
+    url: str
+    body: str
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    stored_at: float
+
+    @property
+    def size(self) -> int:
+        return len(self.body)
+
+    @property
+    def age(self) -> float:
+        return time() - self.stored_at
+
+    def conditional_headers(self) -> Dict[str, str]:
+        headers: Dict[str, str] = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class CacheStats(BaseModel):
+    hit: int = 0
+    miss: int = 0
+    revalidated: int = 0
+    bytes_saved: int = 0
+    memory_entries: int = 0
+    memory_bytes: int = 0
+
+
+logger = Logger("ResponseCache")
+
+
+class ResponseCache:
+    def __init__(self, config: Optional[CacheConfig] = None):
+        self.config = config or CacheConfig()
+        self.stats = CacheStats()
+        self._memory: OrderedDict[str, CachedResponse] = OrderedDict()
+        self._memory_bytes = 0
+        self._disk = Path(self.config.disk_path) if self.config.disk_path else None
+        self._puts = 0
+        if self._disk is not None:
+            self._disk.mkdir(parents=True, exist_ok=True)
+
+    def _disk_file(self, url: str) -> Path:
+        return self._disk / f"{sha1(url.encode()).hexdigest()}.z"
+
+    def _memory_put(self, entry: CachedResponse) -> None:
+        old = self._memory.pop(entry.url, None)
+        if old is not None:
+            self._memory_bytes -= old.size
+        if entry.size > self.config.memory_max_bytes:
+            return
+
+        self._memory[entry.url] = entry
+        self._memory_bytes += entry.size
+        while self._memory_bytes > self.config.memory_max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted.size
+
+    def _disk_read(self, url: str) -> Optional[CachedResponse]:
+        file = self._disk_file(url)
+        try:
+            data = zlib.decompress(file.read_bytes())
+        except FileNotFoundError:
+            return None
+        except zlib.error:
+            file.unlink(missing_ok=True)
+            return None
+
+        meta, body = data.split(b"\n", 1)
+        return CachedResponse(body=body.decode(), **json.loads(meta))
+
+    def _disk_write(self, entry: CachedResponse) -> None:
+        meta = entry.model_dump_json(exclude={"body"}).encode()
+        data = zlib.compress(
+            meta + b"\n" + entry.body.encode(), self.config.compress_level
+        )
+        file = self._disk_file(entry.url)
+        tmp = file.with_suffix(".tmp")
+        tmp.write_bytes(data)
+        tmp.replace(file)
+
+    def _disk_prune(self) -> None:
+        """
+        Удаляет устаревшие записи, затем самые старые сверх `disk_max_bytes`
+        """
+        files = []
+        total = 0
+        removed = 0
+        expire = time() - self.config.max_age
+        for file in self._disk.glob("*.z"):
+            stat = file.stat()
+            if stat.st_mtime < expire:
+                file.unlink(missing_ok=True)
+                removed += 1
+                continue
+            files.append((stat.st_mtime, stat.st_size, file))
+            total += stat.st_size
+
+        for _, size, file in sorted(files):
+            if total <= self.config.disk_max_bytes:
+                break
+            file.unlink(missing_ok=True)
+            removed += 1
+            total -= size
+
+        logger.debug("Pruned %s cached responses, %s bytes on disk", removed, total)
+
+    async def get(self, url: str) -> Optional[CachedResponse]:
+        entry = self._memory.get(url)
+        if entry is not None:
+            self._memory.move_to_end(url)
+        elif self._disk is not None:
+            entry = await to_thread(self._disk_read, url)
+            if entry is not None:
+                self._memory_put(entry)
+
+        if entry is not None and entry.age > self.config.max_age:
+            await self.drop(url)
+            return None
+        return entry
+
+    def is_fresh(self, entry: CachedResponse) -> bool:
+        return entry.age <= self.config.ttl
+
+    async def put(
+        self,
+        url: str,
+        body: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ) -> CachedResponse:
+        entry = CachedResponse(
+            url=url, body=body, etag=etag, last_modified=last_modified, stored_at=time()
+        )
+        self._memory_put(entry)
+        if self._disk is not None:
+            await to_thread(self._disk_write, entry)
+            self._puts += 1
+            if self._puts % 1000 == 0:
+                await to_thread(self._disk_prune)
+        return entry
+
+    async def refresh(self, entry: CachedResponse) -> CachedResponse:
+        """
+        Продлевает запись после ответа 304
+        """
+        return await self.put(entry.url, entry.body, entry.etag, entry.last_modified)
+
+    async def drop(self, url: str) -> None:
+        old = self._memory.pop(url, None)
+        if old is not None:
+            self._memory_bytes -= old.size
+        if self._disk is not None:
+            await to_thread(self._disk_file(url).unlink, missing_ok=True)
+
+    def count(
+        self, status: CacheStatus, entry: Optional[CachedResponse] = None
+    ) -> None:
+        setattr(self.stats, status, getattr(self.stats, status) + 1)
+        if entry is not None and status != "miss":
+            self.stats.bytes_saved += entry.size
+
+    def get_stats(self) -> CacheStats:
+        return self.stats.model_copy(
+            update={
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+            }
+        )
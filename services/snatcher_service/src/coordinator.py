@@ -0,0 +1,509 @@
+import os
+import socket
+import sqlite3
+from asyncio import (
+    FIRST_COMPLETED,
+    CancelledError,
+    Task,
+    create_task,
+    gather,
+    sleep,
+    to_thread,
+    wait,
+)
+from enum import Enum
+from pathlib import Path
+from pydantic import BaseModel
+from threading import Lock
+from time import monotonic, time
+from typing import Callable, Dict, Iterable, List, Optional, Set
+from uuid import uuid4
+
+from common.logger import Logger
+from common.show_models import ShowIdentifier, ShowModel
+from src.executor import ParseExecutor
+from src.index import SnatchIndex
+from src.jobs import CrawlJobSpec
+from src.session import SessionManager
+from src.sink import BatchWriter, Sink, SinkKind
+from src.snatcher import Snatcher, unique
+from src.throttle import HostRateLimiter
+
+
+class CoordinatorConfig(BaseModel):
+    """
+    `lease_seconds` - время, после которого невыполненная работа
+    снова выдается другому воркеру; `batch` - сколько работ воркер
+    берет за раз (оно же его число одновременных загрузок);
+    `rate`/`burst` - token bucket на хост, общий для всех воркеров
+    (при `rate` <= 0 общего ограничения нет, действует `rate_limit` сессии)
+    """
+
+    lease_seconds: float = 120.0
+    batch: int = 10
+    max_attempts: int = 3
+    poll_interval: float = 1.0
+    rate: float = 0.0
+    burst: int = 5
+
+
+class WorkKind(Enum):
+    PAGE = "page"
+    SHOW = "show"
+
+
+class WorkItem(BaseModel):
+    job_id: str
+    kind: WorkKind
+    key: str
+
+
+class CoordinatedJob(BaseModel):
+    id: str
+    spec: CrawlJobSpec
+    created_at: float
+    # (вид работы) -> (состояние) -> число работ
+    progress: Dict[str, Dict[str, int]] = {}
+
+
+logger = Logger("Coordinator")
+
+
+class Coordinator:
+    """
+    Очередь работ на SQLite, общая для процессов snatcher_service
+    (`uvicorn --workers N`) на одной машине: страницы и фильмы/сериалы
+    выдаются воркерам в аренду (`lease`), повторы одного фильма/сериала
+    в задаче отбрасываются при добавлении, общий token bucket
+    ограничивает частоту запросов всех воркеров к хосту.\n
+    Каждый процесс открывает свое соединение; синхронные вызовы sqlite
+    выполняются в отдельном потоке
+    """
+
+    def __init__(self, path: str | Path, config: Optional[CoordinatorConfig] = None):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.config = config or CoordinatorConfig()
+        self._lock = Lock()
+        # Транзакции открываются явно (BEGIN IMMEDIATE), timeout - ожидание
+        # блокировки записи, занятой другим процессом
+        self._conn = sqlite3.connect(
+            self.path, timeout=30.0, isolation_level=None, check_same_thread=False
+        )
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY, spec TEXT NOT NULL, created_at REAL NOT NULL);"
+                "CREATE TABLE IF NOT EXISTS work ("
+                " job_id TEXT NOT NULL, kind TEXT NOT NULL, key TEXT NOT NULL,"
+                " state TEXT NOT NULL DEFAULT 'pending', owner TEXT,"
+                " lease_until REAL NOT NULL DEFAULT 0,"
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " PRIMARY KEY (job_id, kind, key));"
+                "CREATE INDEX IF NOT EXISTS work_state ON work (state, lease_until);"
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                " host TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL,"
+                " paused_until REAL NOT NULL DEFAULT 0);"
+            )
+        logger.debug("Coordinator opened at %s", self.path)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _transaction(self, func: Callable[[sqlite3.Connection], object]):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = func(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    def _add_job(self, spec: CrawlJobSpec) -> str:
+        job_id = uuid4().hex
+
+        def add(conn: sqlite3.Connection) -> str:
+            conn.execute(
+                "INSERT INTO jobs (id, spec, created_at) VALUES (?, ?, ?)",
+                (job_id, spec.model_dump_json(), time()),
+            )
+            self._insert(conn, job_id, WorkKind.PAGE, map(str, spec.pages))
+            return job_id
+
+        return self._transaction(add)
+
+    @staticmethod
+    def _insert(
+        conn: sqlite3.Connection, job_id: str, kind: WorkKind, keys: Iterable[str]
+    ) -> int:
+        before = conn.total_changes
+        conn.executemany(
+            "INSERT OR IGNORE INTO work (job_id, kind, key) VALUES (?, ?, ?)",
+            ((job_id, kind.value, key) for key in keys),
+        )
+        return conn.total_changes - before
+
+    def _lease(self, owner: str, limit: int) -> List[WorkItem]:
+        now = time()
+
+        def lease(conn: sqlite3.Connection) -> List[WorkItem]:
+            # Истекшая аренда без оставшихся попыток - провал
+            conn.execute(
+                "UPDATE work SET state = 'failed'"
+                " WHERE state = 'leased' AND lease_until < ? AND attempts >= ?",
+                (now, self.config.max_attempts),
+            )
+            # Сначала фильмы/сериалы: очередь не растет быстрее, чем разбирается
+            rows = conn.execute(
+                "UPDATE work SET state = 'leased', owner = ?, lease_until = ?,"
+                " attempts = attempts + 1"
+                " WHERE rowid IN (SELECT rowid FROM work"
+                "  WHERE state = 'pending' OR (state = 'leased' AND lease_until < ?)"
+                "  ORDER BY kind = 'page', rowid LIMIT ?)"
+                " RETURNING job_id, kind, key",
+                (owner, now + self.config.lease_seconds, now, limit),
+            ).fetchall()
+            return [
+                WorkItem(job_id=row[0], kind=WorkKind(row[1]), key=row[2])
+                for row in rows
+            ]
+
+        return self._transaction(lease)
+
+    def _finish(self, items: List[WorkItem], ok: bool) -> None:
+        def finish(conn: sqlite3.Connection) -> None:
+            for item in items:
+                conn.execute(
+                    "UPDATE work SET state = CASE"
+                    "  WHEN ? THEN 'done'"
+                    "  WHEN attempts >= ? THEN 'failed'"
+                    "  ELSE 'pending' END,"
+                    " owner = NULL, lease_until = 0"
+                    " WHERE job_id = ? AND kind = ? AND key = ?",
+                    (
+                        ok,
+                        self.config.max_attempts,
+                        item.job_id,
+                        item.kind.value,
+                        item.key,
+                    ),
+                )
+
+        self._transaction(finish)
+
+    def _take_token(self, host: str) -> float:
+        rate, burst = self.config.rate, max(1, self.config.burst)
+
+        def take(conn: sqlite3.Connection) -> float:
+            now = time()
+            row = conn.execute(
+                "SELECT tokens, updated, paused_until FROM buckets WHERE host = ?",
+                (host,),
+            ).fetchone()
+            tokens, updated, paused_until = row or (float(burst), now, 0.0)
+            if now < paused_until:
+                return paused_until - now
+            if rate <= 0:
+                return 0.0
+            tokens = min(burst, tokens + (now - updated) * rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            conn.execute(
+                "INSERT INTO buckets (host, tokens, updated, paused_until)"
+                " VALUES (?, ?, ?, ?) ON CONFLICT(host) DO UPDATE SET"
+                " tokens = excluded.tokens, updated = excluded.updated",
+                (host, tokens, now, paused_until),
+            )
+            return wait
+
+        return self._transaction(take)
+
+    def _pause(self, host: str, delay: float) -> None:
+        until = time() + delay
+
+        def pause(conn: sqlite3.Connection) -> None:
+            conn.execute(
+                "INSERT INTO buckets (host, tokens, updated, paused_until)"
+                " VALUES (?, 0, ?, ?) ON CONFLICT(host) DO UPDATE SET"
+                " paused_until = max(paused_until, excluded.paused_until)",
+                (host, time(), until),
+            )
+
+        self._transaction(pause)
+
+    def _job(self, job_id: str) -> Optional[CoordinatedJob]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT spec, created_at FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            progress: Dict[str, Dict[str, int]] = {}
+            for kind, state, count in self._conn.execute(
+                "SELECT kind, state, count(*) FROM work WHERE job_id = ?"
+                " GROUP BY kind, state",
+                (job_id,),
+            ):
+                progress.setdefault(kind, {})[state] = count
+        return CoordinatedJob(
+            id=job_id,
+            spec=CrawlJobSpec.model_validate_json(row[0]),
+            created_at=row[1],
+            progress=progress,
+        )
+
+    def _job_ids(self) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute("SELECT id FROM jobs ORDER BY created_at")
+            return [row[0] for row in rows]
+
+    async def add_job(self, spec: CrawlJobSpec) -> str:
+        """
+        Добавляет задачу и работы по ее страницам, возвращает id задачи
+        """
+        return await to_thread(self._add_job, spec)
+
+    async def enqueue(self, job_id: str, kind: WorkKind, keys: Iterable[str]) -> int:
+        """
+        Добавляет работы, уже известные в задаче пропускаются.
+        Возвращает число добавленных
+        """
+        keys = list(keys)
+
+        def insert(conn: sqlite3.Connection) -> int:
+            return self._insert(conn, job_id, kind, keys)
+
+        return await to_thread(self._transaction, insert)
+
+    async def lease(self, owner: str, limit: int) -> List[WorkItem]:
+        return await to_thread(self._lease, owner, limit)
+
+    async def complete(self, items: List[WorkItem]) -> None:
+        if items:
+            await to_thread(self._finish, items, True)
+
+    async def fail(self, items: List[WorkItem]) -> None:
+        """
+        Возвращает работы в очередь, исчерпавшие попытки - помечает проваленными
+        """
+        if items:
+            await to_thread(self._finish, items, False)
+
+    async def take_token(self, host: str) -> float:
+        """
+        Берет токен хоста, возвращает 0 или сколько ждать до следующей попытки
+        """
+        return await to_thread(self._take_token, host)
+
+    async def pause(self, host: str, delay: float) -> None:
+        """
+        Приостанавливает запросы к хосту во всех воркерах
+        """
+        await to_thread(self._pause, host, delay)
+
+    async def job(self, job_id: str) -> Optional[CoordinatedJob]:
+        return await to_thread(self._job, job_id)
+
+    async def jobs(self) -> List[CoordinatedJob]:
+        return [await self.job(job_id) for job_id in await to_thread(self._job_ids)]
+
+
+class SharedRateLimiter(HostRateLimiter):
+    """
+    `HostRateLimiter` поверх token bucket `Coordinator`:
+    ограничение частоты общее для всех процессов
+    """
+
+    def __init__(self, coordinator: Coordinator):
+        super().__init__()
+        self.coordinator = coordinator
+        self._background: Set[Task] = set()
+
+    async def acquire(self, host: str) -> float:
+        started = monotonic()
+        # Пауза этого процесса действует сразу, еще до записи в общую таблицу
+        await super().acquire(host)
+        while (wait := await self.coordinator.take_token(host)) > 0:
+            await sleep(wait)
+        return monotonic() - started
+
+    def pause(self, host: str, delay: float) -> None:
+        super().pause(host, delay)
+        # Запись в SQLite - в фоне, не блокируя цикл событий
+        task = create_task(self.coordinator.pause(host, delay))
+        self._background.add(task)
+
+        def done(task: Task) -> None:
+            self._background.discard(task)
+            if not task.cancelled() and task.exception() is not None:
+                logger.warning("Failed pausing %s: %s", host, task.exception())
+
+        task.add_done_callback(done)
+
+
+def worker_name() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class CoordinatedWorker:
+    """
+    Цикл воркера: берет в аренду до `batch` работ, страницы превращает
+    в работы по фильмам/сериалам, фильмы/сериалы загружает и пишет
+    в `Sink` задачи. Работа по фильму/сериалу завершается только
+    после записи в `Sink`, иначе ее подберет другой воркер.\n
+    `BatchWriter` задачи (и его `Sink`, у `DBServiceSink` - своя сессия
+    aiohttp) закрывается, когда воркер простаивает или в задачу
+    `writer_idle` секунд ничего не писалось
+    """
+
+    def __init__(
+        self,
+        coordinator: Coordinator,
+        sm: SessionManager,
+        executor: ParseExecutor,
+        make_sink: Callable[[str, SinkKind], Sink],
+        index: Optional[SnatchIndex] = None,
+        name: Optional[str] = None,
+        writer_idle: float = 60.0,
+    ):
+        self.coordinator = coordinator
+        self.sm = sm
+        self.executor = executor
+        self.make_sink = make_sink
+        self.index = index
+        self.name = name or worker_name()
+        self._specs: Dict[str, CrawlJobSpec] = {}
+        self.writer_idle = writer_idle
+        self._writers: Dict[str, BatchWriter] = {}
+        # id задачи -> время последней записи в ее `BatchWriter`
+        self._writer_used: Dict[str, float] = {}
+        self._background: Set[Task] = set()
+
+    async def _spec(self, job_id: str) -> CrawlJobSpec:
+        if job_id not in self._specs:
+            job = await self.coordinator.job(job_id)
+            self._specs[job_id] = job.spec
+        return self._specs[job_id]
+
+    def _writer(self, job_id: str, spec: CrawlJobSpec) -> BatchWriter:
+        if job_id not in self._writers:
+
+            def on_written(batch: List[ShowModel]) -> None:
+                items = [
+                    WorkItem(
+                        job_id=job_id, kind=WorkKind.SHOW, key=str(show.identifier)
+                    )
+                    for show in batch
+                ]
+                task = create_task(self.coordinator.complete(items))
+                self._background.add(task)
+                task.add_done_callback(self._background.discard)
+
+            self._writers[job_id] = BatchWriter(
+                self.make_sink(job_id, spec.sink),
+                spec.batch_size,
+                spec.flush_interval,
+                spec.max_in_flight,
+                on_written=on_written,
+            )
+        self._writer_used[job_id] = monotonic()
+        return self._writers[job_id]
+
+    def _close_writers(self, idle: float = 0.0) -> None:
+        """
+        Закрывает в фоне `BatchWriter` задач без записей `idle` секунд:
+        из словаря он убирается сразу, новая запись создаст новый
+        """
+        now = monotonic()
+        for job_id, used in list(self._writer_used.items()):
+            if now - used < idle:
+                continue
+            del self._writer_used[job_id]
+            task = create_task(self._writers.pop(job_id).close())
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+
+    async def _page(self, item: WorkItem, spec: CrawlJobSpec) -> bool:
+        res = await Snatcher.snatch_identifiers(self.sm, int(item.key), self.executor)
+        if res.identifier_list is None:
+            return False
+        identifiers = list(unique(res.identifier_list))
+        if self.index is not None:
+            identifiers = await self.index.filter_stale(identifiers, spec.freshness)
+        added = await self.coordinator.enqueue(
+            item.job_id, WorkKind.SHOW, map(str, identifiers)
+        )
+        logger.debug(
+            "Page %s: %s shows, %s new in job", item.key, len(identifiers), added
+        )
+        await self.coordinator.complete([item])
+        return True
+
+    async def _show(self, item: WorkItem, spec: CrawlJobSpec) -> bool:
+        show_type, show_id = item.key.split("/")
+        identifier = ShowIdentifier(id=int(show_id), type=show_type)
+        res = await Snatcher.snatch_show(self.sm, identifier, self.executor, self.index)
+        if res.show is None:
+            return False
+        if spec.changed_only and not res.changed:
+            await self.coordinator.complete([item])
+        else:
+            await self._writer(item.job_id, spec).put(res.show)
+        return True
+
+    async def _process(self, item: WorkItem) -> None:
+        try:
+            spec = await self._spec(item.job_id)
+            handler = self._page if item.kind == WorkKind.PAGE else self._show
+            ok = await handler(item, spec)
+        except CancelledError:
+            raise
+        except Exception as e:
+            logger.error("Failed %s %s: %s", item.kind.value, item.key, e)
+            ok = False
+        if not ok:
+            await self.coordinator.fail([item])
+
+    async def run(self) -> None:
+        """
+        Держит в работе до `batch` работ: освободившиеся места
+        сразу занимаются новыми
+        """
+        logger.info("Worker %s started", self.name)
+        config = self.coordinator.config
+        running: Set[Task] = set()
+        try:
+            while True:
+                free = config.batch - len(running)
+                items = await self.coordinator.lease(self.name, free) if free else []
+                running.update(create_task(self._process(item)) for item in items)
+                if not running:
+                    # Пока работы нет, дописываем накопленное и закрываем `Sink`
+                    self._close_writers()
+                    await sleep(config.poll_interval)
+                    continue
+                _, running = await wait(
+                    running, timeout=config.poll_interval, return_when=FIRST_COMPLETED
+                )
+                self._close_writers(self.writer_idle)
+        finally:
+            for task in running:
+                task.cancel()
+
+    async def close(self) -> None:
+        """
+        Дописывает накопленные пачки. Незавершенные работы
+        вернутся в очередь по истечении аренды
+        """
+        self._close_writers()
+        # Закрытие `BatchWriter` добавляет задачи завершения работ
+        while self._background:
+            await gather(*self._background)
@@ -0,0 +1,70 @@
+import os
+from asyncio import get_running_loop
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Callable, Literal, Optional, TypeVar
+
+from common.logger import Logger
+
+
+T = TypeVar("T")
+
+logger = Logger("ParseExecutor")
+
+
+class ParseExecutor:
+    """
+    Исполнитель синхронного разбора HTML: принимает функцию парсера
+    и сырой контент, возвращает результат, не блокируя event loop.\n
+    Базовая реализация разбирает в текущем потоке (inline).
+    """
+
+    kind: str = "inline"
+
+    async def run(self, func: Callable[..., T], *args, **kwargs) -> T:
+        return func(*args, **kwargs)
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self) -> "ParseExecutor":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    @staticmethod
+    def create(
+        kind: Literal["inline", "process"] = "process",
+        workers: Optional[int] = None,
+    ) -> "ParseExecutor":
+        if kind == "process":
+            return ProcessParseExecutor(workers)
+        return InlineParseExecutor()
+
+
+class InlineParseExecutor(ParseExecutor):
+    kind = "inline"
+
+
+class ProcessParseExecutor(ParseExecutor):
+    """
+    Разбор в пуле процессов размером с число ядер.
+    Функция и аргументы должны быть picklable
+    (статические методы `Parser`, строки, модели pydantic).
+    """
+
+    kind = "process"
+
+    def __init__(self, workers: Optional[int] = None):
+        self.workers = workers or os.cpu_count() or 1
+        self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        logger.debug("Process pool started with %s workers", self.workers)
+
+    async def run(self, func: Callable[..., T], *args, **kwargs) -> T:
+        loop = get_running_loop()
+        return await loop.run_in_executor(self._pool, partial(func, *args, **kwargs))
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        logger.debug("Process pool closed")
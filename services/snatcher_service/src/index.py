@@ -0,0 +1,336 @@
+import sqlite3
+from asyncio import to_thread
+from enum import Enum
+from hashlib import sha1
+from pathlib import Path
+from pydantic import BaseModel
+from threading import Lock
+from time import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from common.logger import Logger
+from common.show_models import ShowIdentifier, ShowDetails, ShowModel
+
+
+logger = Logger("SnatchIndex")
+
+# Вес нового наблюдения в скользящей средней скорости изменения
+VELOCITY_SMOOTHING = 0.5
+
+
+def content_hash(details: ShowDetails) -> str:
+    return sha1(details.model_dump_json().encode()).hexdigest()
+
+
+class ShowChangeKind(Enum):
+    NEW = "new"
+    CHANGED = "changed"
+    UNCHANGED = "unchanged"
+
+
+class ShowChange(BaseModel):
+    """
+    Отличие от предыдущей загрузки: в `fields` - новые значения
+    изменившихся полей (для новых - все поля)
+    """
+
+    identifier: ShowIdentifier
+    kind: ShowChangeKind
+    fields: Dict[str, Any] = {}
+
+
+class IndexEntry(BaseModel):
+    fetched_at: float
+    content_hash: str
+    fragment_hash: Optional[str] = None
+    # Нет у записей, сделанных до появления колонки `details`
+    details: Optional[ShowDetails] = None
+    # Изменение `drift()` в секунду, нужны хотя бы две загрузки
+    velocity: Optional[float] = None
+
+
+def diff_details(
+    identifier: ShowIdentifier, previous: Optional[IndexEntry], details: ShowDetails
+) -> ShowChange:
+    if previous is None:
+        return ShowChange(
+            identifier=identifier, kind=ShowChangeKind.NEW, fields=details.model_dump()
+        )
+    if previous.content_hash == content_hash(details):
+        return ShowChange(identifier=identifier, kind=ShowChangeKind.UNCHANGED)
+    if previous.details is None:
+        return ShowChange(
+            identifier=identifier,
+            kind=ShowChangeKind.CHANGED,
+            fields=details.model_dump(),
+        )
+    return ShowChange(
+        identifier=identifier,
+        kind=ShowChangeKind.CHANGED,
+        fields={
+            name: value
+            for name, value in details
+            if getattr(previous.details, name) != value
+        },
+    )
+
+
+def drift(previous: ShowDetails, details: ShowDetails) -> float:
+    """
+    Насколько устарела прежняя загрузка: изменение рейтинга в баллах
+    плюс относительное изменение числа оценок
+    """
+    return abs(details.rating - previous.rating) + abs(
+        details.rating_count - previous.rating_count
+    ) / max(previous.rating_count, 1)
+
+
+def update_velocity(
+    velocity: Optional[float], observed: float, elapsed: float
+) -> Optional[float]:
+    """
+    Скользящая средняя скорости изменения по новому наблюдению
+    `observed` за `elapsed` секунд
+    """
+    if elapsed <= 0:
+        return velocity
+    rate = observed / elapsed
+    if velocity is None:
+        return rate
+    return VELOCITY_SMOOTHING * rate + (1 - VELOCITY_SMOOTHING) * velocity
+
+
+class SnatchIndex:
+    """
+    Персистентный индекс уже загруженных фильмов/сериалов (SQLite):
+    ключ `type/id`, время последней загрузки, последний `ShowDetails`,
+    его хеш, хеш исходного HTML полей (`Parser.fragment_hash`)
+    и скорость изменения между загрузками (`update_velocity`).
+    Флаг `unwritten` - изменение еще не записано в `Sink`
+    (`mark_unwritten`/`unwritten`), переживает перезапуск.\n
+    Позволяет пропускать фильмы/сериалы, загруженные недавно, и отдавать
+    только изменения с прошлой загрузки. С `skip_unchanged` страница
+    с прежним хешем HTML полей не разбирается повторно.
+    Синхронные вызовы sqlite выполняются в отдельном потоке
+    """
+
+    def __init__(self, path: str | Path, skip_unchanged: bool = False):
+        self.path = Path(path)
+        self.skip_unchanged = skip_unchanged
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS snatched ("
+                " key TEXT PRIMARY KEY,"
+                " fetched_at REAL NOT NULL,"
+                " content_hash TEXT NOT NULL,"
+                " fragment_hash TEXT,"
+                " details TEXT,"
+                " velocity REAL,"
+                " unwritten INTEGER NOT NULL DEFAULT 0"
+                ")"
+            )
+            columns = {
+                row[1] for row in self._conn.execute("PRAGMA table_info(snatched)")
+            }
+            added = {
+                "fragment_hash": "TEXT",
+                "details": "TEXT",
+                "velocity": "REAL",
+                "unwritten": "INTEGER NOT NULL DEFAULT 0",
+            }
+            for column, column_type in added.items():
+                if column not in columns:
+                    self._conn.execute(
+                        f"ALTER TABLE snatched ADD COLUMN {column} {column_type}"
+                    )
+        logger.debug("Index opened at %s", self.path)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _fresh_keys(self, keys: List[str], since: float) -> set[str]:
+        fresh: set[str] = set()
+        with self._lock:
+            # Ограничение sqlite на число параметров в запросе
+            for i in range(0, len(keys), 500):
+                chunk = keys[i : i + 500]
+                rows = self._conn.execute(
+                    "SELECT key FROM snatched WHERE fetched_at >= ? AND key IN "
+                    f"({','.join('?' * len(chunk))})",
+                    (since, *chunk),
+                )
+                fresh.update(row[0] for row in rows)
+        return fresh
+
+    def _lookup(self, key: str) -> Optional[IndexEntry]:
+        row = self._conn.execute(
+            "SELECT fetched_at, content_hash, fragment_hash, details, velocity"
+            " FROM snatched WHERE key = ?",
+            (key,),
+        ).fetchone()
+        if row is None:
+            return None
+        return IndexEntry(
+            fetched_at=row[0],
+            content_hash=row[1],
+            fragment_hash=row[2],
+            details=ShowDetails.model_validate_json(row[3]) if row[3] else None,
+            velocity=row[4],
+        )
+
+    def _locked_lookup(self, key: str) -> Optional[IndexEntry]:
+        with self._lock:
+            return self._lookup(key)
+
+    def _record(
+        self,
+        identifier: ShowIdentifier,
+        details: ShowDetails,
+        fragment_hash: Optional[str],
+    ) -> ShowChange:
+        key = str(identifier)
+        now = time()
+        with self._lock, self._conn:
+            previous = self._lookup(key)
+            change = diff_details(identifier, previous, details)
+            velocity = None
+            if previous is not None and previous.details is not None:
+                velocity = update_velocity(
+                    previous.velocity,
+                    drift(previous.details, details),
+                    now - previous.fetched_at,
+                )
+            self._conn.execute(
+                "INSERT INTO snatched"
+                " (key, fetched_at, content_hash, fragment_hash, details, velocity)"
+                " VALUES (?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT(key) DO UPDATE SET"
+                " fetched_at = excluded.fetched_at,"
+                " content_hash = excluded.content_hash,"
+                " fragment_hash = excluded.fragment_hash,"
+                " details = excluded.details,"
+                " velocity = excluded.velocity",
+                (
+                    key,
+                    now,
+                    content_hash(details),
+                    fragment_hash,
+                    details.model_dump_json(),
+                    velocity,
+                ),
+            )
+        return change
+
+    def _mark_unwritten(self, keys: List[Tuple[str, Optional[str]]]) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany(
+                # С хешем - снимается, только если запись не обновилась
+                "UPDATE snatched SET unwritten = ? WHERE key = ?"
+                " AND (? IS NULL OR content_hash = ?)",
+                [(int(hash is None), key, hash, hash) for key, hash in keys],
+            )
+
+    def _unwritten(self, limit: int) -> Tuple[List[Tuple[str, str]], int]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, details FROM snatched"
+                " WHERE unwritten = 1 AND details IS NOT NULL ORDER BY key LIMIT ?",
+                (limit,),
+            ).fetchall()
+            (total,) = self._conn.execute(
+                "SELECT count(*) FROM snatched WHERE unwritten = 1"
+            ).fetchone()
+        return rows, total
+
+    def _velocities(self) -> List[Tuple[str, float, Optional[float]]]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT key, fetched_at, velocity FROM snatched"
+            ).fetchall()
+
+    async def filter_stale(
+        self, identifiers: Iterable[ShowIdentifier], freshness: float
+    ) -> List[ShowIdentifier]:
+        """
+        Оставляет только те `ShowIdentifier`, что не загружались
+        последние `freshness` секунд
+        """
+        identifiers = list(identifiers)
+        if freshness <= 0 or not identifiers:
+            return identifiers
+
+        fresh = await to_thread(
+            self._fresh_keys, [str(sid) for sid in identifiers], time() - freshness
+        )
+        if fresh:
+            logger.debug("Skipping %s recently snatched shows", len(fresh))
+        return [sid for sid in identifiers if str(sid) not in fresh]
+
+    async def velocities(
+        self,
+    ) -> List[Tuple[ShowIdentifier, float, Optional[float]]]:
+        """
+        Все загруженные фильмы/сериалы: время последней загрузки
+        и скорость изменения (None после единственной загрузки)
+        """
+        rows = await to_thread(self._velocities)
+        entries = []
+        for key, fetched_at, velocity in rows:
+            show_type, show_id = key.split("/")
+            entries.append(
+                (ShowIdentifier(id=int(show_id), type=show_type), fetched_at, velocity)
+            )
+        return entries
+
+    async def mark_unwritten(self, identifiers: Iterable[ShowIdentifier]) -> None:
+        """
+        Отмечает изменения, которые еще нужно записать в `Sink`
+        """
+        await to_thread(self._mark_unwritten, [(str(sid), None) for sid in identifiers])
+
+    async def mark_written(self, shows: Iterable[ShowModel]) -> None:
+        """
+        Снимает отметку с записанных в `Sink`. Если с тех пор фильм/сериал
+        загружен заново с другими данными, отметка остается
+        """
+        await to_thread(
+            self._mark_unwritten,
+            [(str(show.identifier), content_hash(show.details)) for show in shows],
+        )
+
+    async def unwritten(self, limit: int) -> Tuple[List[ShowModel], int]:
+        """
+        До `limit` отмеченных `mark_unwritten` фильмов/сериалов
+        (последняя загрузка) и общее число отмеченных
+        """
+        rows, total = await to_thread(self._unwritten, limit)
+        shows = []
+        for key, details in rows:
+            show_type, show_id = key.split("/")
+            shows.append(
+                ShowModel(
+                    identifier=ShowIdentifier(id=int(show_id), type=show_type),
+                    details=ShowDetails.model_validate_json(details),
+                )
+            )
+        return shows, total
+
+    async def lookup(self, identifier: ShowIdentifier) -> Optional[IndexEntry]:
+        return await to_thread(self._locked_lookup, str(identifier))
+
+    async def record(
+        self,
+        identifier: ShowIdentifier,
+        details: ShowDetails,
+        fragment_hash: Optional[str] = None,
+    ) -> ShowChange:
+        """
+        Сохраняет загрузку и возвращает отличие от предыдущей
+        """
+        return await to_thread(self._record, identifier, details, fragment_hash)
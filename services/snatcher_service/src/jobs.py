@@ -0,0 +1,373 @@
+from asyncio import CancelledError, Semaphore, Task, create_task, sleep, to_thread
+from enum import Enum
+from pathlib import Path
+from pydantic import BaseModel, Field, computed_field
+from time import time
+from typing import Any, Dict, List, Optional, Set
+from uuid import uuid4
+
+from common.logger import Logger
+from common.show_models import ShowIdentifier
+from src.executor import ParseExecutor
+from src.index import SnatchIndex
+from src.limiter import AdaptiveLimiter
+from src.session import SessionManager, RequestResult
+from src.sink import (
+    BatchWriter,
+    DBServiceSink,
+    NDJSONFileSink,
+    NullSink,
+    Sink,
+    SinkKind,
+    SinkStats,
+)
+from src.snatcher import Snatcher, SnatchShowResult
+
+
+class CrawlJobSpec(BaseModel):
+    page_from: int
+    page_to: int
+    concurrent: int = 5
+    show_concurrent: Optional[int] = None
+    freshness: float = 0.0
+    sink: SinkKind = SinkKind.DB
+    batch_size: int = 500
+    flush_interval: float = 5.0
+    max_in_flight: int = 2
+    adaptive: bool = False
+    # В `Sink` только новые и изменившиеся фильмы/сериалы (по `SnatchIndex`)
+    changed_only: bool = False
+
+    @property
+    def pages(self) -> range:
+        if self.page_to > self.page_from:
+            return range(self.page_from, self.page_to + 1, 1)
+        return range(self.page_from, self.page_to - 1, -1)
+
+
+class CrawlJobStatus(Enum):
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+class CrawlJob(BaseModel):
+    """
+    Состояние задачи обхода, оно же контрольная точка на диске:
+    `completed_pages` и `pending` позволяют продолжить обход после сбоя.
+    Задача с незаписанными в `Sink` фильмами/сериалами (`pending`)
+    завершается как FAILED, `JobManager.resume` отправляет их заново
+    """
+
+    id: str = Field(default_factory=lambda: uuid4().hex)
+    spec: CrawlJobSpec
+    status: CrawlJobStatus = CrawlJobStatus.RUNNING
+    pages_done: int = 0
+    pages_failed: int = 0
+    shows_done: int = 0
+    shows_failed: int = 0
+    shows_unchanged: int = 0
+    completed_pages: Set[int] = Field(default_factory=set)
+    pending: Set[ShowIdentifier] = Field(default_factory=set)
+    sink_stats: SinkStats = Field(default_factory=SinkStats)
+    started_at: float = Field(default_factory=time)
+    run_started_at: float = Field(default_factory=time)
+    active_time: float = 0.0
+    resumes: int = 0
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+
+    @computed_field
+    @property
+    def elapsed(self) -> float:
+        if self.status == CrawlJobStatus.RUNNING:
+            return self.active_time + time() - self.run_started_at
+        return self.active_time
+
+    @computed_field
+    @property
+    def shows_per_sec(self) -> float:
+        return self.shows_done / self.elapsed if self.elapsed else 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Прогресс задачи без содержимого контрольной точки
+        """
+        return {
+            **self.model_dump(mode="json", exclude={"completed_pages", "pending"}),
+            "pages_completed": len(self.completed_pages),
+            "shows_pending": len(self.pending),
+        }
+
+
+class CappedSession:
+    """
+    Прокси `SessionManager` с общим для всех задач ограничением
+    на число одновременных запросов
+    """
+
+    def __init__(self, sm: SessionManager, limit: int):
+        self.sm = sm
+        self._sem = Semaphore(limit)
+
+    async def request(self, *args, **kwargs) -> RequestResult:
+        async with self._sem:
+            return await self.sm.request(*args, **kwargs)
+
+
+logger = Logger("JobManager")
+
+
+class JobManager:
+    """
+    Запускает обходы диапазонов страниц в фоне: результаты уходят
+    в `Sink` пачками, наружу возвращается только id задачи.\n
+    Состояние задач периодически сохраняется в `jobs_dir`, прерванные
+    задачи можно продолжить с контрольной точки. Все задачи делят
+    один `SessionManager` и общий лимит `global_concurrent`, с `adaptive`
+    в задании - еще и адаптивные `limiters` ("pages" и "shows").\n
+    В памяти остаются не больше `max_finished` завершенных задач,
+    более старые читаются из контрольных точек по запросу (`get`)
+    """
+
+    def __init__(
+        self,
+        sm: SessionManager,
+        executor: ParseExecutor,
+        index: Optional[SnatchIndex] = None,
+        db_service_url: str = "http://db_service:8000",
+        sink_dir: str | Path = "data/sinks",
+        jobs_dir: str | Path = "data/jobs",
+        global_concurrent: int = 20,
+        checkpoint_interval: float = 5.0,
+        limiters: Optional[Dict[str, AdaptiveLimiter]] = None,
+        max_finished: int = 100,
+    ):
+        self.session = CappedSession(sm, global_concurrent)
+        self.executor = executor
+        self.index = index
+        self.db_service_url = db_service_url
+        self.sink_dir = Path(sink_dir)
+        self.jobs_dir = Path(jobs_dir)
+        self.jobs_dir.mkdir(parents=True, exist_ok=True)
+        self.checkpoint_interval = checkpoint_interval
+        self.limiters = limiters or {}
+        self.max_finished = max_finished
+        self.jobs: Dict[str, CrawlJob] = {}
+        self._tasks: Dict[str, Task] = {}
+
+    def make_sink(self, name: str, kind: SinkKind) -> Sink:
+        """
+        `name` - имя файла для `SinkKind.NDJSON` (обычно id задачи)
+        """
+        if kind == SinkKind.DB:
+            return DBServiceSink(self.db_service_url)
+        if kind == SinkKind.NDJSON:
+            return NDJSONFileSink(self.sink_dir / f"{name}.ndjson")
+        return NullSink()
+
+    def _checkpoint_file(self, job_id: str) -> Path:
+        return self.jobs_dir / f"{job_id}.json"
+
+    def _write_checkpoint(self, job_id: str, data: str) -> None:
+        file = self._checkpoint_file(job_id)
+        tmp = file.with_suffix(".tmp")
+        tmp.write_text(data, encoding="UTF-8")
+        tmp.replace(file)
+
+    async def save_checkpoint(self, job: CrawlJob) -> None:
+        # Снимок делается в event loop, запись на диск - в отдельном потоке
+        await to_thread(self._write_checkpoint, job.id, job.model_dump_json())
+
+    def load_checkpoints(self) -> List[CrawlJob]:
+        """
+        Загружает сохраненные задачи, возвращает прерванные (в статусе running)
+        """
+        interrupted = []
+        for file in self.jobs_dir.glob("*.json"):
+            try:
+                job = CrawlJob.model_validate_json(file.read_text(encoding="UTF-8"))
+            except Exception as e:
+                logger.error("Failed loading checkpoint %s: %s", file, e)
+                continue
+            self.jobs.setdefault(job.id, job)
+            if job.status == CrawlJobStatus.RUNNING and job.id not in self._tasks:
+                interrupted.append(job)
+        logger.debug("Loaded %s jobs, %s interrupted", len(self.jobs), len(interrupted))
+        self._evict_finished()
+        return interrupted
+
+    def get(self, job_id: str) -> Optional[CrawlJob]:
+        """
+        Задача из памяти или, если она уже выгружена, из контрольной точки
+        """
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return job
+        file = self._checkpoint_file(job_id)
+        if not file.exists():
+            return None
+        try:
+            return CrawlJob.model_validate_json(file.read_text(encoding="UTF-8"))
+        except Exception as e:
+            logger.error("Failed loading checkpoint %s: %s", file, e)
+            return None
+
+    def _evict_finished(self) -> None:
+        finished = [
+            job
+            for job in self.jobs.values()
+            if job.status != CrawlJobStatus.RUNNING and job.id not in self._tasks
+        ]
+        if len(finished) <= self.max_finished:
+            return
+        finished.sort(key=lambda job: job.finished_at or 0.0)
+        for job in finished[: len(finished) - self.max_finished]:
+            del self.jobs[job.id]
+        logger.debug("Evicted %s finished jobs", len(finished) - self.max_finished)
+
+    def submit(self, spec: CrawlJobSpec) -> CrawlJob:
+        job = CrawlJob(spec=spec)
+        self.jobs[job.id] = job
+        self._start(job)
+        logger.info(
+            "Submitted job %s: pages %s-%s", job.id, spec.page_from, spec.page_to
+        )
+        return job
+
+    def resume(self, job_id: str) -> CrawlJob:
+        job = self.get(job_id)
+        if job is None:
+            raise KeyError(job_id)
+        self.jobs[job_id] = job
+        if job_id in self._tasks:
+            return job
+        if job.status == CrawlJobStatus.DONE:
+            raise ValueError(f"Job {job_id} is already done")
+
+        job.status = CrawlJobStatus.RUNNING
+        job.resumes += 1
+        job.error = None
+        job.finished_at = None
+        job.run_started_at = time()
+        self._start(job)
+        logger.info(
+            "Resumed job %s: %s pages done, %s shows pending",
+            job.id,
+            len(job.completed_pages),
+            len(job.pending),
+        )
+        return job
+
+    async def cancel(self, job_id: str) -> CrawlJob:
+        job = self.get(job_id)
+        if job is None:
+            raise KeyError(job_id)
+        task = self._tasks.get(job_id)
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except CancelledError:
+                pass
+        return job
+
+    def _start(self, job: CrawlJob) -> None:
+        self._tasks[job.id] = create_task(self._run(job))
+
+    async def _checkpoint_loop(self, job: CrawlJob) -> None:
+        while True:
+            await sleep(self.checkpoint_interval)
+            await self.save_checkpoint(job)
+
+    async def _run(self, job: CrawlJob) -> None:
+        spec = job.spec
+        writer = BatchWriter(
+            self.make_sink(job.id, spec.sink),
+            spec.batch_size,
+            spec.flush_interval,
+            spec.max_in_flight,
+            # Из `pending` фильм/сериал уходит только после записи в `Sink`
+            on_written=lambda batch: job.pending.difference_update(
+                show.identifier for show in batch
+            ),
+        )
+        writer.stats = job.sink_stats
+        page_limit = spec.concurrent
+        show_limit = spec.show_concurrent or spec.concurrent
+        if spec.adaptive and self.limiters:
+            page_limit, show_limit = self.limiters["pages"], self.limiters["shows"]
+
+        # Оставшиеся с прошлого запуска (в том числе незаписанные в `Sink`)
+        # пишутся заново, даже если с прошлой загрузки не изменились
+        resent = set(job.pending)
+        checkpointer = create_task(self._checkpoint_loop(job))
+        try:
+            async for res in Snatcher.pipeline_snatch_pages(
+                self.session,
+                [page for page in spec.pages if page not in job.completed_pages],
+                page_limit,
+                show_limit,
+                self.executor,
+                index=self.index,
+                freshness=spec.freshness,
+                identifier_list=list(job.pending),
+                on_enqueue=job.pending.update,
+            ):
+                if isinstance(res, SnatchShowResult):
+                    if (
+                        res.show
+                        and spec.changed_only
+                        and not res.changed
+                        and res.identifier not in resent
+                    ):
+                        job.shows_done += 1
+                        job.shows_unchanged += 1
+                        job.pending.discard(res.identifier)
+                    elif res.show:
+                        job.shows_done += 1
+                        await writer.put(res.show)
+                    else:
+                        job.shows_failed += 1
+                        job.pending.discard(res.identifier)
+                elif res.identifier_list:
+                    job.pages_done += 1
+                    job.completed_pages.add(res.page)
+                else:
+                    job.pages_failed += 1
+            job.status = CrawlJobStatus.DONE
+        except CancelledError:
+            job.status = CrawlJobStatus.CANCELLED
+            raise
+        except Exception as e:
+            logger.error("Job %s failed: %s", job.id, e)
+            job.status = CrawlJobStatus.FAILED
+            job.error = str(e)
+        finally:
+            checkpointer.cancel()
+            await writer.close()
+            if job.status == CrawlJobStatus.DONE and job.pending:
+                # Пачки не записались в `Sink`: задачу можно продолжить
+                job.status = CrawlJobStatus.FAILED
+                job.error = f"{len(job.pending)} shows were not written to the sink"
+            job.active_time += time() - job.run_started_at
+            job.finished_at = time()
+            await self.save_checkpoint(job)
+            self._tasks.pop(job.id, None)
+            logger.info("Job %s %s", job.id, job.status.value)
+            self._evict_finished()
+
+    async def close(self) -> None:
+        """
+        Останавливает задачи, не меняя их статус в контрольных точках:
+        после перезапуска они будут продолжены
+        """
+        for job_id, task in list(self._tasks.items()):
+            task.cancel()
+            try:
+                await task
+            except CancelledError:
+                pass
+            self.jobs[job_id].status = CrawlJobStatus.RUNNING
+            await self.save_checkpoint(self.jobs[job_id])
@@ -0,0 +1,200 @@
+from abc import ABC, abstractmethod
+from asyncio import Condition, Semaphore
+from collections import deque
+from contextlib import asynccontextmanager
+from math import floor
+from pydantic import BaseModel
+from time import monotonic, time
+from typing import AsyncContextManager, AsyncIterator, Deque, List, Optional
+
+from common.logger import Logger
+from src.session import RequestResult
+
+
+class Slot:
+    """
+    Занятое место в лимитере: через `report()` передается результат запроса
+    """
+
+    def __init__(self):
+        self.result: Optional[RequestResult] = None
+
+    def report(self, result: RequestResult) -> None:
+        self.result = result
+
+
+class Limiter(ABC):
+    """
+    Ограничитель числа одновременных запросов.
+    `capacity` - максимально возможный лимит (число обработчиков)
+    """
+
+    capacity: int
+
+    @abstractmethod
+    def slot(self) -> AsyncContextManager[Slot]:
+        """
+        Место для одного запроса: `async with limiter.slot() as slot`
+        """
+
+
+class FixedLimiter(Limiter):
+    def __init__(self, concurrent: int):
+        self.capacity = concurrent
+        self._sem = Semaphore(concurrent)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[Slot]:
+        async with self._sem:
+            yield Slot()
+
+
+def as_limiter(concurrent: "int | Limiter") -> Limiter:
+    return concurrent if isinstance(concurrent, Limiter) else FixedLimiter(concurrent)
+
+
+class AdaptiveLimiterConfig(BaseModel):
+    """
+    AIMD: каждый успешный быстрый ответ добавляет `increase / limit`
+    (то есть +`increase` за "окно" из `limit` ответов), ошибка или
+    задержка выше `latency_factor` * базовой (EWMA) умножает лимит
+    на `decrease_factor`, не чаще раза в `cooldown` секунд
+    """
+
+    initial: float = 5.0
+    min: int = 1
+    max: int = 50
+    increase: float = 1.0
+    decrease_factor: float = 0.5
+    latency_factor: float = 2.5
+    ewma_alpha: float = 0.1
+    cooldown: float = 2.0
+    history_size: int = 200
+
+
+class LimiterDecision(BaseModel):
+    at: float
+    old_limit: int
+    new_limit: int
+    reason: str
+    status: Optional[int] = None
+    latency: Optional[float] = None
+    baseline: Optional[float] = None
+
+
+class LimiterState(BaseModel):
+    limit: int
+    limit_exact: float
+    in_flight: int
+    baseline_latency: Optional[float]
+    successes: int
+    failures: int
+    history: List[LimiterDecision]
+
+
+logger = Logger("AdaptiveLimiter")
+
+
+class AdaptiveLimiter(Limiter):
+    """
+    Адаптивный лимит одновременных запросов (AIMD) по статусам
+    и задержкам из `RequestResult`. Хранит историю изменений лимита
+    """
+
+    def __init__(self, config: Optional[AdaptiveLimiterConfig] = None):
+        self.config = config or AdaptiveLimiterConfig()
+        self.capacity = self.config.max
+        self._limit = min(max(self.config.initial, self.config.min), self.config.max)
+        self._in_flight = 0
+        self._cond = Condition()
+        self._baseline: Optional[float] = None
+        self._last_decrease = 0.0
+        self._successes = 0
+        self._failures = 0
+        self.history: Deque[LimiterDecision] = deque(maxlen=self.config.history_size)
+
+    @property
+    def limit(self) -> int:
+        return max(self.config.min, floor(self._limit))
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[Slot]:
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._in_flight < self.limit)
+            self._in_flight += 1
+
+        slot = Slot()
+        try:
+            yield slot
+        finally:
+            if slot.result is not None:
+                self.feedback(slot.result)
+            async with self._cond:
+                self._in_flight -= 1
+                self._cond.notify_all()
+
+    def _set_limit(self, value: float, reason: str, result: RequestResult) -> None:
+        old = self.limit
+        self._limit = min(max(value, self.config.min), self.config.max)
+        if self.limit != old:
+            self.history.append(
+                LimiterDecision(
+                    at=time(),
+                    old_limit=old,
+                    new_limit=self.limit,
+                    reason=reason,
+                    status=result.status,
+                    latency=result.time,
+                    baseline=self._baseline,
+                )
+            )
+            logger.debug("Limit %s -> %s: %s", old, self.limit, reason)
+
+    def feedback(self, result: RequestResult) -> None:
+        # Ответы из кэша ничего не говорят о состоянии сервера
+        if result.cache == "hit":
+            return
+
+        # 304 на условный запрос - такой же ответ сервера, как и 200
+        ok = result.status == 200 or result.cache == "revalidated"
+        if not ok or result.blocked:
+            self._failures += 1
+            self._decrease(
+                "antibot page" if result.blocked else f"status {result.status}", result
+            )
+            return
+
+        self._successes += 1
+        if self._baseline is None:
+            self._baseline = result.time
+            return
+
+        if result.time > self._baseline * self.config.latency_factor:
+            self._decrease("latency spike", result)
+        else:
+            self._set_limit(
+                self._limit + self.config.increase / max(self._limit, 1.0),
+                "healthy",
+                result,
+            )
+
+        alpha = self.config.ewma_alpha
+        self._baseline = (1 - alpha) * self._baseline + alpha * result.time
+
+    def _decrease(self, reason: str, result: RequestResult) -> None:
+        now = monotonic()
+        if now - self._last_decrease < self.config.cooldown:
+            return
+        self._last_decrease = now
+        self._set_limit(self._limit * self.config.decrease_factor, reason, result)
+
+    def state(self) -> LimiterState:
+        return LimiterState(
+            limit=self.limit,
+            limit_exact=self._limit,
+            in_flight=self._in_flight,
+            baseline_latency=self._baseline,
+            successes=self._successes,
+            failures=self._failures,
+            history=list(self.history),
+        )
@@ -0,0 +1,39 @@
+from common.metrics import Counter, Gauge, Histogram
+
+
+REQUEST_SECONDS = Histogram(
+    "snatcher_request_seconds", "Time to response headers per HTTP attempt"
+)
+REQUESTS = Counter(
+    "snatcher_requests_total", "HTTP attempts by status (blocked - antibot page)"
+)
+DOWNLOADED_BYTES = Counter(
+    "snatcher_downloaded_bytes_total", "Decoded response body bytes"
+)
+TRUNCATED_BODIES = Counter(
+    "snatcher_truncated_bodies_total",
+    "Responses not read to the end: all needed fields already received",
+)
+PARSE_SECONDS = Histogram(
+    "snatcher_parse_seconds", "Parse time per page kind, including executor overhead"
+)
+PARSE_FAILURES = Counter(
+    "snatcher_parse_failures_total", "Fields not found while parsing, by KPTags field"
+)
+PARSE_SKIPPED = Counter(
+    "snatcher_parse_skipped_total", "Show pages not parsed: fields HTML unchanged"
+)
+SHOW_CHANGES = Counter(
+    "snatcher_show_changes_total", "Snatched shows by change since previous snatch"
+)
+LIMITER_WAIT_SECONDS = Histogram(
+    "snatcher_limiter_wait_seconds", "Time spent waiting for a concurrency slot"
+)
+CONCURRENCY_LIMIT = Gauge(
+    "snatcher_concurrency_limit", "Current limit of adaptive limiters"
+)
+LOOP_LAG_SECONDS = Histogram(
+    "snatcher_event_loop_lag_seconds",
+    "Event loop wake-up delay",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+)
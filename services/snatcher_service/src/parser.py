@@ -1,6 +1,9 @@
+import os
 import re
+from hashlib import sha1
 from bs4 import BeautifulSoup, Tag
-from typing import Optional
+from lxml import etree, html as lxml_html
+from typing import Dict, List, Optional, Tuple
 from enum import Enum
 
 from common.logger import Logger
@@ -10,10 +13,54 @@ from common.show_models import ShowIdentifier, ShowDetails
 REPLACE = {"\n": " ", "\xa0": " "}
 
 
+class ParserBackend(Enum):
+    BS4 = "bs4"
+    LXML = "lxml"
+
+
+DEFAULT_BACKEND = ParserBackend(os.getenv("PARSER_BACKEND", ParserBackend.LXML.value))
+
+
+def attrs_predicate(attrs: dict[str, str]) -> str:
+    """
+    XPath-условие, эквивалентное `attrs` в `BeautifulSoup.find`:
+    `class` сравнивается по отдельным классам, остальные атрибуты целиком
+    """
+    conditions = []
+    for k, v in attrs.items():
+        if k == "class":
+            conditions.append(
+                f"contains(concat(' ', normalize-space(@class), ' '), ' {v} ')"
+            )
+        else:
+            conditions.append(f"@{k}='{v}'")
+    return " and ".join(conditions)
+
+
+def attrs_match(element: etree._Element, attrs: dict[str, str]) -> bool:
+    for k, v in attrs.items():
+        value = element.get(k)
+        if value is None:
+            return False
+        if k == "class":
+            if v not in value.split():
+                return False
+        elif value != v:
+            return False
+    return True
+
+
 class TagDescriptor:
     def __init__(self, name: str, attrs_list: list[dict[str, str]]):
         self.name = name
         self.attrs_list = attrs_list
+        # Открывающий или закрывающий тег `name` в исходном HTML
+        self.tag_re = re.compile(rf"<(/?){name}[\s/>]")
+        # Предкомпилированные XPath по потомкам, по одному на вариант attrs
+        self.xpaths = [
+            etree.XPath(f"descendant::{name}[{attrs_predicate(attrs)}]")
+            for attrs in attrs_list
+        ]
 
 
 class KPTags(Enum):
@@ -37,6 +84,15 @@ class KPTags(Enum):
     SGenreBox = TagDescriptor(name="div", attrs_list=[{"data-tid": "28726596"}])
 
 
+SHOW_FIELDS = (
+    KPTags.STitle,
+    KPTags.SRating,
+    KPTags.SRatingCount,
+    KPTags.SDescription,
+    KPTags.SGenreBox,
+)
+
+
 def get_soup(text: str, soup_parser: str = "html.parser") -> BeautifulSoup:
     return BeautifulSoup(text, soup_parser)
 
@@ -59,97 +115,362 @@ def find_all_tags(
     return None
 
 
+def get_tree(text: str) -> etree._Element:
+    return lxml_html.document_fromstring(text)
+
+
+def find_element(
+    source: etree._Element, desc: TagDescriptor
+) -> Optional[etree._Element]:
+    for xpath in desc.xpaths:
+        elements = xpath(source)
+        if elements:
+            return elements[0]
+    return None
+
+
+def find_all_elements(
+    source: etree._Element, desc: TagDescriptor
+) -> Optional[list[etree._Element]]:
+    for xpath in desc.xpaths:
+        elements = xpath(source)
+        if elements:
+            return elements
+    return None
+
+
+class CompiledExtractor:
+    """
+    Извлекает элементы сразу для нескольких `KPTags` за один обход дерева:
+    дескрипторы сводятся в одно XPath-выражение, найденные элементы
+    раскладываются по полям с учетом порядка вариантов `attrs_list`
+    """
+
+    def __init__(self, fields: Tuple[KPTags, ...]):
+        self.fields = fields
+        clauses = [
+            f"(self::{field.value.name} and {attrs_predicate(attrs)})"
+            for field in fields
+            for attrs in field.value.attrs_list
+        ]
+        self._xpath = etree.XPath(f"descendant::*[{' or '.join(clauses)}]")
+
+    def extract(self, root: etree._Element) -> Dict[KPTags, etree._Element]:
+        # (поле) -> (индекс варианта attrs, первый элемент в порядке документа)
+        found: Dict[KPTags, Tuple[int, etree._Element]] = {}
+        for element in self._xpath(root):
+            for field in self.fields:
+                desc: TagDescriptor = field.value
+                if element.tag != desc.name:
+                    continue
+                for i, attrs in enumerate(desc.attrs_list):
+                    if field in found and found[field][0] <= i:
+                        break
+                    if attrs_match(element, attrs):
+                        found[field] = (i, element)
+                        break
+        return {field: element for field, (_, element) in found.items()}
+
+
+SHOW_EXTRACTOR = CompiledExtractor(SHOW_FIELDS)
+
+
+def extract_links_bs4(content: str) -> Optional[List[Optional[str]]]:
+    boxes = find_all_tags(get_soup(content), KPTags.PShowBox.value)
+    if boxes is None:
+        return None
+
+    links: List[Optional[str]] = []
+    for box in boxes:
+        link = find_tag(box, KPTags.PShowLink.value)
+        links.append(link.attrs.get("href") if link is not None else None)
+    return links
+
+
+def extract_links_lxml(content: str) -> Optional[List[Optional[str]]]:
+    boxes = find_all_elements(get_tree(content), KPTags.PShowBox.value)
+    if boxes is None:
+        return None
+
+    links: List[Optional[str]] = []
+    for box in boxes:
+        link = find_element(box, KPTags.PShowLink.value)
+        links.append(link.get("href") if link is not None else None)
+    return links
+
+
+def extract_show_bs4(content: str) -> Dict[KPTags, Optional[str | List[str]]]:
+    """
+    Возвращает сырой текст полей страницы, для `SGenreBox` - список жанров
+    """
+    soup = get_soup(content)
+    raw: Dict[KPTags, Optional[str | List[str]]] = {}
+    for field in SHOW_FIELDS:
+        tag = find_tag(soup, field.value)
+        if tag is None:
+            raw[field] = None
+        elif field is KPTags.SGenreBox:
+            raw[field] = [a.text for a in tag.find_all("a")]
+        else:
+            raw[field] = tag.text
+    return raw
+
+
+def extract_show_lxml(content: str) -> Dict[KPTags, Optional[str | List[str]]]:
+    elements = SHOW_EXTRACTOR.extract(get_tree(content))
+    raw: Dict[KPTags, Optional[str | List[str]]] = {}
+    for field in SHOW_FIELDS:
+        element = elements.get(field)
+        if element is None:
+            raw[field] = None
+        elif field is KPTags.SGenreBox:
+            raw[field] = [a.text_content() for a in element.iter("a")]
+        else:
+            raw[field] = element.text_content()
+    return raw
+
+
+def scan_element(
+    content: str, desc: TagDescriptor, values: List[str], pos: int = 0
+) -> Tuple[Optional[str], int, bool]:
+    """
+    Исходный HTML первого элемента `desc` с атрибутами `values`, найденного
+    не раньше `pos`, без построения дерева: поиск значения атрибута
+    и парного закрывающего тега.\n
+    Возвращает (HTML, позиция, открыт). Если элемент не найден, в дочитанном
+    позже `content` поиск можно продолжить с позиции; "открыт" - найден
+    открывающий тег, но не закрывающий
+    """
+    marker = values[0]
+    while (found := content.find(marker, pos)) >= 0:
+        start = content.rfind("<", 0, found)
+        open_end = content.find(">", found)
+        pos = found + len(marker)
+        if open_end < 0:
+            # Открывающий тег еще не дочитан
+            return None, found, False
+        opening = desc.tag_re.match(content, start) if start >= 0 else None
+        if (
+            opening is None
+            or opening[1]
+            or ">" in content[start:pos]
+            or not all(v in content[start:open_end] for v in values[1:])
+        ):
+            continue
+        # Закрывающий тег с учетом вложенных элементов с тем же именем
+        depth = 1
+        for tag in desc.tag_re.finditer(content, open_end):
+            depth += -1 if tag[1] else 1
+            if depth == 0:
+                end = content.find(">", tag.end() - 1) + 1
+                return content[start:end], end, False
+        return None, found, True
+    # Значение атрибута могло оборваться на конце `content`
+    return None, max(pos, len(content) - len(marker) + 1), False
+
+
+def element_source(content: str, desc: TagDescriptor) -> Optional[str]:
+    """
+    Исходный HTML первого элемента `desc` (варианты `attrs_list` по порядку)
+    """
+    for attrs in desc.attrs_list:
+        source, _, is_open = scan_element(content, desc, list(attrs.values()))
+        if source is not None or is_open:
+            return source
+    return None
+
+
+def fragment_hash(content: str) -> Optional[str]:
+    """
+    Хеш исходного HTML всех полей `SHOW_FIELDS`: совпадение с прошлой
+    загрузкой означает тот же `ShowDetails` без разбора страницы.
+    None, если какое-то поле не найдено
+    """
+    digest = sha1()
+    for field in SHOW_FIELDS:
+        source = element_source(content, field.value)
+        if source is None:
+            return None
+        digest.update(source.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class FieldsScan:
+    """
+    Проверка для `SessionManager.request(until=...)`: в прочитанном начале
+    страницы уже есть все элементы `fields` целиком. Тело просматривается
+    с места, где остановилась прошлая проверка, найденные поля больше
+    не ищутся, поэтому проверки по мере чтения стоят O(длины тела).
+    Поле считается найденным только по первому варианту `attrs_list`:
+    полный разбор (`find_tag`) берет его, где бы на странице он ни был,
+    поэтому другой вариант раньше него не позволяет остановить чтение.
+    Маркеры - ASCII, поэтому байты декодируются как latin-1, без учета
+    разрезанных символов UTF-8. Один объект - на один запрос: новое тело
+    (другой `bytearray`, например при повторе) начинает проверку заново
+    """
+
+    def __init__(self, fields: Tuple[KPTags, ...] = SHOW_FIELDS):
+        self.fields = fields
+        self._body: Optional[bytes | bytearray] = None
+
+    def _reset(self, body: bytes | bytearray) -> None:
+        self._body = body
+        self._text = ""
+        # (поле) -> позиция продолжения поиска первого варианта `attrs_list`
+        self._positions: Dict[KPTags, int] = {field: 0 for field in self.fields}
+
+    def _found(self, field: KPTags) -> bool:
+        desc: TagDescriptor = field.value
+        source, self._positions[field], _ = scan_element(
+            self._text, desc, list(desc.attrs_list[0].values()), self._positions[field]
+        )
+        return source is not None
+
+    def __call__(self, body: bytes | bytearray) -> bool:
+        if body is not self._body or len(body) < len(self._text):
+            self._reset(body)
+        self._text += body[len(self._text) :].decode("latin-1")
+        for field in list(self._positions):
+            if not self._found(field):
+                return False
+            del self._positions[field]
+        return True
+
+
+def show_fields_complete(body: bytes | bytearray) -> bool:
+    """
+    Однократная проверка `FieldsScan` для `SHOW_FIELDS`
+    """
+    return FieldsScan()(body)
+
+
+EXTRACT_LINKS = {
+    ParserBackend.BS4: extract_links_bs4,
+    ParserBackend.LXML: extract_links_lxml,
+}
+EXTRACT_SHOW = {
+    ParserBackend.BS4: extract_show_bs4,
+    ParserBackend.LXML: extract_show_lxml,
+}
+
+
 logger = Logger("Parser")
 
 
 class Parser:
+    """
+    Синхронный разбор страниц Кинопоиска.
+    Методы чистые и picklable, поэтому запускаются через `ParseExecutor`
+    как в текущем процессе, так и в пуле процессов.
+    """
+
     @staticmethod
-    async def parse_page(content: str, page: int) -> Optional[list[ShowIdentifier]]:
+    def parse_page(
+        content: str,
+        page: int,
+        backend: ParserBackend = DEFAULT_BACKEND,
+    ) -> Optional[list[ShowIdentifier]]:
         try:
-            logger.debug(f"Parsing page {page}...")
-            soup = get_soup(content)
-
-            boxes = find_all_tags(soup, KPTags.PShowBox.value)
-            if boxes is None:
-                logger.warning(f"Failed to find show boxes on page {page}")
+            logger.debug("Parsing page %s...", page)
+            links = EXTRACT_LINKS[backend](content)
+            if links is None:
+                logger.warning("Failed to find show boxes on page %s", page)
                 return None
 
             sid_list: list[ShowIdentifier] = []
-            for box in boxes:
-                link = find_tag(box, KPTags.PShowLink.value)
-                if link is None or "href" not in link.attrs:
-                    logger.warning(f"Abnormal show box on page {page}: {box.attrs}")
+            for i, href in enumerate(links):
+                if href is None:
+                    logger.warning("Abnormal show box #%s on page %s", i, page)
                     continue
 
-                show_type, show_id = link.attrs["href"][1:-1].split("/")
+                show_type, show_id = href[1:-1].split("/")
                 sid_list.append(ShowIdentifier(id=show_id, type=show_type))
 
-            logger.debug(f"Done parsing page {page}")
+            logger.debug("Done parsing page %s", page)
             return sid_list
 
         except Exception as e:
-            logger.error(f"Failed parsing page {page}: {e}")
+            logger.error("Failed parsing page %s: %s", page, e)
             return None
 
     @staticmethod
-    async def parse_show(
+    def parse_show(
         content: str,
         identifier: ShowIdentifier,
         allow_partial: bool = False,
+        backend: ParserBackend = DEFAULT_BACKEND,
     ) -> Optional[ShowDetails]:
+        return Parser.parse_show_report(content, identifier, allow_partial, backend)[0]
+
+    @staticmethod
+    def parse_show_report(
+        content: str,
+        identifier: ShowIdentifier,
+        allow_partial: bool = False,
+        backend: ParserBackend = DEFAULT_BACKEND,
+    ) -> Tuple[Optional[ShowDetails], List[str]]:
+        """
+        Как `parse_show()`, но дополнительно возвращает имена `KPTags`
+        ненайденных полей (строками, чтобы результат оставался picklable)
+        """
+        missing: List[str] = []
         try:
-            logger.debug(f"Parsing {identifier}")
-            soup = get_soup(content)
+            logger.debug("Parsing %s", identifier)
+            raw = EXTRACT_SHOW[backend](content)
 
-            title_tag = find_tag(soup, KPTags.STitle.value)
-            if title_tag:
-                title: str = title_tag.text.strip()
+            title_text = raw[KPTags.STitle]
+            if title_text is not None:
+                title: str = title_text.strip()
                 year_match = re.search(r"\s\(\d{4}\)$", title)
                 if year_match:
                     title = title[: year_match.start()]
             else:
-                logger.warning(f"Failed fetching title for {identifier}")
+                logger.warning("Failed fetching title for %s", identifier)
+                missing.append(KPTags.STitle.name)
                 title = None
 
-            rating_tag = find_tag(soup, KPTags.SRating.value)
-            if rating_tag and re.match(r"^\d+\.\d+$", rating_tag.text):
-                rating = float(rating_tag.text)
+            rating_text = raw[KPTags.SRating]
+            if rating_text is not None and re.match(r"^\d+\.\d+$", rating_text):
+                rating = float(rating_text)
             else:
-                logger.warning(f"Failed fetching rating for {identifier}")
+                logger.warning("Failed fetching rating for %s", identifier)
+                missing.append(KPTags.SRating.name)
                 rating = None
 
-            rating_count_tag = find_tag(soup, KPTags.SRatingCount.value)
-            if rating_count_tag:
-                rating_count = int(
-                    "".join(re.findall(r"(\d)\s?", rating_count_tag.text))
-                )
+            rating_count_text = raw[KPTags.SRatingCount]
+            if rating_count_text is not None:
+                rating_count = int("".join(re.findall(r"(\d)\s?", rating_count_text)))
             else:
-                logger.warning(f"Failed fetching rating count for {identifier}")
+                logger.warning("Failed fetching rating count for %s", identifier)
+                missing.append(KPTags.SRatingCount.name)
                 rating_count = None
 
-            description_tag = find_tag(soup, KPTags.SDescription.value)
-            if description_tag:
-                description = description_tag.text.strip()
+            description_text = raw[KPTags.SDescription]
+            if description_text is not None:
+                description = description_text.strip()
                 for k, v in REPLACE.items():
                     if k in description:
                         description = description.replace(k, v)
             else:
-                logger.warning(f"Failed fetching description for {identifier}")
+                logger.warning("Failed fetching description for %s", identifier)
+                missing.append(KPTags.SDescription.name)
                 description = None
 
-            genre_box = find_tag(soup, KPTags.SGenreBox.value)
-            if genre_box:
-                genre_tags = genre_box.find_all("a")
-                if genre_tags:
-                    genres = [tag.text.strip() for tag in genre_tags]
+            genre_texts = raw[KPTags.SGenreBox]
+            if genre_texts is not None:
+                if genre_texts:
+                    genres = [text.strip() for text in genre_texts]
                     if "слова" in genres:
                         genres.remove("слова")
                 else:
-                    logger.warning(f"Abnormal genre box in {identifier}")
+                    logger.warning("Abnormal genre box in %s", identifier)
                     genres = None
             else:
-                logger.warning(f"Failed fetching genres in {identifier}")
+                logger.warning("Failed fetching genres in %s", identifier)
                 genres = None
+            if genres is None:
+                missing.append(KPTags.SGenreBox.name)
 
             if not allow_partial and any(
                 field is None
@@ -157,15 +478,16 @@ class Parser:
             ):
                 raise LookupError(f"Couldn't fetch all fields for {identifier}")
 
-            logger.debug(f"Done parsing {identifier}")
-            return ShowDetails(
+            logger.debug("Done parsing %s", identifier)
+            details = ShowDetails(
                 title=title or "",
                 rating=rating or 0.0,
                 rating_count=rating_count or 0,
                 description=description or "",
                 genres=genres or [],
             )
+            return details, missing
 
         except Exception as e:
-            logger.error(f"Failed parsing {identifier}: {e}")
-            return None
+            logger.error("Failed parsing %s: %s", identifier, e)
+            return None, missing
@@ -0,0 +1,111 @@
+from aiohttp import ClientTimeout, TCPConnector, TraceConfig
+from pydantic import BaseModel
+from time import perf_counter
+from typing import Optional
+
+
+class ConnectorConfig(BaseModel):
+    """
+    Профиль пула соединений общей `ClientSession`.\n
+    `limit`/`limit_per_host` - 0 снимает ограничение,
+    `dns_cache_ttl` - None кэширует DNS без срока,
+    таймауты в секундах, None - без ограничения.
+    `compression` - согласовывать gzip/deflate с сервером
+    """
+
+    limit: int = 100
+    limit_per_host: int = 0
+    keepalive_timeout: float = 15.0
+    dns_cache_ttl: Optional[int] = 10
+    total_timeout: Optional[float] = 60.0
+    connect_timeout: Optional[float] = 10.0
+    read_timeout: Optional[float] = 30.0
+    compression: bool = True
+
+    def make_connector(self) -> TCPConnector:
+        return TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            use_dns_cache=True,
+            ttl_dns_cache=self.dns_cache_ttl,
+        )
+
+    def make_timeout(self) -> ClientTimeout:
+        return ClientTimeout(
+            total=self.total_timeout,
+            connect=self.connect_timeout,
+            sock_read=self.read_timeout,
+        )
+
+
+class PoolStats(BaseModel):
+    limit: int
+    limit_per_host: int
+    open: int
+    idle: int
+    acquired: int
+    waiting: int
+    created: int
+    reused: int
+    wait_count: int
+    wait_time_total: float
+    wait_time_max: float
+    wait_time_avg: float
+
+
+class PoolTracer:
+    """
+    Считает создание/переиспользование соединений и ожидание
+    свободного слота в пуле через трассировку aiohttp
+    """
+
+    def __init__(self):
+        self.created = 0
+        self.reused = 0
+        self.wait_count = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+        self.trace_config = TraceConfig()
+        self.trace_config.on_connection_queued_start.append(self._on_queued_start)
+        self.trace_config.on_connection_queued_end.append(self._on_queued_end)
+        self.trace_config.on_connection_create_end.append(self._on_create_end)
+        self.trace_config.on_connection_reuseconn.append(self._on_reuseconn)
+
+    async def _on_queued_start(self, session, ctx, params) -> None:
+        ctx.queued_at = perf_counter()
+
+    async def _on_queued_end(self, session, ctx, params) -> None:
+        waited = perf_counter() - ctx.queued_at
+        self.wait_count += 1
+        self.wait_time_total += waited
+        self.wait_time_max = max(self.wait_time_max, waited)
+
+    async def _on_create_end(self, session, ctx, params) -> None:
+        self.created += 1
+
+    async def _on_reuseconn(self, session, ctx, params) -> None:
+        self.reused += 1
+
+    def stats(self, connector: TCPConnector) -> PoolStats:
+        # Публичного API для состояния пула у aiohttp нет
+        idle = sum(len(conns) for conns in connector._conns.values())
+        acquired = len(connector._acquired)
+        waiting = sum(len(waiters) for waiters in connector._waiters.values())
+        return PoolStats(
+            limit=connector.limit,
+            limit_per_host=connector.limit_per_host,
+            open=idle + acquired,
+            idle=idle,
+            acquired=acquired,
+            waiting=waiting,
+            created=self.created,
+            reused=self.reused,
+            wait_count=self.wait_count,
+            wait_time_total=self.wait_time_total,
+            wait_time_max=self.wait_time_max,
+            wait_time_avg=(
+                self.wait_time_total / self.wait_count if self.wait_count else 0.0
+            ),
+        )
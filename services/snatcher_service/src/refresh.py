@@ -0,0 +1,218 @@
+import heapq
+from asyncio import sleep
+from pydantic import BaseModel, computed_field
+from statistics import median
+from time import time
+from typing import Iterable, List, Optional, Tuple
+
+from common.logger import Logger
+from common.show_models import ShowIdentifier
+from src.executor import ParseExecutor
+from src.index import SnatchIndex
+from src.session import SessionManager
+from src.sink import Sink
+from src.snatcher import INLINE_EXECUTOR, Snatcher
+
+
+# (ShowIdentifier, время последней загрузки, скорость изменения или None)
+Candidate = Tuple[ShowIdentifier, float, Optional[float]]
+
+
+class RefreshConfig(BaseModel):
+    """
+    `budget` - запросов на цикл; `min_interval` - не обновлять
+    загруженные раньше, чем столько секунд назад; `prior_velocity` -
+    скорость для фильмов/сериалов, загруженных один раз
+    (None - медиана известных); `min_velocity` - нижняя граница
+    скорости, чтобы не менявшиеся тоже со временем обновлялись;
+    `batch_size` - размер пачки записи в `sink`
+    """
+
+    budget: int = 100
+    concurrent: int = 5
+    min_interval: float = 3600.0
+    prior_velocity: Optional[float] = None
+    min_velocity: float = 1e-8
+    batch_size: int = 500
+
+
+class RefreshReport(BaseModel):
+    """
+    Итог цикла. Устаревание фильма/сериала - ожидаемое накопленное
+    изменение: скорость изменения на время с последней загрузки.
+    Полный обход снимает все устаревание за `tracked` запросов,
+    то есть в среднем `staleness_total / tracked` за запрос.
+    `unwritten` - изменения, которые не удалось записать в `sink`
+    (отмечены в `SnatchIndex`, повторяются в следующем цикле)
+    """
+
+    tracked: int
+    requests: int
+    failed: int = 0
+    changed: int = 0
+    unwritten: int = 0
+    staleness_total: float
+    staleness_reduced: float
+    reduced_per_request: float
+    sweep_reduced_per_request: float
+
+    @computed_field
+    @property
+    def gain(self) -> float:
+        """
+        Во сколько раз запрос цикла полезнее запроса полного обхода
+        """
+        if self.sweep_reduced_per_request <= 0:
+            return 0.0
+        return self.reduced_per_request / self.sweep_reduced_per_request
+
+
+logger = Logger("Refresh")
+
+
+def staleness(fetched_at: float, velocity: float, now: float) -> float:
+    return velocity * max(0.0, now - fetched_at)
+
+
+def prior_velocity(candidates: List[Candidate], config: RefreshConfig) -> float:
+    if config.prior_velocity is not None:
+        return config.prior_velocity
+    known = [velocity for _, _, velocity in candidates if velocity is not None]
+    return median(known) if known else 1.0
+
+
+def plan_refresh(
+    candidates: Iterable[Candidate], now: float, config: RefreshConfig
+) -> Tuple[List[Tuple[float, ShowIdentifier]], float]:
+    """
+    Выбирает до `config.budget` фильмов/сериалов для обновления.
+    Возвращает пары (устаревание, `ShowIdentifier`) в порядке выбора
+    и суммарное устаревание всех кандидатов.\n
+    Порядок - по накопленной с загрузки "площади" устаревания
+    `velocity * age ** 2`: при постоянном числе запросов сумма
+    устаревания минимальна, когда фильм/сериал обновляется раз
+    в `1 / sqrt(velocity)`. Выбор просто по устареванию (раз в
+    `1 / velocity`) надолго забрасывает медленные, в том числе
+    те, что с прошлой загрузки ускорились.
+    Порядок меняется между циклами, поэтому очередь (`heapq`)
+    строится заново
+    """
+    candidates = list(candidates)
+    prior = prior_velocity(candidates, config)
+    total = 0.0
+    scored: List[Tuple[float, int, float, ShowIdentifier]] = []
+    for n, (identifier, fetched_at, velocity) in enumerate(candidates):
+        velocity = max(config.min_velocity, prior if velocity is None else velocity)
+        score = staleness(fetched_at, velocity, now)
+        total += score
+        age = now - fetched_at
+        if age >= config.min_interval:
+            # `n` - чтобы не сравнивать `ShowIdentifier` при равных оценках
+            scored.append((velocity * age * age, n, score, identifier))
+    best = heapq.nlargest(config.budget, scored)
+    return [(score, identifier) for _, _, score, identifier in best], total
+
+
+class RefreshScheduler:
+    """
+    Обновляет ранее загруженные фильмы/сериалы из `SnatchIndex`:
+    за цикл тратит `budget` запросов `Snatcher.batch_snatch_shows`
+    на самые устаревшие. Новые и изменившиеся отмечаются в `SnatchIndex`
+    как незаписанные и пишутся в `sink` пачками по `batch_size`; отметка
+    снимается после записи, поэтому не записанные из-за ошибки `sink`
+    или перезапуска повторяются в следующем цикле, а не теряются
+    """
+
+    def __init__(
+        self,
+        sm: SessionManager,
+        index: SnatchIndex,
+        executor: ParseExecutor = INLINE_EXECUTOR,
+        sink: Optional[Sink] = None,
+        config: Optional[RefreshConfig] = None,
+    ):
+        self.sm = sm
+        self.index = index
+        self.executor = executor
+        self.sink = sink
+        self.config = config or RefreshConfig()
+        self.last_report: Optional[RefreshReport] = None
+
+    async def flush(self) -> int:
+        """
+        Пишет в `sink` отмеченные изменения, возвращает число незаписанных
+        """
+        if self.sink is None:
+            return 0
+        while True:
+            shows, unwritten = await self.index.unwritten(self.config.batch_size)
+            if not shows:
+                return unwritten
+            try:
+                await self.sink.write(shows)
+            except Exception as e:
+                logger.error("Failed writing %s changed shows: %s", len(shows), e)
+                return unwritten
+            await self.index.mark_written(shows)
+
+    async def close(self) -> None:
+        await self.flush()
+        if self.sink is not None:
+            await self.sink.close()
+
+    async def cycle(self, config: Optional[RefreshConfig] = None) -> RefreshReport:
+        config = config or self.config
+        candidates = await self.index.velocities()
+        planned, total = plan_refresh(candidates, time(), config)
+        results = await Snatcher.batch_snatch_shows(
+            self.sm,
+            [identifier for _, identifier in planned],
+            config.concurrent,
+            self.executor,
+            self.index,
+        )
+        reduced = failed = 0
+        changes: List[ShowIdentifier] = []
+        for (score, _), res in zip(planned, results):
+            if res.show is None:
+                failed += 1
+                continue
+            reduced += score
+            if res.changed:
+                changes.append(res.show.identifier)
+        if self.sink is not None:
+            await self.index.mark_unwritten(changes)
+        unwritten = await self.flush()
+
+        tracked = len(candidates)
+        report = RefreshReport(
+            tracked=tracked,
+            requests=len(planned),
+            failed=failed,
+            changed=len(changes),
+            unwritten=unwritten,
+            staleness_total=total,
+            staleness_reduced=reduced,
+            reduced_per_request=reduced / len(planned) if planned else 0.0,
+            sweep_reduced_per_request=total / tracked if tracked else 0.0,
+        )
+        logger.info(
+            "Refreshed %s of %s shows, %s changed, %.2fx staleness per request vs sweep",
+            report.requests - failed,
+            tracked,
+            report.changed,
+            report.gain,
+        )
+        self.last_report = report
+        return report
+
+    async def run(self, interval: float) -> None:
+        """
+        Цикл обновления раз в `interval` секунд
+        """
+        while True:
+            try:
+                await self.cycle()
+            except Exception as e:
+                logger.error("Refresh cycle failed: %s", e)
+            await sleep(interval)
@@ -1,21 +1,44 @@
-from aiohttp import ClientSession, CookieJar
-from time import sleep
-from random import randint
+import codecs
+from asyncio import sleep
+from aiohttp import ClientResponse, ClientSession, CookieJar
 from yarl import URL
 from pydantic import BaseModel, Field, field_validator
-from typing import Optional, Literal, Dict
+from typing import Callable, Optional, Literal, Dict, Tuple
 
 from common.logger import Logger
 from common.timer import Timer
+from src.antibot import AntibotConfig, BreakerStats, CircuitBreaker, detect_block
+from src.cache import CacheConfig, CacheStatus, ResponseCache
+from src.metrics import (
+    DOWNLOADED_BYTES,
+    REQUEST_SECONDS,
+    REQUESTS,
+    TRUNCATED_BODIES,
+)
+from src.pool import ConnectorConfig, PoolStats, PoolTracer
+from src.throttle import (
+    RetryConfig,
+    RateLimitConfig,
+    HostRateLimiter,
+    backoff_delay,
+    parse_retry_after,
+)
 
 
 class SessionConfig(BaseModel):
     """
-    Хранилище cookies и headers для SessionManager
+    Хранилище cookies и headers для SessionManager,
+    а также настройки пула соединений, повторов, ограничения частоты запросов,
+    кэша ответов и распознавания антибот-страниц
     """
 
     cookies: Dict[str, str] = Field(default_factory=dict)
     headers: Dict[str, str] = Field(default_factory=dict)
+    retry: RetryConfig = Field(default_factory=RetryConfig)
+    rate_limit: RateLimitConfig = Field(default_factory=RateLimitConfig)
+    connector: ConnectorConfig = Field(default_factory=ConnectorConfig)
+    cache: CacheConfig = Field(default_factory=CacheConfig)
+    antibot: AntibotConfig = Field(default_factory=AntibotConfig)
 
     @field_validator("cookies", "headers", mode="before")
     def validate_values(cls, d: Dict) -> Dict[str, str]:
@@ -27,6 +50,45 @@ class RequestResult(BaseModel):
     url: str
     status: int
     time: float
+    cache: Optional[CacheStatus] = None
+    blocked: bool = False
+    # Тело прочитано только до нужного места (`request(until=...)`)
+    truncated: bool = False
+
+
+# Сколько байт тела накапливается между проверками `until`
+STREAM_CHECK_BYTES = 32 * 1024
+
+
+async def read_until(
+    response: ClientResponse, until: Callable[[bytearray], bool]
+) -> Tuple[bytes, bool]:
+    """
+    Читает тело по частям, пока `until(прочитанное)` не вернет True,
+    после чего закрывает соединение, не дочитывая остаток.
+    Второе значение - тело прочитано не полностью
+    """
+    body = bytearray()
+    checked = 0
+    async for chunk in response.content.iter_any():
+        body += chunk
+        if len(body) - checked < STREAM_CHECK_BYTES:
+            continue
+        checked = len(body)
+        if until(body) and not response.content.at_eof():
+            response.close()
+            return bytes(body), True
+    return bytes(body), False
+
+
+def decode_body(body: bytes, encoding: str, truncated: bool = False) -> str:
+    """
+    Тело, оборванное `read_until`, может кончаться посреди многобайтного
+    символа: неполный символ в конце отбрасывается
+    """
+    if not truncated:
+        return body.decode(encoding)
+    return codecs.getincrementaldecoder(encoding)().decode(body)
 
 
 logger = Logger("SessionManager")
@@ -41,18 +103,71 @@ class SessionManager:
     экспортированы извне через `SessionManager.config`.
     """
 
-    def __init__(self, config: Optional[SessionConfig] = None):
-        self._session = ClientSession(cookie_jar=CookieJar())
+    def __init__(
+        self,
+        config: Optional[SessionConfig] = None,
+        cache: Optional[ResponseCache] = None,
+        limiter: Optional[HostRateLimiter] = None,
+    ):
         self.config = config or SessionConfig()
+        self._tracer = PoolTracer()
+        self._session = ClientSession(
+            connector=self.config.connector.make_connector(),
+            timeout=self.config.connector.make_timeout(),
+            cookie_jar=CookieJar(),
+            trace_configs=[self._tracer.trace_config],
+        )
+        if not self.config.connector.compression:
+            self._session.headers["Accept-Encoding"] = "identity"
         self._session.headers.update(self.config.headers)
         self._session.cookie_jar.update_cookies(self.config.cookies)
+        # Ограничение частоты может быть общим для нескольких сессий и процессов
+        # (см. `SessionPool`, `coordinator.SharedRateLimiter`)
+        self._limiter = limiter or HostRateLimiter(self.config.rate_limit)
+        # Кэш может быть общим для нескольких сессий (см. `SessionPool`)
+        self.cache = cache or (
+            ResponseCache(self.config.cache) if self.config.cache.enabled else None
+        )
+        self._breaker = CircuitBreaker(self.config.antibot, self._probe)
 
         logger.debug("Session initialized")
 
     async def close_session(self) -> None:
+        self._breaker.close()
         if not self._session.closed:
             await self._session.close()
 
+    def pool_stats(self) -> PoolStats:
+        return self._tracer.stats(self._session.connector)
+
+    def breaker_stats(self) -> Dict[str, BreakerStats]:
+        return self._breaker.stats()
+
+    def detect_block(self, body: bytes, url: str) -> Optional[str]:
+        if not self.config.antibot.enabled:
+            return None
+        return detect_block(body, url, self.config.antibot)
+
+    async def _probe(self, host: str) -> bool:
+        """
+        Пробный запрос для circuit breaker: обновляет cookies из ответа
+        и проверяет, что вместо страницы не отдается капча
+        """
+        url = self.config.antibot.probe_url or f"https://{host}/"
+        try:
+            async with self._session.get(url) as response:
+                body = await response.read()
+                self.update_config(
+                    cookies={n: v.value for n, v in response.cookies.items()}
+                )
+                return (
+                    response.status == 200
+                    and self.detect_block(body, str(response.url)) is None
+                )
+        except Exception as e:
+            logger.warning("Error on probing %s: %s", url, e)
+            return False
+
     async def __aenter__(self, *args) -> "SessionManager":
         return self
 
@@ -69,7 +184,7 @@ class SessionManager:
         if headers:
             if not keep_old:
                 self.headers.clear()
-            logger.debug(f"Updating config headers")
+            logger.debug("Updating config headers")
             upd_count = 0
             for k, v in headers.items():
                 if not overwrite and k in self.config.headers:
@@ -77,14 +192,14 @@ class SessionManager:
                 self.config.headers[str(k)] = str(v)
                 upd_count += 1
             logger.debug(
-                f"Updated {upd_count} headers, total {len(self.config.headers)}"
+                "Updated %s headers, total %s", upd_count, len(self.config.headers)
             )
             self._session.headers.update(self.config.headers)
 
         if cookies:
             if not keep_old:
                 self.cookies.clear()
-            logger.debug(f"Updating config cookies")
+            logger.debug("Updating config cookies")
             upd_count = 0
             for k, v in cookies.items():
                 if not overwrite and k in self.config.cookies:
@@ -92,7 +207,7 @@ class SessionManager:
                 self.config.cookies[str(k)] = str(v)
                 upd_count += 1
             logger.debug(
-                f"Updated {upd_count} cookies, total {len(self.config.cookies)}"
+                "Updated %s cookies, total %s", upd_count, len(self.config.cookies)
             )
             self._session.cookie_jar.update_cookies(self.config.cookies)
 
@@ -102,49 +217,151 @@ class SessionManager:
         method: Literal["GET", "POST"],
         params: Optional[dict[str, any]] = None,
         sync_config: bool = False,
-        attempts: int = 3,
+        attempts: Optional[int] = None,
+        until: Optional[Callable[[bytearray], bool]] = None,
     ) -> RequestResult:
+        """
+        С `until` тело читается потоково и обрывается, как только
+        `until(прочитанное начало тела)` вернет True (см. `read_until`):
+        такой результат помечается `truncated` и не кэшируется
+        """
         params = params or {}
         url = str(URL(url).with_query(params))
         if not url.startswith("http"):
             url = "http://" + url
+        host = URL(url).host or ""
+
+        retry = self.config.retry
+        attempts = attempts or retry.attempts
+
+        cached = None
+        if self.cache is not None and method == "GET":
+            cached = await self.cache.get(url)
+            if cached is not None and not sync_config and self.cache.is_fresh(cached):
+                self.cache.count("hit", cached)
+                logger.debug("Serving %s from cache", url)
+                return RequestResult(
+                    content=cached.body, url=url, time=0.0, status=200, cache="hit"
+                )
+        headers = cached.conditional_headers() if cached is not None else None
 
         time = 0.0
         status = 0
+        retry_after: Optional[float] = None
         for attempt in range(1, attempts + 1):
             if attempt > 1:
-                sleep(randint(attempt, attempt * 2))
+                delay = backoff_delay(retry, attempt, retry_after)
+                logger.debug("Retrying %s %s in %.2fs", method, url, delay)
+                await sleep(delay)
+            retry_after = None
+
+            # Перед каждой попыткой: цепь могли разомкнуть параллельные запросы
+            if not await self._breaker.wait(host):
+                logger.error(
+                    "Circuit for %s is open, skipping %s %s", host, method, url
+                )
+                return RequestResult(
+                    content=None, url=url, time=time, status=status, blocked=True
+                )
+
+            await self._limiter.acquire(host)
 
             timer = Timer()
             try:
-                logger.debug(
-                    f"Requesting {method} {url}"
-                    + (f", attempt {attempt}" if attempt > 1 else "")
-                    + "..."
-                )
-                if method == "GET":
-                    response = await self._session.get(url)
-                elif method == "POST":
-                    response = await self._session.post(url)
-                time = timer.elapsed
-                status = response.status
-
-                if status != 200:
-                    logger.warning(f"Status {status} on {method} {url}")
-                    continue
+                logger.debug("Requesting %s %s, attempt %s...", method, url, attempt)
+                # Ответ освобождается при выходе из контекста на любом пути
+                async with self._session.request(
+                    method, url, headers=headers
+                ) as response:
+                    time = timer.elapsed
+                    status = response.status
+                    REQUEST_SECONDS.observe(time)
+                    if status != 200:
+                        REQUESTS.inc(status=status)
+
+                    if status == 304 and cached is not None:
+                        await self.cache.refresh(cached)
+                        self.cache.count("revalidated", cached)
+                        logger.debug("Revalidated %s in %.3fs", url, time)
+                        return RequestResult(
+                            content=cached.body,
+                            url=url,
+                            time=time,
+                            status=status,
+                            cache="revalidated",
+                        )
 
-                content: str = await response.text()
+                    if status != 200:
+                        logger.warning("Status %s on %s %s", status, method, url)
+                        if status in retry.retry_after_statuses:
+                            retry_after = parse_retry_after(
+                                response.headers.get("Retry-After")
+                            )
+                            if retry_after is not None:
+                                self._limiter.pause(
+                                    host, min(retry_after, retry.retry_after_max)
+                                )
+                        if (
+                            retry.retry_statuses is not None
+                            and status not in retry.retry_statuses
+                        ):
+                            break
+                        continue
 
-                if sync_config:
-                    logger.debug(f"Syncing cookies from {url}")
-                    new_cookies = {n: v.value for n, v in response.cookies.items()}
-                    self.update_config(cookies=new_cookies)
+                    if until is None:
+                        body, truncated = await response.read(), False
+                    else:
+                        body, truncated = await read_until(response, until)
+                    DOWNLOADED_BYTES.inc(len(body))
+                    marker = self.detect_block(body, str(response.url))
+                    REQUESTS.inc(status="blocked" if marker is not None else status)
+                    if marker is not None:
+                        # Повтор с теми же cookies снова получит капчу
+                        logger.warning(
+                            "Antibot page (%s) on %s %s", marker, method, url
+                        )
+                        self._breaker.record_block(host)
+                        return RequestResult(
+                            content=None,
+                            url=url,
+                            time=time,
+                            status=status,
+                            blocked=True,
+                        )
+                    self._breaker.record_success(host)
+                    content = decode_body(body, response.get_encoding(), truncated)
 
-                logger.debug(f"Done requesting {method} {url} in {time:.3f}s")
-                return RequestResult(content=content, url=url, time=time, status=status)
+                    if sync_config:
+                        logger.debug("Syncing cookies from %s", url)
+                        new_cookies = {n: v.value for n, v in response.cookies.items()}
+                        self.update_config(cookies=new_cookies)
+
+                    cache_status: Optional[CacheStatus] = None
+                    if truncated:
+                        TRUNCATED_BODIES.inc()
+                        logger.debug("Read %s bytes of %s", len(body), url)
+                    elif self.cache is not None and method == "GET":
+                        await self.cache.put(
+                            url,
+                            content,
+                            response.headers.get("ETag"),
+                            response.headers.get("Last-Modified"),
+                        )
+                        self.cache.count("miss")
+                        cache_status = "miss"
+
+                logger.debug("Done requesting %s %s in %.3fs", method, url, time)
+                return RequestResult(
+                    content=content,
+                    url=url,
+                    time=time,
+                    status=status,
+                    cache=cache_status,
+                    truncated=truncated,
+                )
 
             except Exception as e:
-                logger.warning(f"Error on requesting {method} {url}: {e}")
+                logger.warning("Error on requesting %s %s: %s", method, url, e)
 
-        logger.error(f"Failed requesting {method} {url}")
+        logger.error("Failed requesting %s %s", method, url)
         return RequestResult(content=None, url=url, time=time, status=status)
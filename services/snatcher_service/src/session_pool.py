@@ -0,0 +1,238 @@
+from asyncio import sleep, to_thread
+from pathlib import Path
+from pydantic import BaseModel
+from time import monotonic
+from typing import Dict, List, Optional
+
+from common.logger import Logger
+from src.antibot import BreakerStats
+from src.cache import ResponseCache
+from src.pool import PoolStats
+from src.throttle import HostRateLimiter
+from src.session import RequestResult, SessionConfig, SessionManager
+
+
+class SessionPoolConfig(BaseModel):
+    """
+    `health_alpha` - вес последнего ответа в оценке здоровья профиля,
+    `retire_base`/`retire_max` - время вывода профиля из работы
+    после антибот-страницы (удваивается при повторных блокировках)
+    """
+
+    health_alpha: float = 0.2
+    min_health: float = 0.05
+    retire_base: float = 60.0
+    retire_max: float = 1800.0
+
+
+class IdentityState(BaseModel):
+    name: str
+    health: float
+    in_flight: int
+    requests: int
+    blocks: int
+    retired_for: float
+
+
+class Identity:
+    """
+    Профиль запросов: свой `SessionManager` (cookies, заголовки,
+    ограничение частоты) и файл, в который сохраняются cookies
+    """
+
+    def __init__(self, name: str, sm: SessionManager, path: Optional[Path] = None):
+        self.name = name
+        self.sm = sm
+        self.path = path
+        self.health = 1.0
+        self.in_flight = 0
+        self.requests = 0
+        self.blocks = 0
+        self.strikes = 0
+        self.retired_until = 0.0
+        self._saved_cookies = dict(sm.config.cookies)
+
+    def available(self, now: float) -> bool:
+        return self.retired_until <= now
+
+    def load(self, min_health: float) -> float:
+        return (self.in_flight + 1) / max(self.health, min_health)
+
+    def cookies_changed(self) -> bool:
+        return self.sm.config.cookies != self._saved_cookies
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        self._saved_cookies = dict(self.sm.config.cookies)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(self.sm.config.model_dump_json(indent=4), encoding="UTF-8")
+        tmp.replace(self.path)
+
+
+logger = Logger("SessionPool")
+
+
+class SessionPool:
+    """
+    Набор профилей `SessionConfig` с тем же интерфейсом запросов,
+    что у `SessionManager`. Запрос уходит наименее загруженному
+    с учетом здоровья профилю, профиль с антибот-страницей выводится
+    из работы, а запрос повторяется через другой профиль.
+    Обновленные cookies сохраняются обратно в файлы профилей
+    """
+
+    def __init__(
+        self, identities: List[Identity], config: Optional[SessionPoolConfig] = None
+    ):
+        if not identities:
+            raise ValueError("SessionPool needs at least one identity")
+        self.identities = identities
+        self.pool_config = config or SessionPoolConfig()
+        self.cache: Optional[ResponseCache] = identities[0].sm.cache
+
+    @classmethod
+    def load(
+        cls,
+        profiles_dir: str | Path,
+        config: Optional[SessionPoolConfig] = None,
+        limiter: Optional[HostRateLimiter] = None,
+    ) -> "SessionPool":
+        """
+        Загружает все `*.json` из `profiles_dir`, кэш ответов общий
+        (настройки кэша берутся из первого профиля). С `limiter`
+        ограничение частоты запросов тоже общее для всех профилей
+        """
+        identities: List[Identity] = []
+        cache: Optional[ResponseCache] = None
+        for path in sorted(Path(profiles_dir).glob("*.json")):
+            session_config = SessionConfig.model_validate_json(
+                path.read_text(encoding="UTF-8")
+            )
+            if cache is None and session_config.cache.enabled:
+                cache = ResponseCache(session_config.cache)
+            sm = SessionManager(session_config, cache=cache, limiter=limiter)
+            identities.append(Identity(path.stem, sm, path))
+        logger.info("Loaded %s session profiles from %s", len(identities), profiles_dir)
+        return cls(identities, config)
+
+    @property
+    def config(self) -> SessionConfig:
+        return self.identities[0].sm.config
+
+    def _pick(self, exclude: List[Identity]) -> Optional[Identity]:
+        now = monotonic()
+        candidates = [
+            identity
+            for identity in self.identities
+            if identity.available(now) and identity not in exclude
+        ]
+        if not candidates:
+            return None
+        return min(
+            candidates, key=lambda identity: identity.load(self.pool_config.min_health)
+        )
+
+    async def _acquire(self, exclude: List[Identity]) -> Optional[Identity]:
+        while (identity := self._pick(exclude)) is None:
+            waiting = [i for i in self.identities if i not in exclude]
+            if not waiting:
+                return None
+            delay = min(i.retired_until for i in waiting) - monotonic()
+            logger.warning("All session profiles retired, waiting %.0fs", delay)
+            await sleep(max(delay, 0.0))
+        return identity
+
+    def _update(self, identity: Identity, result: RequestResult) -> None:
+        config = self.pool_config
+        ok = result.status == 200 and not result.blocked
+        identity.health += config.health_alpha * (float(ok) - identity.health)
+        if ok:
+            identity.strikes = 0
+            return
+        if result.blocked:
+            identity.blocks += 1
+            # Параллельные запросы одной блокировки считаются одним разом
+            if not identity.available(monotonic()):
+                return
+            identity.strikes += 1
+            retire_for = min(
+                config.retire_base * 2 ** (identity.strikes - 1), config.retire_max
+            )
+            identity.retired_until = monotonic() + retire_for
+            logger.warning(
+                "Session profile %s blocked, retired for %.0fs",
+                identity.name,
+                retire_for,
+            )
+
+    async def request(self, *args, **kwargs) -> RequestResult:
+        tried: List[Identity] = []
+        result: Optional[RequestResult] = None
+        while (identity := await self._acquire(tried)) is not None:
+            tried.append(identity)
+            identity.in_flight += 1
+            identity.requests += 1
+            try:
+                result = await identity.sm.request(*args, **kwargs)
+            finally:
+                identity.in_flight -= 1
+            self._update(identity, result)
+            if identity.cookies_changed():
+                await to_thread(identity.save)
+            if not result.blocked:
+                break
+        return result
+
+    def identity_states(self) -> List[IdentityState]:
+        now = monotonic()
+        return [
+            IdentityState(
+                name=identity.name,
+                health=identity.health,
+                in_flight=identity.in_flight,
+                requests=identity.requests,
+                blocks=identity.blocks,
+                retired_for=max(0.0, identity.retired_until - now),
+            )
+            for identity in self.identities
+        ]
+
+    def pool_stats(self) -> PoolStats:
+        """
+        Суммарная статистика пулов соединений всех профилей
+        """
+        all_stats = [identity.sm.pool_stats() for identity in self.identities]
+        summed = {
+            field: sum(getattr(stats, field) for stats in all_stats)
+            for field in PoolStats.model_fields
+            if field not in ("wait_time_max", "wait_time_avg")
+        }
+        return PoolStats(
+            **summed,
+            wait_time_max=max(stats.wait_time_max for stats in all_stats),
+            wait_time_avg=(
+                summed["wait_time_total"] / summed["wait_count"]
+                if summed["wait_count"]
+                else 0.0
+            ),
+        )
+
+    def breaker_stats(self) -> Dict[str, BreakerStats]:
+        return {
+            f"{identity.name}/{host}": stats
+            for identity in self.identities
+            for host, stats in identity.sm.breaker_stats().items()
+        }
+
+    async def close_session(self) -> None:
+        for identity in self.identities:
+            if identity.cookies_changed():
+                await to_thread(identity.save)
+            await identity.sm.close_session()
+
+    async def __aenter__(self, *args) -> "SessionPool":
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.close_session()
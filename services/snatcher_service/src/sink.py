@@ -0,0 +1,181 @@
+import aiofiles
+from abc import ABC, abstractmethod
+from asyncio import CancelledError, Semaphore, Task, create_task, gather, sleep
+from aiohttp import ClientSession, ClientTimeout
+from enum import Enum
+from pathlib import Path
+from pydantic import BaseModel, TypeAdapter
+from time import monotonic
+from typing import Callable, List, Optional, Set
+
+from common.logger import Logger
+from common.show_models import ShowModel
+
+
+SHOW_LIST_ADAPTER = TypeAdapter(List[ShowModel])
+
+
+class SinkKind(Enum):
+    DB = "db"
+    NDJSON = "ndjson"
+    NULL = "null"
+
+
+class SinkStats(BaseModel):
+    shows_written: int = 0
+    batches_written: int = 0
+    batches_failed: int = 0
+    bytes_written: int = 0
+
+
+logger = Logger("Sink")
+
+
+class Sink(ABC):
+    """
+    Получатель результатов обхода: принимает пачки `ShowModel`
+    """
+
+    @abstractmethod
+    async def write(self, shows: List[ShowModel]) -> int:
+        """
+        Записывает пачку, возвращает размер отправленных данных в байтах
+        """
+
+    async def close(self) -> None:
+        pass
+
+
+class NullSink(Sink):
+    """
+    Ничего не сохраняет, только сериализует - для замеров
+    """
+
+    async def write(self, shows: List[ShowModel]) -> int:
+        return len(SHOW_LIST_ADAPTER.dump_json(shows))
+
+
+class NDJSONFileSink(Sink):
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    async def write(self, shows: List[ShowModel]) -> int:
+        data = b"".join(show.model_dump_json().encode() + b"\n" for show in shows)
+        async with aiofiles.open(self.path, mode="ab") as dst:
+            await dst.write(data)
+        return len(data)
+
+
+class DBServiceSink(Sink):
+    """
+    Отправляет пачки в `POST /shows/bulk` сервиса db_service
+    """
+
+    def __init__(self, base_url: str, attempts: int = 3, timeout: float = 60.0):
+        self.url = f"{base_url.rstrip('/')}/shows/bulk"
+        self.attempts = attempts
+        self._session = ClientSession(timeout=ClientTimeout(total=timeout))
+
+    async def write(self, shows: List[ShowModel]) -> int:
+        data = SHOW_LIST_ADAPTER.dump_json(shows)
+        for attempt in range(1, self.attempts + 1):
+            try:
+                async with self._session.post(
+                    self.url, data=data, headers={"Content-Type": "application/json"}
+                ) as response:
+                    if response.status == 200:
+                        return len(data)
+                    logger.warning("Status %s on POST %s", response.status, self.url)
+            except Exception as e:
+                logger.warning("Error on POST %s: %s", self.url, e)
+            if attempt < self.attempts:
+                await sleep(attempt)
+        raise ConnectionError(f"Failed writing {len(shows)} shows to {self.url}")
+
+    async def close(self) -> None:
+        if not self._session.closed:
+            await self._session.close()
+
+
+class BatchWriter:
+    """
+    Собирает `ShowModel` в пачки по размеру (`batch_size`) и времени
+    (`flush_interval` секунд с первой записи пачки) и отправляет их в `Sink`,
+    держа в полете не более `max_in_flight` пачек. При заполненном окне
+    `put()` ждет, поэтому память не растет при медленном получателе.
+    `on_written` вызывается для каждой успешно записанной пачки
+    """
+
+    def __init__(
+        self,
+        sink: Sink,
+        batch_size: int = 500,
+        flush_interval: float = 5.0,
+        max_in_flight: int = 2,
+        on_written: Optional[Callable[[List[ShowModel]], None]] = None,
+    ):
+        self.sink = sink
+        self.on_written = on_written
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.stats = SinkStats()
+        self._batch: List[ShowModel] = []
+        self._batch_started = 0.0
+        self._window = Semaphore(max_in_flight)
+        self._in_flight: Set[Task] = set()
+        self._timer: Optional[Task] = None
+
+    async def put(self, show: ShowModel) -> None:
+        if not self._batch:
+            self._batch_started = monotonic()
+            if self._timer is None or self._timer.done():
+                self._timer = create_task(self._flush_later())
+        self._batch.append(show)
+        if len(self._batch) >= self.batch_size:
+            await self.flush()
+
+    async def _flush_later(self) -> None:
+        while self._batch:
+            delay = self._batch_started + self.flush_interval - monotonic()
+            if delay > 0:
+                await sleep(delay)
+            elif self._batch:
+                await self.flush()
+
+    async def flush(self) -> None:
+        if not self._batch:
+            return
+        batch, self._batch = self._batch, []
+
+        try:
+            await self._window.acquire()
+        except CancelledError:
+            # Отмена в ожидании окна (`close()` отменяет таймер):
+            # пачка возвращается и не теряется
+            self._batch[:0] = batch
+            raise
+        task = create_task(self._write(batch))
+        self._in_flight.add(task)
+        task.add_done_callback(self._in_flight.discard)
+
+    async def _write(self, batch: List[ShowModel]) -> None:
+        try:
+            self.stats.bytes_written += await self.sink.write(batch)
+            self.stats.shows_written += len(batch)
+            self.stats.batches_written += 1
+            if self.on_written is not None:
+                self.on_written(batch)
+        except Exception as e:
+            self.stats.batches_failed += 1
+            logger.error("Failed writing batch of %s shows: %s", len(batch), e)
+        finally:
+            self._window.release()
+
+    async def close(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            await gather(self._timer, return_exceptions=True)
+        await self.flush()
+        await gather(*self._in_flight)
+        await self.sink.close()
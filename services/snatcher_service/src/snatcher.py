@@ -1,14 +1,55 @@
-from asyncio import Semaphore, gather
+import os
+from contextlib import aclosing
+from asyncio import (
+    FIRST_COMPLETED,
+    Queue,
+    create_task,
+    ensure_future,
+    gather,
+    wait,
+)
+from itertools import islice
 from pydantic import BaseModel, field_serializer
-from typing import Optional, List
+from typing import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Iterable,
+    Optional,
+    List,
+    TypeVar,
+)
 
 from common.logger import Logger
+from common.metrics import timed
+from common.timer import Timer
 from src.session import SessionManager, RequestResult
 from common.show_models import ShowIdentifier, ShowModel
-from src.parser import Parser
+from src.parser import FieldsScan, Parser, fragment_hash
+from src.executor import ParseExecutor, InlineParseExecutor
+from src.index import ShowChange, ShowChangeKind, SnatchIndex
+from src.limiter import Limiter, as_limiter
+from src.metrics import (
+    LIMITER_WAIT_SECONDS,
+    PARSE_FAILURES,
+    PARSE_SECONDS,
+    PARSE_SKIPPED,
+    SHOW_CHANGES,
+)
 
-PAGE_URL_BASE = "https://www.kinopoisk.ru/lists/movies"
-SHOW_URL_BASE = "https://www.kinopoisk.ru"
+# Переопределяются окружением, например для локального стенда (`bench.standin`)
+SHOW_URL_BASE = os.getenv("KP_URL_BASE", "https://www.kinopoisk.ru").rstrip("/")
+PAGE_URL_BASE = os.getenv("KP_PAGE_URL_BASE", f"{SHOW_URL_BASE}/lists/movies")
+# Страница фильма/сериала дочитывается только до последнего нужного поля.
+# Такие ответы не кэшируются
+STREAM_SHOW_PAGES = os.getenv("KP_STREAM_SHOW_PAGES", "0") != "0"
+
+INLINE_EXECUTOR = InlineParseExecutor()
+
+T = TypeVar("T")
+
+# Поля `RequestResult` в ответах: тело страницы не отдается
+RESULT_FIELDS = tuple(name for name in RequestResult.model_fields if name != "content")
 
 
 class SnatchResult(BaseModel):
@@ -17,101 +58,376 @@ class SnatchResult(BaseModel):
 
     @field_serializer("request_result")
     def serialize_rr_clean(self, request_result: RequestResult, _info):
-        return request_result.model_dump(exclude={"content"})
+        # Словарь без `content` собирается напрямую: `model_dump(exclude=...)`
+        # на каждый результат заметен в ответах на тысячи фильмов/сериалов
+        return {name: getattr(request_result, name) for name in RESULT_FIELDS}
 
 
 class SnatchSIDsResult(SnatchResult):
+    page: int
     identifier_list: Optional[List[ShowIdentifier]]
 
 
 class SnatchShowResult(SnatchResult):
+    identifier: ShowIdentifier
     show: Optional[ShowModel]
+    # Отличие от прошлой загрузки, только при работе с `SnatchIndex`
+    change: Optional[ShowChange] = None
+
+    @property
+    def changed(self) -> bool:
+        """
+        Загружен новый или изменившийся фильм/сериал. Без `SnatchIndex`
+        сравнивать не с чем: изменившимся считается любой загруженный
+        """
+        if self.show is None:
+            return False
+        if self.change is None:
+            return True
+        return self.change.kind != ShowChangeKind.UNCHANGED
 
 
 logger = Logger("Snatcher")
 
 
+async def bounded_as_completed(
+    aws: Iterable[Awaitable[T]], limit: int
+) -> AsyncIterator[T]:
+    """
+    Выдает результаты по мере готовности, держа в работе не более `limit`
+    задач. Корутины берутся из `aws` лениво, поэтому память не зависит
+    от общего числа задач. Незавершенные задачи отменяются при закрытии
+    генератора (например, при обрыве соединения с клиентом)
+    """
+    aws = iter(aws)
+    pending = {ensure_future(aw) for aw in islice(aws, max(1, limit))}
+    try:
+        while pending:
+            done, pending = await wait(pending, return_when=FIRST_COMPLETED)
+            pending |= {ensure_future(aw) for aw in islice(aws, len(done))}
+            for task in done:
+                yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def unique(identifiers: Iterable[ShowIdentifier]) -> Iterable[ShowIdentifier]:
+    """
+    Лениво отбрасывает повторы `ShowIdentifier` с сохранением порядка
+    """
+    seen: set[ShowIdentifier] = set()
+    for sid in identifiers:
+        if sid not in seen:
+            seen.add(sid)
+            yield sid
+
+
+R = TypeVar("R", bound=SnatchResult)
+
+
+async def limited(limiter: Limiter, aw: Awaitable[R]) -> R:
+    """
+    Выполняет загрузку в слоте `limiter` и сообщает ему результат запроса
+    """
+    timer = Timer()
+    async with limiter.slot() as slot:
+        LIMITER_WAIT_SECONDS.observe(timer.elapsed)
+        res = await aw
+        slot.report(res.request_result)
+        return res
+
+
 class Snatcher:
     @staticmethod
-    async def snatch_identifiers(sm: SessionManager, page: int) -> SnatchSIDsResult:
+    async def snatch_identifiers(
+        sm: SessionManager,
+        page: int,
+        executor: ParseExecutor = INLINE_EXECUTOR,
+    ) -> SnatchSIDsResult:
         """
-        Возвращает список `ShowIdentifier` и статистику запроса
+        Возвращает список `ShowIdentifier` и статистику запроса.
+        Разбор страницы выполняется через `executor`
         """
 
         request_result = await sm.request(
             PAGE_URL_BASE, method="GET", params={"sort": "rating", "page": page}
         )
         if request_result.content is None:
-            logger.error(f"Failed requesting page {page}")
-            return SnatchResult(payload=None, request_result=request_result)
+            logger.error("Failed requesting page %s", page)
+            return SnatchSIDsResult(
+                page=page, identifier_list=None, request_result=request_result
+            )
 
-        sid_list: Optional[list[ShowIdentifier]] = await Parser.parse_page(
-            request_result.content, page
-        )
+        with timed(PARSE_SECONDS, kind="page"):
+            sid_list: Optional[list[ShowIdentifier]] = await executor.run(
+                Parser.parse_page, request_result.content, page
+            )
         if sid_list is None:
-            logger.error(f"Failed parsing page {page}")
-            return SnatchSIDsResult(identifier_list=None, request_result=request_result)
+            logger.error("Failed parsing page %s", page)
+            return SnatchSIDsResult(
+                page=page, identifier_list=None, request_result=request_result
+            )
 
-        return SnatchSIDsResult(identifier_list=sid_list, request_result=request_result)
+        return SnatchSIDsResult(
+            page=page, identifier_list=sid_list, request_result=request_result
+        )
 
     @staticmethod
     async def batch_snatch_identifiers(
-        sm: SessionManager, page_list: list[int], concurrent: int = 5
+        sm: SessionManager,
+        page_list: list[int],
+        concurrent: int | Limiter = 5,
+        executor: ParseExecutor = INLINE_EXECUTOR,
     ) -> list[SnatchSIDsResult]:
         """
         Параллельно запускает `snatch_identifiers()`,
-        возвращает список списков `ShowIdentifier` и статистики запросов
+        возвращает список списков `ShowIdentifier` и статистики запросов.
+        `concurrent` - число или `Limiter` (например, `AdaptiveLimiter`)
         """
-
-        async def task(sem: Semaphore, page: int) -> SnatchSIDsResult:
-            async with sem:
-                return await Snatcher.snatch_identifiers(sm, page)
-
-        sem = Semaphore(concurrent)
-        tasks = [task(sem, page) for page in page_list]
+        limiter = as_limiter(concurrent)
+        tasks = [
+            limited(limiter, Snatcher.snatch_identifiers(sm, page, executor))
+            for page in page_list
+        ]
 
         return await gather(*tasks)
 
     @staticmethod
     async def snatch_show(
-        sm: SessionManager, identifier: ShowIdentifier
+        sm: SessionManager,
+        identifier: ShowIdentifier,
+        executor: ParseExecutor = INLINE_EXECUTOR,
+        index: Optional[SnatchIndex] = None,
     ) -> SnatchShowResult:
         """
-        Возвращает готовый объект `ShowModel` и статистику запроса
+        Возвращает готовый объект `ShowModel` и статистику запроса.
+        Разбор страницы выполняется через `executor`,
+        успешная загрузка отмечается в `index` вместе с отличием
+        от прошлой (`SnatchShowResult.change`)
         """
         request_result = await sm.request(
-            f"{SHOW_URL_BASE}/{identifier.type.value}/{identifier.id}", method="GET"
+            f"{SHOW_URL_BASE}/{identifier.type.value}/{identifier.id}",
+            method="GET",
+            until=FieldsScan() if STREAM_SHOW_PAGES else None,
         )
         if request_result.content is None:
-            logger.error(f"Failed requesting {identifier}")
-            return SnatchShowResult(show=None, request_result=request_result)
+            logger.error("Failed requesting %s", identifier)
+            return SnatchShowResult(
+                identifier=identifier, show=None, request_result=request_result
+            )
 
-        show_details = await Parser.parse_show(
-            request_result.content, identifier, allow_partial=False
-        )
+        fragment = previous = show_details = None
+        if index is not None:
+            fragment = fragment_hash(request_result.content)
+            if index.skip_unchanged and fragment is not None:
+                previous = await index.lookup(identifier)
+        if previous is not None and previous.fragment_hash == fragment:
+            # HTML полей не изменился: прежний `ShowDetails` без разбора
+            show_details = previous.details
+            if show_details is not None:
+                PARSE_SKIPPED.inc()
+                logger.debug("Fields of %s unchanged, parsing skipped", identifier)
 
         if show_details is None:
-            logger.error(f"Failed parsing {identifier}")
-            return SnatchShowResult(show=None, request_result=request_result)
+            with timed(PARSE_SECONDS, kind="show"):
+                show_details, missing = await executor.run(
+                    Parser.parse_show_report,
+                    request_result.content,
+                    identifier,
+                    allow_partial=False,
+                )
+            for field in missing:
+                PARSE_FAILURES.inc(field=field)
+
+        if show_details is None:
+            logger.error("Failed parsing %s", identifier)
+            return SnatchShowResult(
+                identifier=identifier, show=None, request_result=request_result
+            )
+
+        change = None
+        if index is not None:
+            change = await index.record(identifier, show_details, fragment)
+            SHOW_CHANGES.inc(kind=change.kind.value)
 
         return SnatchShowResult(
+            identifier=identifier,
             show=ShowModel(identifier=identifier, details=show_details),
+            change=change,
             request_result=request_result,
         )
 
     @staticmethod
     async def batch_snatch_shows(
-        sm: SessionManager, identifier_list: list[ShowIdentifier], concurrent: int = 5
+        sm: SessionManager,
+        identifier_list: list[ShowIdentifier],
+        concurrent: int | Limiter = 5,
+        executor: ParseExecutor = INLINE_EXECUTOR,
+        index: Optional[SnatchIndex] = None,
+        freshness: float = 0.0,
     ) -> list[SnatchShowResult]:
         """
-        Параллельно запускает `snatch_show()`,
-        возвращает список `ShowModel` и статистики запросов
+        Параллельно запускает `snatch_show()` для уникальных `ShowIdentifier`,
+        возвращает список `ShowModel` и статистики запросов.\n
+        С `index` пропускает загруженные за последние `freshness` секунд
         """
+        identifier_list = list(unique(identifier_list))
+        if index is not None:
+            identifier_list = await index.filter_stale(identifier_list, freshness)
 
-        async def task(sem: Semaphore, identifier: ShowIdentifier) -> SnatchShowResult:
-            async with sem:
-                return await Snatcher.snatch_show(sm, identifier)
-
-        sem = Semaphore(concurrent)
-        tasks = [task(sem, sid) for sid in identifier_list]
+        limiter = as_limiter(concurrent)
+        tasks = [
+            limited(limiter, Snatcher.snatch_show(sm, sid, executor, index))
+            for sid in identifier_list
+        ]
         return await gather(*tasks)
+
+    @staticmethod
+    def iter_snatch_identifiers(
+        sm: SessionManager,
+        page_list: Iterable[int],
+        concurrent: int | Limiter = 5,
+        executor: ParseExecutor = INLINE_EXECUTOR,
+    ) -> AsyncIterator[SnatchSIDsResult]:
+        """
+        Потоковый вариант `batch_snatch_identifiers()`:
+        выдает результаты страниц по мере готовности
+        """
+        limiter = as_limiter(concurrent)
+        return bounded_as_completed(
+            (
+                limited(limiter, Snatcher.snatch_identifiers(sm, page, executor))
+                for page in page_list
+            ),
+            limiter.capacity,
+        )
+
+    @staticmethod
+    async def iter_snatch_shows(
+        sm: SessionManager,
+        identifier_list: Iterable[ShowIdentifier],
+        concurrent: int | Limiter = 5,
+        executor: ParseExecutor = INLINE_EXECUTOR,
+        index: Optional[SnatchIndex] = None,
+        freshness: float = 0.0,
+    ) -> AsyncIterator[SnatchShowResult]:
+        """
+        Потоковый вариант `batch_snatch_shows()`:
+        выдает результаты по мере готовности
+        """
+        identifier_list = unique(identifier_list)
+        if index is not None:
+            identifier_list = await index.filter_stale(identifier_list, freshness)
+
+        limiter = as_limiter(concurrent)
+        async with aclosing(
+            bounded_as_completed(
+                (
+                    limited(limiter, Snatcher.snatch_show(sm, sid, executor, index))
+                    for sid in identifier_list
+                ),
+                limiter.capacity,
+            )
+        ) as results:
+            async for res in results:
+                yield res
+
+    @staticmethod
+    async def pipeline_snatch_pages(
+        sm: SessionManager,
+        page_list: Iterable[int],
+        page_concurrent: int | Limiter = 5,
+        show_concurrent: int | Limiter = 5,
+        executor: ParseExecutor = INLINE_EXECUTOR,
+        queue_size: Optional[int] = None,
+        index: Optional[SnatchIndex] = None,
+        freshness: float = 0.0,
+        identifier_list: Iterable[ShowIdentifier] = (),
+        on_enqueue: Optional[Callable[[List[ShowIdentifier]], None]] = None,
+    ) -> AsyncIterator[SnatchSIDsResult | SnatchShowResult]:
+        """
+        Конвейер страница -> фильмы/сериалы: `ShowIdentifier` каждой
+        разобранной страницы сразу попадают в ограниченную очередь,
+        которую разбирают `show_concurrent` обработчиков (для `Limiter` -
+        `capacity` обработчиков, ограниченных его текущим лимитом).
+        Заполненная очередь приостанавливает загрузку страниц.\n
+        Повторы между страницами отбрасываются, с `index` пропускаются
+        загруженные за последние `freshness` секунд. `identifier_list`
+        ставится в очередь до первой страницы без проверки свежести,
+        `on_enqueue` получает итоговый список поставленных в очередь
+        `ShowIdentifier` до выдачи результата страницы.\n
+        Выдает `SnatchSIDsResult` и `SnatchShowResult` по мере готовности
+        """
+        page_limiter = as_limiter(page_concurrent)
+        show_limiter = as_limiter(show_concurrent)
+        workers = show_limiter.capacity
+        sid_queue: Queue[Optional[ShowIdentifier]] = Queue(queue_size or workers * 4)
+        out_queue: Queue = Queue(page_limiter.capacity + workers)
+        done = object()
+        seen: set[ShowIdentifier] = set()
+
+        async def enqueue(
+            sid_list: Iterable[ShowIdentifier], stale_only: bool = True
+        ) -> List[ShowIdentifier]:
+            sid_list = [sid for sid in unique(sid_list) if sid not in seen]
+            seen.update(sid_list)
+            if index is not None and stale_only:
+                sid_list = await index.filter_stale(sid_list, freshness)
+            if on_enqueue is not None:
+                on_enqueue(sid_list)
+            return sid_list
+
+        async def produce() -> None:
+            # Например, `pending` продолжаемой задачи: фильм/сериал мог попасть
+            # в `index` до записи в `Sink`, поэтому свежесть не проверяется
+            for sid in await enqueue(identifier_list, stale_only=False):
+                await sid_queue.put(sid)
+
+            async with aclosing(
+                Snatcher.iter_snatch_identifiers(sm, page_list, page_limiter, executor)
+            ) as pages:
+                async for page_res in pages:
+                    sid_list = await enqueue(page_res.identifier_list or [])
+                    await out_queue.put(page_res)
+                    for sid in sid_list:
+                        await sid_queue.put(sid)
+            # Только при успешном завершении: при ошибке или отмене
+            # обработчики отменяет `supervise`, а в заполненную очередь
+            # без читателей признак конца не поместится
+            for _ in range(workers):
+                await sid_queue.put(None)
+
+        async def consume() -> None:
+            while (sid := await sid_queue.get()) is not None:
+                await out_queue.put(
+                    await limited(
+                        show_limiter, Snatcher.snatch_show(sm, sid, executor, index)
+                    )
+                )
+
+        async def supervise() -> None:
+            tasks = [create_task(produce())] + [
+                create_task(consume()) for _ in range(workers)
+            ]
+            try:
+                await gather(*tasks)
+            except Exception as e:
+                await out_queue.put(e)
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await gather(*tasks, return_exceptions=True)
+            await out_queue.put(done)
+
+        supervisor = create_task(supervise())
+        try:
+            while (item := await out_queue.get()) is not done:
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # Например, клиент `/stream_snatch_pages` отключился: задачи
+            # конвейера завершаются до закрытия генератора
+            supervisor.cancel()
+            await gather(supervisor, return_exceptions=True)
@@ -0,0 +1,129 @@
+from asyncio import Lock, sleep
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from random import uniform
+from time import monotonic
+from pydantic import BaseModel
+from typing import Dict, List, Optional
+
+
+class RetryConfig(BaseModel):
+    """
+    Политика повторов: экспоненциальная задержка с джиттером.\n
+    `retry_statuses` - статусы, при которых запрос повторяется
+    (None - любой статус, кроме 200); `Retry-After` учитывается
+    для статусов из `retry_after_statuses`
+    """
+
+    attempts: int = 3
+    backoff_base: float = 1.0
+    backoff_max: float = 30.0
+    jitter: float = 0.5
+    retry_statuses: Optional[List[int]] = None
+    retry_after_statuses: List[int] = [429, 503]
+    retry_after_max: float = 120.0
+
+
+class RateLimitConfig(BaseModel):
+    """
+    Token bucket на каждый хост: `rate` запросов в секунду
+    с допустимым всплеском `burst`. `rate` <= 0 отключает ограничение
+    """
+
+    rate: float = 0.0
+    burst: int = 5
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Разбирает `Retry-After` в секундах или в виде HTTP-даты
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return max(0.0, (date - datetime.now(timezone.utc)).total_seconds())
+
+
+def backoff_delay(
+    config: RetryConfig, attempt: int, retry_after: Optional[float] = None
+) -> float:
+    """
+    Задержка перед попыткой `attempt` (начиная со второй)
+    """
+    if retry_after is not None:
+        return min(retry_after, config.retry_after_max)
+
+    delay = min(config.backoff_max, config.backoff_base * 2 ** (attempt - 2))
+    return delay * uniform(1 - config.jitter, 1 + config.jitter)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = monotonic()
+        self._paused_until = 0.0
+        self._lock = Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def pause(self, delay: float) -> None:
+        """
+        Приостанавливает выдачу токенов на `delay` секунд (например, по `Retry-After`)
+        """
+        self._paused_until = max(self._paused_until, monotonic() + delay)
+
+    async def acquire(self) -> float:
+        """
+        Ждет токен, возвращает время ожидания
+        """
+        started = monotonic()
+        async with self._lock:
+            while True:
+                now = monotonic()
+                if now < self._paused_until:
+                    await sleep(self._paused_until - now)
+                    continue
+
+                if self.rate <= 0:
+                    break
+
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    break
+                await sleep((1 - self._tokens) / self.rate)
+
+        return monotonic() - started
+
+
+class HostRateLimiter:
+    """
+    Набор `TokenBucket` по хостам, общий для всех запросов одного `SessionManager`
+    """
+
+    def __init__(self, config: Optional[RateLimitConfig] = None):
+        self.config = config or RateLimitConfig()
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    def bucket(self, host: str) -> TokenBucket:
+        if host not in self._buckets:
+            self._buckets[host] = TokenBucket(self.config.rate, self.config.burst)
+        return self._buckets[host]
+
+    async def acquire(self, host: str) -> float:
+        return await self.bucket(host).acquire()
+
+    def pause(self, host: str, delay: float) -> None:
+        self.bucket(host).pause(delay)
@@ -0,0 +1,34 @@
+"""
+Стенд `bench.standin` в том же процессе: адреса `snatcher`
+подменяются на его страницы из `bench/fixtures`
+"""
+
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+from aiohttp import web
+
+from bench.standin import Fixtures, StandinConfig, make_app
+from src import snatcher
+
+
+FIXTURES = Path(__file__).parent.parent / "bench" / "fixtures"
+
+
+@asynccontextmanager
+async def standin(monkeypatch):
+    runner = web.AppRunner(
+        make_app(Fixtures(FIXTURES), StandinConfig(latency=0.0)), access_log=None
+    )
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    monkeypatch.setattr(snatcher, "SHOW_URL_BASE", f"http://127.0.0.1:{port}")
+    monkeypatch.setattr(
+        snatcher, "PAGE_URL_BASE", f"http://127.0.0.1:{port}/lists/movies"
+    )
+    try:
+        yield
+    finally:
+        await runner.cleanup()
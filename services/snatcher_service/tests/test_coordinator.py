@@ -0,0 +1,70 @@
+"""
+`CoordinatedWorker`: `BatchWriter` задачи и его `Sink` закрываются,
+когда работа кончилась, а не только при остановке воркера.
+Страницы отдает стенд `bench.standin` в том же процессе.\n
+Запуск из `services/snatcher_service`:
+`PYTHONPATH=..:. python -m pytest tests`
+"""
+
+import asyncio
+from typing import List
+
+from common.show_models import ShowModel
+from conftest import standin
+from src.coordinator import CoordinatedWorker, Coordinator, CoordinatorConfig
+from src.executor import ParseExecutor
+from src.jobs import CrawlJobSpec
+from src.session import SessionConfig, SessionManager
+from src.sink import Sink, SinkKind
+
+
+class ClosingSink(Sink):
+    def __init__(self):
+        self.written: List[int] = []
+        self.closed = False
+
+    async def write(self, shows: List[ShowModel]) -> int:
+        self.written += [show.identifier.id for show in shows]
+        return len(shows)
+
+    async def close(self) -> None:
+        self.closed = True
+
+
+def test_sinks_closed_when_jobs_finish(tmp_path, monkeypatch):
+    sinks: List[ClosingSink] = []
+
+    def make_sink(name: str, kind: SinkKind) -> Sink:
+        sinks.append(ClosingSink())
+        return sinks[-1]
+
+    async def run():
+        async with standin(monkeypatch):
+            return await crawl()
+
+    async def crawl():
+        coordinator = Coordinator(
+            tmp_path / "coordinator.db", CoordinatorConfig(poll_interval=0.01)
+        )
+        sm = SessionManager(SessionConfig.model_validate({"retry": {"attempts": 1}}))
+        worker = CoordinatedWorker(
+            coordinator, sm, ParseExecutor.create(kind="inline"), make_sink
+        )
+        task = asyncio.create_task(worker.run())
+        try:
+            for i in range(2):
+                spec = CrawlJobSpec(page_from=1, page_to=1, flush_interval=0.01)
+                await coordinator.add_job(spec)
+                while len(sinks) <= i or not sinks[i].closed:
+                    await asyncio.sleep(0.01)
+            return len(worker._writers), task.done()
+        finally:
+            task.cancel()
+            await worker.close()
+            await sm.close_session()
+            coordinator.close()
+
+    writers, stopped = asyncio.run(asyncio.wait_for(run(), 10))
+    assert (writers, stopped) == (0, False)
+    assert len(sinks) == 2
+    assert all(sorted(sink.written) == [435, 464963] for sink in sinks)
@@ -0,0 +1,60 @@
+"""
+`FieldsScan`: чтение страницы останавливается только тогда, когда
+разбор прочитанного начала дает тот же `ShowDetails`, что и вся страница,
+в том числе если варианты `attrs_list` идут на странице в обратном порядке
+(`film_258687.html`).\n
+Запуск из `services/snatcher_service`:
+`PYTHONPATH=..:. python -m pytest tests`
+"""
+
+from pathlib import Path
+
+import pytest
+
+from common.show_models import ShowIdentifier
+from src.parser import FieldsScan, Parser, show_fields_complete
+
+
+FIXTURES = Path(__file__).parent.parent / "bench" / "fixtures"
+CHUNK = 64
+
+
+def streamed_prefix(data: bytes) -> bytes:
+    """
+    Начало `data`, на котором `FieldsScan` останавливает чтение
+    при поступлении по `CHUNK` байт
+    """
+    scan = FieldsScan()
+    body = bytearray()
+    for start in range(0, len(data), CHUNK):
+        body += data[start : start + CHUNK]
+        if scan(body):
+            return bytes(body)
+    return data
+
+
+@pytest.mark.parametrize(
+    "name, identifier",
+    [
+        ("film_435.html", ShowIdentifier(id=435, type="film")),
+        ("series_464963.html", ShowIdentifier(id=464963, type="series")),
+        ("film_258687.html", ShowIdentifier(id=258687, type="film")),
+    ],
+)
+def test_prefix_parses_as_full_page(name, identifier):
+    data = (FIXTURES / name).read_bytes()
+    prefix = streamed_prefix(data)
+    details = Parser.parse_show(data.decode(), identifier)
+    assert details is not None
+    assert Parser.parse_show(prefix.decode("utf-8", "ignore"), identifier) == details
+
+
+def test_later_variant_does_not_stop_reading():
+    data = (FIXTURES / "film_258687.html").read_bytes()
+    title = data.index(b'data-tid="75209b22"')
+    details = Parser.parse_show(data.decode(), ShowIdentifier(id=258687, type="film"))
+
+    assert details.title == "Интерстеллар"
+    # Все поля, кроме первого варианта названия, уже прочитаны
+    assert not show_fields_complete(data[:title])
+    assert show_fields_complete(data)
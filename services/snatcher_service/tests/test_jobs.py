@@ -0,0 +1,77 @@
+"""
+`JobManager`: фильмы/сериалы, не записанные в `Sink`, не дают задаче
+завершиться как DONE и отправляются заново при `resume`.
+Страницы отдает стенд `bench.standin` в том же процессе.\n
+Запуск из `services/snatcher_service`:
+`PYTHONPATH=..:. python -m pytest tests`
+"""
+
+import asyncio
+from typing import List
+
+from common.show_models import ShowModel
+from src.executor import ParseExecutor
+from src.jobs import CrawlJobSpec, CrawlJobStatus, JobManager
+from src.session import SessionConfig, SessionManager
+from src.sink import Sink, SinkKind
+from conftest import standin
+
+
+class FlakySink(Sink):
+    def __init__(self):
+        self.fail = True
+        self.written: List[int] = []
+
+    async def write(self, shows: List[ShowModel]) -> int:
+        if self.fail:
+            raise ConnectionError("db_service is down")
+        self.written += [show.identifier.id for show in shows]
+        return len(shows)
+
+
+class FlakyJobManager(JobManager):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sink = FlakySink()
+
+    def make_sink(self, name: str, kind: SinkKind) -> Sink:
+        return self.sink
+
+
+async def wait_finished(jm: JobManager, job_id: str) -> None:
+    while job_id in jm._tasks:
+        await asyncio.sleep(0.01)
+
+
+def test_unwritten_shows_fail_job_and_resume_resends(tmp_path, monkeypatch):
+    async def run():
+        async with standin(monkeypatch):
+            return await crawl(tmp_path)
+
+    async def crawl(tmp_path):
+        sm = SessionManager(SessionConfig.model_validate({"retry": {"attempts": 1}}))
+        jm = FlakyJobManager(
+            sm,
+            ParseExecutor.create(kind="inline"),
+            sink_dir=tmp_path / "sinks",
+            jobs_dir=tmp_path / "jobs",
+        )
+        try:
+            spec = CrawlJobSpec(page_from=1, page_to=1, flush_interval=0.01)
+            job = jm.submit(spec)
+            await wait_finished(jm, job.id)
+            failed = job.model_copy(deep=True)
+
+            jm.sink.fail = False
+            jm.resume(job.id)
+            await wait_finished(jm, job.id)
+            return failed, job, jm.sink.written
+        finally:
+            await sm.close_session()
+
+    failed, job, written = asyncio.run(run())
+    assert failed.status == CrawlJobStatus.FAILED
+    assert {sid.id for sid in failed.pending} == {435, 464963}
+    assert job.status == CrawlJobStatus.DONE
+    assert job.pending == set()
+    assert sorted(written) == [435, 464963]
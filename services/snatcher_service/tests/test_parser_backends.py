@@ -0,0 +1,96 @@
+"""
+Бэкенды разбора BeautifulSoup и lxml дают одинаковый результат
+на HTML-фикстурах `bench/fixtures`; страницы реального размера
+`bench/fixtures_full` (`bench.full_pages`) разбираются как их фикстуры.\n
+Запуск из `services/snatcher_service`:
+`PYTHONPATH=..:. python -m pytest tests`
+"""
+
+from pathlib import Path
+
+import pytest
+
+from bench.full_pages import render
+from bench.parse_bench import load_fixtures
+from common.show_models import ShowIdentifier
+from src.parser import Parser, ParserBackend
+
+
+FIXTURES = Path(__file__).parent.parent / "bench" / "fixtures"
+FULL_FIXTURES = FIXTURES.parent / "fixtures_full"
+JOBS = load_fixtures(FIXTURES)
+FULL_JOBS = load_fixtures(FULL_FIXTURES)
+
+
+def test_fixtures_present():
+    assert {func for func, _ in JOBS} == {Parser.parse_page, Parser.parse_show}
+
+
+@pytest.mark.parametrize(
+    "func, args", JOBS, ids=[f"{func.__name__}{args[1:]}" for func, args in JOBS]
+)
+def test_backends_equivalent(func, args):
+    results = [func(*args, backend=backend) for backend in ParserBackend]
+    assert all(result == results[0] for result in results)
+
+
+@pytest.mark.parametrize("backend", list(ParserBackend))
+def test_partial_report_equivalent(backend):
+    identifier = ShowIdentifier(id=326, type="film")
+    content = (FIXTURES / "film_326.html").read_text(encoding="UTF-8")
+
+    assert Parser.parse_show(content, identifier, backend=backend) is None
+    details, missing = Parser.parse_show_report(
+        content, identifier, allow_partial=True, backend=backend
+    )
+    assert details.title == "Побег из Шоушенка"
+    assert details.rating_count == 4000000
+    assert missing == ["SRating", "SDescription", "SGenreBox"]
+
+
+@pytest.mark.parametrize("backend", list(ParserBackend))
+def test_parse_show_fields(backend):
+    identifier = ShowIdentifier(id=435, type="film")
+    content = (FIXTURES / "film_435.html").read_text(encoding="UTF-8")
+
+    details = Parser.parse_show(content, identifier, backend=backend)
+    assert details.title == "Зеленая миля"
+    assert details.rating == 9.1
+    assert details.rating_count == 1004771
+    assert details.description.startswith("Пол Эджкомб — начальник блока смертников в")
+    assert "\n" not in details.description and "\xa0" not in details.description
+    assert details.genres == ["драма", "фэнтези", "криминал"]
+
+
+@pytest.mark.parametrize("backend", list(ParserBackend))
+def test_parse_page_skips_abnormal_box(backend):
+    content = (FIXTURES / "page_1.html").read_text(encoding="UTF-8")
+
+    assert Parser.parse_page(content, 1, backend=backend) == [
+        ShowIdentifier(id=435, type="film"),
+        ShowIdentifier(id=464963, type="series"),
+        ShowIdentifier(id=326, type="film"),
+    ]
+
+
+def test_full_pages_generated_from_fixtures():
+    names = sorted(file.name for file in FULL_FIXTURES.glob("*.html"))
+    assert names == sorted(file.name for file in FIXTURES.glob("*.html"))
+    for name in names:
+        page = (FULL_FIXTURES / name).read_text(encoding="UTF-8")
+        assert len(page.encode()) > 300 * 1024
+        content = (FIXTURES / name).read_text(encoding="UTF-8")
+        assert render(name, content, seed=0) == page
+
+
+@pytest.mark.parametrize("backend", list(ParserBackend))
+def test_full_pages_parse_as_fixtures(backend):
+    for (func, args), (_, full_args) in zip(JOBS, FULL_JOBS):
+        result = func(*args, backend=backend)
+        full_result = func(*full_args, backend=backend)
+        if func is Parser.parse_page:
+            # Сгенерированные карточки - после карточек фикстуры
+            assert full_result[: len(result)] == result
+            assert len(full_result) > len(result)
+        else:
+            assert full_result == result
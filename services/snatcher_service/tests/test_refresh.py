@@ -0,0 +1,70 @@
+"""
+`RefreshScheduler`: изменения, не записанные в `Sink`, отмечены
+в `SnatchIndex`, переживают перезапуск и пишутся пачками `batch_size`.
+Страницы отдает стенд `bench.standin` в том же процессе.\n
+Запуск из `services/snatcher_service`:
+`PYTHONPATH=..:. python -m pytest tests`
+"""
+
+import asyncio
+from typing import List
+
+from common.show_models import ShowDetails, ShowIdentifier, ShowModel
+from conftest import standin
+from src.index import SnatchIndex
+from src.refresh import RefreshConfig, RefreshScheduler
+from src.session import SessionConfig, SessionManager
+from src.sink import Sink
+
+
+SHOWS = [
+    ShowIdentifier(id=435, type="film"),
+    ShowIdentifier(id=464963, type="series"),
+]
+
+
+class BatchSink(Sink):
+    def __init__(self, fail: bool):
+        self.fail = fail
+        self.batches: List[List[int]] = []
+
+    async def write(self, shows: List[ShowModel]) -> int:
+        if self.fail:
+            raise ConnectionError("db_service is down")
+        self.batches.append([show.identifier.id for show in shows])
+        return len(shows)
+
+
+def test_unwritten_changes_survive_restart(tmp_path, monkeypatch):
+    config = RefreshConfig(min_interval=0, batch_size=1)
+    path = tmp_path / "index.db"
+
+    async def run():
+        async with standin(monkeypatch):
+            return await refresh()
+
+    async def refresh():
+        index = SnatchIndex(path)
+        outdated = ShowDetails(
+            title="old", rating=1.0, rating_count=1, description="", genres=[]
+        )
+        for identifier in SHOWS:
+            await index.record(identifier, outdated)
+        sm = SessionManager(SessionConfig.model_validate({"retry": {"attempts": 1}}))
+        try:
+            down = BatchSink(fail=True)
+            report = await RefreshScheduler(sm, index, sink=down, config=config).cycle()
+            # Перезапуск: новый индекс на том же файле
+            index.close()
+            index = SnatchIndex(path)
+            up = BatchSink(fail=False)
+            scheduler = RefreshScheduler(sm, index, sink=up, config=config)
+            return report, await scheduler.flush(), await scheduler.flush(), up
+        finally:
+            index.close()
+            await sm.close_session()
+
+    report, unwritten, again, sink = asyncio.run(run())
+    assert (report.changed, report.unwritten) == (2, 2)
+    assert (unwritten, again) == (0, 0)
+    assert sink.batches == [[435], [464963]]
@@ -0,0 +1,61 @@
+"""
+Потоковое чтение тела (`read_until`): оборванное на середине
+многобайтного символа тело декодируется без ошибки.\n
+Запуск из `services/snatcher_service`:
+`PYTHONPATH=..:. python -m pytest tests`
+"""
+
+import asyncio
+from typing import List
+
+import pytest
+
+from src.session import STREAM_CHECK_BYTES, decode_body, read_until
+
+
+class FakeContent:
+    def __init__(self, chunks: List[bytes]):
+        self.chunks = chunks
+        self.read = 0
+
+    async def iter_any(self):
+        for chunk in self.chunks:
+            self.read += 1
+            yield chunk
+
+    def at_eof(self) -> bool:
+        return self.read == len(self.chunks)
+
+
+class FakeResponse:
+    def __init__(self, chunks: List[bytes]):
+        self.content = FakeContent(chunks)
+        self.closed = False
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def test_read_until_cut_inside_character():
+    text = "Привет, мир! " * (STREAM_CHECK_BYTES // 10)
+    data = text.encode()
+    cut = STREAM_CHECK_BYTES + 1
+    # Следующий байт - продолжение символа: граница куска внутри символа
+    assert data[cut] & 0xC0 == 0x80
+    response = FakeResponse([data[:cut], data[cut:]])
+
+    body, truncated = asyncio.run(read_until(response, lambda body: True))
+
+    assert truncated and response.closed
+    assert len(body) == cut
+    with pytest.raises(UnicodeDecodeError):
+        body.decode("utf-8")
+    content = decode_body(body, "utf-8", truncated)
+    assert text.startswith(content)
+    assert len(content.encode()) == cut - 1
+
+
+def test_decode_complete_body_is_strict():
+    with pytest.raises(UnicodeDecodeError):
+        decode_body("Привет".encode()[:3], "utf-8")
+    assert decode_body("Привет".encode()[:3], "utf-8", truncated=True) == "П"
@@ -0,0 +1,56 @@
+"""
+`BatchWriter`: пачки не теряются при закрытии.\n
+Запуск из `services/snatcher_service`:
+`PYTHONPATH=..:. python -m pytest tests`
+"""
+
+import asyncio
+from typing import List
+
+from common.show_models import ShowModel
+from src.sink import BatchWriter, Sink
+
+
+def make_show(id: int) -> ShowModel:
+    return ShowModel.model_validate(
+        {
+            "id": id,
+            "type": "film",
+            "title": f"Фильм {id}",
+            "rating": 7.0,
+            "rating_count": 100,
+            "description": "Описание",
+            "genres": ["драма"],
+        }
+    )
+
+
+class SlowSink(Sink):
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.written: List[int] = []
+
+    async def write(self, shows: List[ShowModel]) -> int:
+        await self.release.wait()
+        self.written += [show.identifier.id for show in shows]
+        return len(shows)
+
+
+def test_close_while_timer_flush_waits_for_window():
+    async def run() -> List[int]:
+        sink = SlowSink()
+        writer = BatchWriter(sink, batch_size=10, flush_interval=0.01, max_in_flight=1)
+        await writer.put(make_show(1))
+        # Первая пачка занимает единственное место в окне
+        await writer.flush()
+        await writer.put(make_show(2))
+        # Таймер забирает вторую пачку и ждет окна
+        await asyncio.sleep(0.05)
+        assert writer._batch == []
+        closing = asyncio.create_task(writer.close())
+        await asyncio.sleep(0.01)
+        sink.release.set()
+        await closing
+        return sink.written
+
+    assert asyncio.run(run()) == [1, 2]